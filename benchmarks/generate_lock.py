@@ -0,0 +1,74 @@
+"""
+Per-call cost and peak memory of lock key generation for each digest,
+encoder and streaming mode.
+
+Run from the repository root:
+
+    python -m benchmarks.generate_lock
+"""
+
+import timeit
+import tracemalloc
+
+from celery_singleton import util
+
+PAYLOADS = {
+    "small": ([1, 2, 3], {"username": "bob", "force": False}),
+    "medium": (
+        [list(range(100))],
+        {"options": {"key{}".format(i): i for i in range(50)}},
+    ),
+    "large": (
+        [list(range(100000))],
+        {"nested": {"key{}".format(i): [i] * 10 for i in range(10000)}},
+    ),
+}
+NUMBER = {"small": 20000, "medium": 2000, "large": 5}
+
+
+def bench(payload, **options):
+    args, kwargs = PAYLOADS[payload]
+    number = NUMBER[payload]
+    total = min(
+        timeit.repeat(
+            lambda: util.generate_lock("bench.task", args, kwargs, **options),
+            number=number,
+            repeat=3,
+        )
+    )
+    tracemalloc.start()
+    util.generate_lock("bench.task", args, kwargs, **options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return total / number * 1e6, peak / 1024
+
+
+def main():
+    row = "{:<10} {:<8} {:<10} {:<8} {:>14} {:>14}"
+    print(
+        row.format("digest", "encoder", "streaming", "payload", "us/call", "peak KiB")
+    )
+    for payload in PAYLOADS:
+        for encoder in sorted(util.ENCODERS):
+            streaming_modes = [False]
+            if util.ENCODERS[encoder] in util.STREAMING_ENCODERS:
+                streaming_modes.append(True)
+            for streaming in streaming_modes:
+                for digest in sorted(util.DIGESTS):
+                    usec, peak = bench(
+                        payload, digest=digest, encoder=encoder, streaming=streaming
+                    )
+                    print(
+                        row.format(
+                            digest,
+                            encoder,
+                            str(streaming),
+                            payload,
+                            "{:.2f}".format(usec),
+                            "{:.1f}".format(peak),
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
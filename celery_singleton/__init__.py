@@ -1,4 +1,6 @@
 from .singleton import Singleton, clear_locks
+from .reaper import reap_locks
 from .exceptions import DuplicateTaskError
+from . import signals  # noqa: F401 connects the lease signal handlers
 
 __version__ = "0.3.1"
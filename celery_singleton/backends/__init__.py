@@ -1,26 +1,103 @@
-from .redis import RedisBackend
-from .base import BaseBackend
+import os
+import threading
+from weakref import WeakKeyDictionary
 
+from .redis import RedisBackend, broker_connection_pool
+from .memory import InMemoryBackend
+from .sqlite import SQLiteBackend
+from .base import BaseBackend, AsyncBaseBackend
 
-_backend = None
+
+# Backend instances of each app, keyed by backend class and URL
+_backends = WeakKeyDictionary()
+_backends_lock = threading.Lock()
 
 
 def get_backend(config):
     """
     Get the celery-singleton backend.
-    The backend instance is cached for subsequent calls.
+    The backend instance is cached per app, backend class and URL
+    for subsequent calls.
+
+    :param config: celery-singleton config of a celery app
+    :type config: celery_singleton.config.Config
+    """
+
+    def create():
+        kwargs = dict(config.backend_kwargs)
+        if config.backend_use_broker_pool:
+            kwargs.setdefault("connection_pool", broker_connection_pool(config.app))
+        return config.backend_class(config.backend_url, **kwargs)
+
+    return _get_or_create(config, config.backend_class, create)
+
 
-    :param app: celery instance
-    :type app: celery.Celery
+def get_async_backend(config):
     """
-    global _backend
-    if _backend:
-        return _backend
-    klass = config.backend_class
-    kwargs = config.backend_kwargs
+    Get the celery-singleton asyncio backend.
+    The backend instance is cached per app, backend class and URL
+    for subsequent calls.
+
+    Uses `AsyncRedisBackend` unless `singleton_async_backend_class`
+    is configured. It receives the same URL and kwargs as the sync backend.
+
+    :param config: celery-singleton config of a celery app
+    :type config: celery_singleton.config.Config
+    """
+    klass = config.async_backend_class
+    if klass is None:
+        # redis.asyncio requires redis-py 4.2+, so only import it when used
+        from .redis_async import AsyncRedisBackend as klass
+
+    def create():
+        return klass(config.backend_url, **config.backend_kwargs)
+
+    return _get_or_create(config, klass, create)
+
+
+def _get_or_create(config, klass, create):
     url = config.backend_url
-    _backend = klass(url, **kwargs)
-    return _backend
+    # Some backends, e.g. ShardedRedisBackend, take a list of URLs
+    key = (klass, tuple(url) if isinstance(url, list) else url)
+    with _backends_lock:
+        app_backends = _backends.setdefault(config.app, {})
+        backend = app_backends.get(key)
+        if backend is None:
+            backend = app_backends[key] = create()
+        return backend
+
+
+def clear_backend_cache():
+    """
+    Forget all cached backend instances, so the next `get_backend` call
+    creates a new one from the current config. Mostly useful in tests.
+    """
+    with _backends_lock:
+        _backends.clear()
+
+
+def _reset_after_fork():
+    global _backends_lock
+    # The lock may have been held by another thread of the parent
+    _backends_lock = threading.Lock()
+    for app_backends in list(_backends.values()):
+        for backend in app_backends.values():
+            reset = getattr(backend, "reset", None)
+            if reset is not None:
+                reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
-__all__ = ["RedisBackend", "BaseBackend", "get_backend"]
+__all__ = [
+    "RedisBackend",
+    "InMemoryBackend",
+    "SQLiteBackend",
+    "BaseBackend",
+    "AsyncBaseBackend",
+    "get_backend",
+    "get_async_backend",
+    "clear_backend_cache",
+]
@@ -1,5 +1,10 @@
 from abc import ABC, abstractmethod
 
+# Pending calls are stored next to their lock, under the lock's key
+# followed by this suffix
+PENDING_SUFFIX = ":pending"
+STARTED_SUFFIX = ":started"
+
 
 class BaseBackend(ABC):
     @abstractmethod
@@ -20,14 +25,213 @@ class BaseBackend(ABC):
         :rtype: `bool`
         """
 
+    def lock_or_get(self, lock, task_id, expiry=None):
+        """
+        Aquire the lock or return the task ID currently holding it.
+
+        Backends should override this with an atomic single round trip
+        operation. The default implementation falls back on `lock` and `get`.
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :param task_id: Task id associated with the lock
+        :type task_id: `str`
+        :param expiry: Lock's time to live in seconds
+        :type expiry: `int`
+        :return: `None` if the lock was aquired, otherwise the task ID
+            of the current lock holder
+        :rtype: `str` or `None`
+        """
+        while True:
+            if self.lock(lock, task_id, expiry=expiry):
+                return None
+            existing_task_id = self.get(lock)
+            if existing_task_id:
+                return existing_task_id
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        """
+        Aquire many locks at once, see `lock_or_get`
+
+        Locks are attempted in order, so when the same lock appears
+        more than once the later entries get the task ID of the first.
+        The default implementation calls `lock_or_get` for each lock.
+
+        :param locks: Lock/mutex strings
+        :type locks: `list`
+        :param task_ids: Task ids associated with each lock
+        :type task_ids: `list`
+        :param expiry: Time to live in seconds for every lock
+        :type expiry: `int`
+        :return: For each lock, `None` if it was aquired, otherwise
+            the task ID of the current lock holder
+        :rtype: `list`
+        """
+        return [
+            self.lock_or_get(lock, task_id, expiry=expiry)
+            for lock, task_id in zip(locks, task_ids)
+        ]
+
     @abstractmethod
-    def unlock(self, lock):
+    def unlock(self, lock, task_id=None):
         """
         Unlock the given lock
 
+        When a task ID is given the lock is only removed if that task
+        still holds it, checked and removed in one atomic operation.
+        This keeps a task whose lock expired from removing the lock
+        of a newer task.
+
         :param lock: Lock/mutext string to unlock
         :type lock: `str`
+        :param task_id: Task id expected to hold the lock
+        :type task_id: `str`
+        :return: `True` if the lock was removed, `False` if it was not
+            held (by the task)
+        :rtype: `bool`
+        """
+
+    def extend(self, lock, task_id, expiry=None):
+        """
+        Set a new time to live on a lock, if it is still held by the given task
+
+        Used to renew the leases of running tasks, backends that
+        don't implement it can't be used with `lease_timeout`.
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :param task_id: Task id expected to hold the lock
+        :type task_id: `str`
+        :param expiry: New time to live in seconds, `None` to never expire
+        :type expiry: `int`
+        :return: `True` if the lock is held by the task and was extended
+        :rtype: `bool`
+        """
+        raise NotImplementedError(
+            "{} does not support extending locks".format(type(self).__name__)
+        )
+
+    def set_pending(self, lock, payload, expiry=None):
+        """
+        Store the call to run once the given lock is released,
+        replacing any call stored before
+
+        Used by tasks in `debounce` mode, backends that don't
+        implement it can't be used with that mode.
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :param payload: Encoded task call
+        :type payload: `str`
+        :param expiry: Time to live in seconds, `None` to never expire
+        :type expiry: `int`
+        """
+        raise NotImplementedError(
+            "{} does not support pending calls".format(type(self).__name__)
+        )
+
+    def pop_pending(self, lock):
+        """
+        Remove and return the call stored with `set_pending`,
+        in one atomic operation
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :return: The stored payload, `None` if there is none
+        :rtype: `str` or `None`
+        """
+        raise NotImplementedError(
+            "{} does not support pending calls".format(type(self).__name__)
+        )
+
+    def lock_or_replace(self, lock, task_id, expiry=None):
+        """
+        Aquire the lock, taking it over when its current holder has not
+        started yet, in one atomic operation
+
+        Used by tasks in `replace` mode, backends that don't
+        implement it can't be used with that mode.
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :param task_id: Task id associated with the lock
+        :type task_id: `str`
+        :param expiry: Lock's time to live in seconds
+        :type expiry: `int`
+        :return: `(None, False)` if the lock was free, `(task_id, True)` with
+            the ID of the replaced holder, or `(task_id, False)` with the ID
+            of a holder that has started, in which case the lock is unchanged
+        :rtype: `tuple`
+        """
+        raise NotImplementedError(
+            "{} does not support replacing locks".format(type(self).__name__)
+        )
+
+    def mark_started(self, lock, task_id):
+        """
+        Mark the lock as held by a started task, so `lock_or_replace`
+        doesn't take it over, if the lock is still held by the given task
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :param task_id: Task id expected to hold the lock
+        :type task_id: `str`
+        :return: `False` if another task holds the lock, otherwise `True`
+        :rtype: `bool`
+        """
+        raise NotImplementedError(
+            "{} does not support replacing locks".format(type(self).__name__)
+        )
+
+    def unmark_started(self, lock, task_id):
+        """
+        Remove the mark set by `mark_started`, if set by the given task
+
+        :param lock: Lock/mutex string
+        :type lock: `str`
+        :param task_id: Task id that marked the lock
+        :type task_id: `str`
+        """
+        self.unlock(lock + STARTED_SUFFIX, task_id=task_id)
+
+    def acquire_slot(self, lock, task_id, limit, expiry=None):
+        """
+        Take one of `limit` slots of a counting semaphore, in one atomic
+        operation. Expired slots are freed first.
+
+        Used by tasks with `max_concurrency`, backends that don't
+        implement it can't be used with that option. Semaphores are
+        stored apart from locks, a key is used for one or the other.
+
+        :param lock: Semaphore key
+        :type lock: `str`
+        :param task_id: Task id taking the slot
+        :type task_id: `str`
+        :param limit: Number of slots
+        :type limit: `int`
+        :param expiry: Slot's time to live in seconds, `None` to never expire
+        :type expiry: `int`
+        :return: `None` if a slot was taken, otherwise the task ID of the
+            holder whose slot expires first
+        :rtype: `str` or `None`
+        """
+        raise NotImplementedError(
+            "{} does not support semaphores".format(type(self).__name__)
+        )
+
+    def release_slot(self, lock, task_id=None):
+        """
+        Free the semaphore slot held by the given task,
+        or all slots when no task ID is given
+
+        :param lock: Semaphore key
+        :type lock: `str`
+        :param task_id: Task id holding the slot
+        :type task_id: `str`
         """
+        raise NotImplementedError(
+            "{} does not support semaphores".format(type(self).__name__)
+        )
 
     @abstractmethod
     def get(self, lock):
@@ -40,6 +244,17 @@ class BaseBackend(ABC):
         :rtype: `str` or `None`
         """
 
+    def get_many(self, locks):
+        """
+        Get task IDs for many locks at once
+
+        :param locks: Lock/mutex strings
+        :type locks: `list`
+        :return: A task ID or `None` for each lock
+        :rtype: `list`
+        """
+        return [self.get(lock) for lock in locks]
+
     @abstractmethod
     def clear(self, key_prefix):
         """
@@ -47,5 +262,121 @@ class BaseBackend(ABC):
 
         :param key_prefix: Prefix of keys to clear
         :type key_prefix: str
-        :return: `None`
+        :return: Number of locks removed
+        :rtype: `int`
+        """
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        """
+        Iterate over the locks stored under given key_prefix in batches,
+        used by `celery_singleton.reap_locks`
+
+        :param key_prefix: Prefix of keys to iterate over
+        :type key_prefix: `str`
+        :param batch_size: Approximate number of locks in each batch
+        :type batch_size: `int`
+        :return: Lists of `(lock, task_id)` pairs
+        :rtype: iterator
+        """
+        raise NotImplementedError(
+            "{} does not support iterating over locks".format(type(self).__name__)
+        )
+
+    def reset(self):
+        """
+        Drop connections inherited from the parent process.
+        Called in child processes after `fork()`, the default does nothing.
+        """
+
+
+class AsyncBaseBackend(ABC):
+    """
+    Backend with the same semantics as `BaseBackend`
+    for use from asyncio code, see `Singleton.apply_async_singleton`
+    """
+
+    @abstractmethod
+    async def lock(self, lock, task_id, expiry=None):
+        """
+        Store a lock for given lock value and task ID, see `BaseBackend.lock`
+        """
+
+    async def lock_or_get(self, lock, task_id, expiry=None):
+        """
+        Aquire the lock or return the task ID currently holding it,
+        see `BaseBackend.lock_or_get`
+        """
+        while True:
+            if await self.lock(lock, task_id, expiry=expiry):
+                return None
+            existing_task_id = await self.get(lock)
+            if existing_task_id:
+                return existing_task_id
+
+    @abstractmethod
+    async def unlock(self, lock, task_id=None):
+        """
+        Unlock the given lock, see `BaseBackend.unlock`
+        """
+
+    async def set_pending(self, lock, payload, expiry=None):
+        """
+        Store the call to run once the given lock is released,
+        see `BaseBackend.set_pending`
+        """
+        raise NotImplementedError(
+            "{} does not support pending calls".format(type(self).__name__)
+        )
+
+    async def pop_pending(self, lock):
+        """
+        Remove and return the call stored for the given lock,
+        see `BaseBackend.pop_pending`
+        """
+        raise NotImplementedError(
+            "{} does not support pending calls".format(type(self).__name__)
+        )
+
+    async def lock_or_replace(self, lock, task_id, expiry=None):
+        """
+        Aquire the lock, taking it over when its current holder has not
+        started yet, see `BaseBackend.lock_or_replace`
+        """
+        raise NotImplementedError(
+            "{} does not support replacing locks".format(type(self).__name__)
+        )
+
+    async def acquire_slot(self, lock, task_id, limit, expiry=None):
+        """
+        Take one of `limit` slots of a counting semaphore,
+        see `BaseBackend.acquire_slot`
+        """
+        raise NotImplementedError(
+            "{} does not support semaphores".format(type(self).__name__)
+        )
+
+    async def release_slot(self, lock, task_id=None):
+        """
+        Free the semaphore slot held by the given task,
+        see `BaseBackend.release_slot`
+        """
+        raise NotImplementedError(
+            "{} does not support semaphores".format(type(self).__name__)
+        )
+
+    @abstractmethod
+    async def get(self, lock):
+        """
+        Get task ID for given lock, see `BaseBackend.get`
+        """
+
+    @abstractmethod
+    async def clear(self, key_prefix):
+        """
+        Clear all locks stored under given key_prefix, see `BaseBackend.clear`
+        """
+
+    def reset(self):
+        """
+        Drop connections inherited from the parent process, see `BaseBackend.reset`
         """
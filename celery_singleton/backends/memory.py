@@ -0,0 +1,206 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from .base import PENDING_SUFFIX, STARTED_SUFFIX, BaseBackend
+
+
+class InMemoryBackend(BaseBackend):
+    """
+    Thread-safe backend storing locks in process memory.
+
+    Locks are not shared between processes, so this is only suitable for
+    tests and deployments where tasks are queued and run in one process.
+    Expiry is handled with a min-heap of expiry times that is purged on
+    access, and lock keys are kept sorted so `clear` only visits keys
+    under the given prefix.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        args and kwargs, such as the backend URL, are accepted and ignored
+        """
+        self._locks = {}  # lock -> (task_id, expires_at or None)
+        self._keys = []  # sorted lock keys
+        self._expiries = []  # heap of (expires_at, lock)
+        self._slots = {}  # semaphore -> {task_id: expires_at or None}
+        self._mutex = threading.Lock()
+
+    def lock(self, lock, task_id, expiry=None):
+        with self._mutex:
+            self._purge()
+            if lock in self._locks:
+                return False
+            self._set(lock, task_id, expiry)
+            return True
+
+    def lock_or_get(self, lock, task_id, expiry=None):
+        with self._mutex:
+            self._purge()
+            return self._lock_or_get(lock, task_id, expiry)
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        with self._mutex:
+            self._purge()
+            return [
+                self._lock_or_get(lock, task_id, expiry)
+                for lock, task_id in zip(locks, task_ids)
+            ]
+
+    def unlock(self, lock, task_id=None):
+        with self._mutex:
+            self._purge()
+            entry = self._locks.get(lock)
+            if entry and (task_id is None or entry[0] == task_id):
+                self._remove(lock)
+                return True
+            return False
+
+    def extend(self, lock, task_id, expiry=None):
+        with self._mutex:
+            self._purge()
+            entry = self._locks.get(lock)
+            if not entry or entry[0] != task_id:
+                return False
+            self._set(lock, task_id, expiry)
+            started = self._locks.get(lock + STARTED_SUFFIX)
+            if started and started[0] == task_id:
+                self._set(lock + STARTED_SUFFIX, task_id, expiry)
+            return True
+
+    def set_pending(self, lock, payload, expiry=None):
+        with self._mutex:
+            self._purge()
+            self._set(lock + PENDING_SUFFIX, payload, expiry)
+
+    def pop_pending(self, lock):
+        with self._mutex:
+            self._purge()
+            entry = self._locks.get(lock + PENDING_SUFFIX)
+            if not entry:
+                return None
+            self._remove(lock + PENDING_SUFFIX)
+            return entry[0]
+
+    def lock_or_replace(self, lock, task_id, expiry=None):
+        with self._mutex:
+            self._purge()
+            entry = self._locks.get(lock)
+            marker = self._locks.get(lock + STARTED_SUFFIX)
+            if entry and marker and marker[0] == entry[0]:
+                return entry[0], False
+            self._set(lock, task_id, expiry)
+            if marker:
+                self._remove(lock + STARTED_SUFFIX)
+            return (entry[0], True) if entry else (None, False)
+
+    def mark_started(self, lock, task_id):
+        with self._mutex:
+            self._purge()
+            entry = self._locks.get(lock)
+            if not entry:
+                return True
+            if entry[0] != task_id:
+                return False
+            # The mark expires with the lock
+            expiry = entry[1] - time.monotonic() if entry[1] is not None else None
+            self._set(lock + STARTED_SUFFIX, task_id, expiry)
+            return True
+
+    def acquire_slot(self, lock, task_id, limit, expiry=None):
+        now = time.monotonic()
+        with self._mutex:
+            slots = self._slots.setdefault(lock, {})
+            for holder, expires_at in list(slots.items()):
+                if expires_at is not None and expires_at <= now:
+                    del slots[holder]
+            if task_id not in slots and len(slots) >= limit:
+                # Slots without expiry sort last
+                return min(
+                    slots,
+                    key=lambda holder: (slots[holder] is None, slots[holder] or 0),
+                )
+            slots[task_id] = now + expiry if expiry is not None else None
+            return None
+
+    def release_slot(self, lock, task_id=None):
+        with self._mutex:
+            if task_id is None:
+                self._slots.pop(lock, None)
+                return
+            slots = self._slots.get(lock, {})
+            slots.pop(task_id, None)
+            if not slots:
+                self._slots.pop(lock, None)
+
+    def get(self, lock):
+        with self._mutex:
+            self._purge()
+            entry = self._locks.get(lock)
+            return entry[0] if entry else None
+
+    def get_many(self, locks):
+        with self._mutex:
+            self._purge()
+            entries = [self._locks.get(lock) for lock in locks]
+            return [entry[0] if entry else None for entry in entries]
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        with self._mutex:
+            self._purge()
+            start = end = bisect_left(self._keys, key_prefix)
+            while end < len(self._keys) and self._keys[end].startswith(key_prefix):
+                end += 1
+            locks = [(lock, self._locks[lock][0]) for lock in self._keys[start:end]]
+        for i in range(0, len(locks), batch_size):
+            yield locks[i : i + batch_size]
+
+    def clear(self, key_prefix):
+        with self._mutex:
+            semaphores = [lock for lock in self._slots if lock.startswith(key_prefix)]
+            for lock in semaphores:
+                del self._slots[lock]
+            start = end = bisect_left(self._keys, key_prefix)
+            while end < len(self._keys) and self._keys[end].startswith(key_prefix):
+                del self._locks[self._keys[end]]
+                end += 1
+            del self._keys[start:end]
+            return end - start + len(semaphores)
+
+    def _lock_or_get(self, lock, task_id, expiry):
+        entry = self._locks.get(lock)
+        if entry:
+            return entry[0]
+        self._set(lock, task_id, expiry)
+        return None
+
+    def _set(self, lock, task_id, expiry):
+        expires_at = time.monotonic() + expiry if expiry is not None else None
+        if lock not in self._locks:
+            insort(self._keys, lock)
+        self._locks[lock] = (task_id, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiries, (expires_at, lock))
+
+    def _remove(self, lock):
+        del self._locks[lock]
+        del self._keys[bisect_left(self._keys, lock)]
+
+    def _purge(self):
+        now = time.monotonic()
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            expires_at, lock = heapq.heappop(expiries)
+            entry = self._locks.get(lock)
+            # Skip heap entries of locks that were since released or replaced
+            if entry and entry[1] == expires_at:
+                self._remove(lock)
+        if len(expiries) > 2 * len(self._locks) + 64:
+            # Drop stale entries of released locks so the heap stays bounded
+            self._expiries = [
+                (entry[1], lock)
+                for lock, entry in self._locks.items()
+                if entry[1] is not None
+            ]
+            heapq.heapify(self._expiries)
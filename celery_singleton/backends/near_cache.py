@@ -0,0 +1,262 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from redis.exceptions import TimeoutError
+
+from ..config import import_class
+from .base import BaseBackend
+from .redis import _decode
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class NearCacheBackend(BaseBackend):
+    """
+    Backend wrapping another backend with a process local cache of held locks.
+
+    Once a lock is known to be held, by a lock attempt of this process or
+    a lookup, further attempts on it are answered from memory until the
+    cache entry expires after `ttl` seconds or the lock's own expiry.
+    Between the lock being released and the entry expiring, duplicates
+    are reported for the previous holder, so `ttl` bounds how stale the
+    cache can be.
+
+    With `tracking` enabled, redis notifies the cache of changed lock keys
+    through server assisted client side caching (`CLIENT TRACKING` in
+    broadcasting mode), so entries are dropped as soon as a lock is
+    released. `ttl` still applies when notifications are lost.
+    """
+
+    def __init__(
+        self,
+        *args,
+        backend_class="celery_singleton.backends.redis.RedisBackend",
+        ttl=1.0,
+        max_size=10000,
+        tracking=False,
+        tracking_prefixes=(),
+        **kwargs
+    ):
+        """
+        args and kwargs are forwarded to the wrapped backend
+
+        :param backend_class: Wrapped backend class, as import path or class
+        :param ttl: Seconds a held lock is cached
+        :param max_size: Number of locks cached, least recently used
+            locks are dropped first
+        :param tracking: Drop cached locks when redis reports them changed,
+            requires a redis backend and redis 6 or later
+        :param tracking_prefixes: Key prefixes redis reports changes for,
+            e.g. the `singleton_key_prefix`. All keys when empty
+        """
+        self.backend = import_class(backend_class)(*args, **kwargs)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.tracking = tracking
+        self.tracking_prefixes = list(tracking_prefixes)
+        self._cache = OrderedDict()  # lock -> (task_id, expires_at)
+        self._mutex = threading.Lock()
+        self._tracker = None
+        self._tracker_pid = None
+
+    def lock(self, lock, task_id, expiry=None):
+        if self._cached(lock) is not None:
+            return False
+        aquired = self.backend.lock(lock, task_id, expiry=expiry)
+        if aquired:
+            self._remember(lock, task_id, expiry)
+        return aquired
+
+    def lock_or_get(self, lock, task_id, expiry=None):
+        existing_task_id = self._cached(lock)
+        if existing_task_id is not None:
+            return existing_task_id
+        existing_task_id = self.backend.lock_or_get(lock, task_id, expiry=expiry)
+        self._remember(lock, existing_task_id or task_id, expiry)
+        return existing_task_id
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        results = [self._cached(lock) for lock in locks]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fetched = self.backend.lock_many(
+                [locks[i] for i in missing], [task_ids[i] for i in missing], expiry
+            )
+            for i, existing_task_id in zip(missing, fetched):
+                results[i] = existing_task_id
+                self._remember(locks[i], existing_task_id or task_ids[i], expiry)
+        return results
+
+    def unlock(self, lock, task_id=None):
+        self._forget(lock)
+        return self.backend.unlock(lock, task_id=task_id)
+
+    def extend(self, lock, task_id, expiry=None):
+        self._forget(lock)
+        return self.backend.extend(lock, task_id, expiry=expiry)
+
+    def set_pending(self, lock, payload, expiry=None):
+        # The lock is checked right after, a stale holder would strand the call
+        self._forget(lock)
+        self.backend.set_pending(lock, payload, expiry=expiry)
+
+    def pop_pending(self, lock):
+        return self.backend.pop_pending(lock)
+
+    def lock_or_replace(self, lock, task_id, expiry=None):
+        self._forget(lock)
+        return self.backend.lock_or_replace(lock, task_id, expiry=expiry)
+
+    def mark_started(self, lock, task_id):
+        return self.backend.mark_started(lock, task_id)
+
+    def unmark_started(self, lock, task_id):
+        self.backend.unmark_started(lock, task_id)
+
+    def acquire_slot(self, lock, task_id, limit, expiry=None):
+        return self.backend.acquire_slot(lock, task_id, limit, expiry=expiry)
+
+    def release_slot(self, lock, task_id=None):
+        self.backend.release_slot(lock, task_id=task_id)
+
+    def get(self, lock):
+        task_id = self._cached(lock)
+        if task_id is None:
+            task_id = self.backend.get(lock)
+            if task_id is not None:
+                self._remember(lock, task_id)
+        return task_id
+
+    def get_many(self, locks):
+        results = [self._cached(lock) for lock in locks]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fetched = self.backend.get_many([locks[i] for i in missing])
+            for i, task_id in zip(missing, fetched):
+                results[i] = task_id
+                if task_id is not None:
+                    self._remember(locks[i], task_id)
+        return results
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        return self.backend.iter_locks(key_prefix, batch_size=batch_size)
+
+    def clear(self, key_prefix):
+        self.invalidate()
+        return self.backend.clear(key_prefix)
+
+    def reset(self):
+        # The tracking thread of the parent doesn't exist after fork
+        self._tracker = None
+        self._tracker_pid = None
+        self._mutex = threading.Lock()
+        self._cache = OrderedDict()
+        self.backend.reset()
+
+    def invalidate(self, locks=None):
+        """
+        Drop the given locks from the cache, or all locks when `None`
+        """
+        with self._mutex:
+            if locks is None:
+                self._cache.clear()
+            else:
+                for lock in locks:
+                    self._cache.pop(lock, None)
+
+    def _cached(self, lock):
+        self._ensure_tracking()
+        with self._mutex:
+            entry = self._cache.get(lock)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._cache[lock]
+                return None
+            self._cache.move_to_end(lock)
+            return entry[0]
+
+    def _remember(self, lock, task_id, expiry=None):
+        ttl = self.ttl if expiry is None else min(self.ttl, expiry)
+        with self._mutex:
+            self._cache[lock] = (task_id, time.monotonic() + ttl)
+            self._cache.move_to_end(lock)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, lock):
+        with self._mutex:
+            self._cache.pop(lock, None)
+
+    def _ensure_tracking(self):
+        if not self.tracking or self._tracker_pid == os.getpid():
+            return
+        self._tracker_pid = os.getpid()
+        try:
+            self._tracker = self._start_tracking()
+        except Exception:
+            logger.exception(
+                "Failed to enable redis client tracking, cached locks expire after %ss",
+                self.ttl,
+            )
+
+    def _start_tracking(self):
+        pool = self.backend.redis.connection_pool
+        # Invalidation messages are published to a subscribed connection,
+        # while a second connection holds the tracking state
+        listener = pool.make_connection()
+        listener.send_command("CLIENT", "ID")
+        listener_id = listener.read_response()
+        listener.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+        listener.read_response()
+        prefixes = []
+        for prefix in self.tracking_prefixes:
+            prefixes += ["PREFIX", prefix]
+        tracker = pool.make_connection()
+        try:
+            tracker.send_command(
+                "CLIENT", "TRACKING", "ON", "REDIRECT", listener_id, "BCAST", *prefixes
+            )
+            tracker.read_response()
+        except Exception:
+            listener.disconnect()
+            tracker.disconnect()
+            raise
+        threading.Thread(
+            target=self._listen,
+            args=(listener,),
+            name="celery-singleton-tracking",
+            daemon=True,
+        ).start()
+        return listener, tracker
+
+    def _listen(self, listener):
+        try:
+            while True:
+                try:
+                    message = listener.read_response()
+                except TimeoutError:
+                    continue
+                if _decode(message[0]) == "message":
+                    self._on_invalidate(message[2])
+        except Exception:
+            logger.warning(
+                "Lost redis client tracking connection, cached locks expire after %ss",
+                self.ttl,
+                exc_info=True,
+            )
+        # Locks may have changed unnoticed, tracking is enabled again on next use
+        self.invalidate()
+        self._tracker_pid = None
+
+    def _on_invalidate(self, keys):
+        if keys is None:
+            # Sent when the database is flushed
+            self.invalidate()
+        else:
+            self.invalidate([_decode(key) for key in keys])
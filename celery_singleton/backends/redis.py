@@ -1,29 +1,272 @@
-from redis import Redis
+from redis import ConnectionPool, Redis
 
-from .base import BaseBackend
+from .base import PENDING_SUFFIX, STARTED_SUFFIX, BaseBackend
+
+
+# Returns the current holder's task ID, or sets the lock and returns nil
+LOCK_OR_GET_SCRIPT = """
+local existing = redis.call('GET', KEYS[1])
+if existing then
+    return existing
+end
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+# Deletes the lock if it is held by the task
+UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Sets a new TTL in milliseconds, or removes it, if the lock is held by the task
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] ~= '' then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+else
+    redis.call('PERSIST', KEYS[1])
+end
+return 1
+"""
+
+# Deletes a key and returns its value
+POP_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('DEL', KEYS[1])
+end
+return value
+"""
+
+# Sets the lock unless its holder has marked it started (KEYS[2]).
+# Returns nil when the lock was free, otherwise the previous holder's
+# task ID and whether it was replaced
+LOCK_OR_REPLACE_SCRIPT = """
+local existing = redis.call('GET', KEYS[1])
+if existing and redis.call('GET', KEYS[2]) == existing then
+    return {existing, 0}
+end
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('DEL', KEYS[2])
+if existing then
+    return {existing, 1}
+end
+return false
+"""
+
+# Marks the lock started (KEYS[2]) if it is held by the task, the mark
+# expires with the lock. Returns 0 if the lock is held by another task
+MARK_STARTED_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if not holder then
+    return 1
+end
+if holder ~= ARGV[1] then
+    return 0
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    redis.call('SET', KEYS[2], ARGV[1], 'PX', ttl)
+else
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+# Takes a slot of a semaphore stored as a sorted set of task IDs scored by
+# their expiry in milliseconds of server time. Returns nil when a slot was
+# taken, otherwise the holder whose slot expires first. The key lives as
+# long as its longest lived slot.
+ACQUIRE_SLOT_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local count = redis.call('ZCARD', KEYS[1])
+local held = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not held and count >= tonumber(ARGV[2]) then
+    return redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+end
+if ARGV[3] == '' then
+    redis.call('ZADD', KEYS[1], '+inf', ARGV[1])
+    redis.call('PERSIST', KEYS[1])
+    return false
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+local ttl = redis.call('PTTL', KEYS[1])
+if count == 0 or (ttl >= 0 and ttl < tonumber(ARGV[3])) then
+    redis.call('PEXPIRE', KEYS[1], ARGV[3])
+end
+return false
+"""
+
+
+def broker_connection_pool(app):
+    """
+    Get the redis connection pool of a celery app's broker connection
+
+    :param app: Celery app using a redis broker
+    :raises ValueError: When the broker transport is not redis
+    """
+    with app.producer_or_acquire() as producer:
+        pool = getattr(producer.channel, "pool", None)
+    if not isinstance(pool, ConnectionPool):
+        raise ValueError(
+            "singleton_backend_use_broker_pool requires a redis broker, got {!r}".format(
+                app.conf.broker_url
+            )
+        )
+    return pool
+
+
+def _decode(value):
+    # Responses are bytes when the connection pool is shared with kombu
+    return value.decode() if isinstance(value, bytes) else value
 
 
 class RedisBackend(BaseBackend):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, scan_count=1000, connection_pool=None, **kwargs):
         """
-        args and kwargs are forwarded to redis.from_url
+        args and kwargs are forwarded to redis.from_url, e.g.
+        `max_connections`, `socket_timeout` and `socket_connect_timeout`
+        to size the connection pool and bound network calls.
+
+        :param scan_count: Number of keys `clear` asks for in each `SCAN` batch
+        :param connection_pool: Use this existing `redis.ConnectionPool`
+            instead of creating one from the URL
         """
-        self.redis = Redis.from_url(*args, decode_responses=True, **kwargs)
+        self.scan_count = scan_count
+        if connection_pool is not None:
+            self.redis = Redis(connection_pool=connection_pool)
+        else:
+            self.redis = Redis.from_url(*args, decode_responses=True, **kwargs)
+        self._lock_or_get = self.redis.register_script(LOCK_OR_GET_SCRIPT)
+        self._extend = self.redis.register_script(EXTEND_SCRIPT)
+        self._unlock = self.redis.register_script(UNLOCK_SCRIPT)
+        self._pop = self.redis.register_script(POP_SCRIPT)
+        self._lock_or_replace = self.redis.register_script(LOCK_OR_REPLACE_SCRIPT)
+        self._mark_started = self.redis.register_script(MARK_STARTED_SCRIPT)
+        self._acquire_slot = self.redis.register_script(ACQUIRE_SLOT_SCRIPT)
+
+    def reset(self):
+        self.redis.connection_pool.reset()
 
     def lock(self, lock, task_id, expiry=None):
         return not not self.redis.set(lock, task_id, nx=True, ex=expiry)
 
-    def unlock(self, lock):
-        self.redis.delete(lock)
+    def lock_or_get(self, lock, task_id, expiry=None):
+        return _decode(
+            self._lock_or_get(
+                keys=[lock], args=[task_id, expiry if expiry is not None else ""]
+            )
+        )
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        pipe = self.redis.pipeline(transaction=False)
+        for lock, task_id in zip(locks, task_ids):
+            self._lock_or_get(
+                keys=[lock],
+                args=[task_id, expiry if expiry is not None else ""],
+                client=pipe,
+            )
+        return [_decode(task_id) for task_id in pipe.execute()]
+
+    def unlock(self, lock, task_id=None):
+        if task_id is None:
+            return bool(self.redis.delete(lock))
+        return bool(self._unlock(keys=[lock], args=[task_id]))
+
+    def extend(self, lock, task_id, expiry=None):
+        # The started mark of replace mode, if any, keeps expiring with the lock
+        args = [task_id, int(expiry * 1000) if expiry is not None else ""]
+        pipe = self.redis.pipeline(transaction=False)
+        self._extend(keys=[lock], args=args, client=pipe)
+        self._extend(keys=[lock + STARTED_SUFFIX], args=args, client=pipe)
+        return bool(pipe.execute()[0])
+
+    def set_pending(self, lock, payload, expiry=None):
+        self.redis.set(lock + PENDING_SUFFIX, payload, ex=expiry)
+
+    def pop_pending(self, lock):
+        return _decode(self._pop(keys=[lock + PENDING_SUFFIX]))
+
+    def lock_or_replace(self, lock, task_id, expiry=None):
+        result = self._lock_or_replace(
+            keys=[lock, lock + STARTED_SUFFIX],
+            args=[task_id, expiry if expiry is not None else ""],
+        )
+        if result is None:
+            return None, False
+        return _decode(result[0]), bool(result[1])
+
+    def mark_started(self, lock, task_id):
+        return bool(
+            self._mark_started(keys=[lock, lock + STARTED_SUFFIX], args=[task_id])
+        )
+
+    def acquire_slot(self, lock, task_id, limit, expiry=None):
+        return _decode(
+            self._acquire_slot(
+                keys=[lock],
+                args=[task_id, limit, int(expiry * 1000) if expiry is not None else ""],
+            )
+        )
+
+    def release_slot(self, lock, task_id=None):
+        if task_id is None:
+            self.redis.delete(lock)
+        else:
+            self.redis.zrem(lock, task_id)
 
     def get(self, lock):
-        return self.redis.get(lock)
+        return _decode(self.redis.get(lock))
+
+    def get_many(self, locks):
+        if not locks:
+            return []
+        return [_decode(task_id) for task_id in self.redis.mget(locks)]
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        cursor = None
+        while cursor != 0:
+            cursor, keys = self.redis.scan(
+                cursor=cursor or 0, match=key_prefix + "*", count=batch_size
+            )
+            if keys:
+                keys = [_decode(key) for key in keys]
+                yield [
+                    (key, task_id)
+                    for key, task_id in zip(keys, self.get_many(keys))
+                    if task_id is not None
+                ]
 
     def clear(self, key_prefix):
-        cursor = 0
-        while True:
-            cursor, keys = self.redis.scan(cursor=cursor, match=key_prefix + "*")
-            for k in keys:
-                self.redis.delete(k)
-            if cursor == 0:
-                break
+        match = key_prefix + "*"
+        removed = 0
+        cursor, keys = self.redis.scan(cursor=0, match=match, count=self.scan_count)
+        while cursor != 0:
+            # Unlink the current batch and fetch the next in one round trip
+            pipe = self.redis.pipeline(transaction=False)
+            if keys:
+                pipe.unlink(*keys)
+            pipe.scan(cursor=cursor, match=match, count=self.scan_count)
+            *unlinked, (cursor, keys) = pipe.execute()
+            removed += sum(unlinked)
+        if keys:
+            removed += self.redis.unlink(*keys)
+        return removed
@@ -0,0 +1,89 @@
+from redis.asyncio import Redis
+
+from .base import PENDING_SUFFIX, STARTED_SUFFIX, AsyncBaseBackend
+from .redis import (
+    ACQUIRE_SLOT_SCRIPT,
+    LOCK_OR_GET_SCRIPT,
+    LOCK_OR_REPLACE_SCRIPT,
+    POP_SCRIPT,
+    UNLOCK_SCRIPT,
+)
+
+
+class AsyncRedisBackend(AsyncBaseBackend):
+    def __init__(self, *args, scan_count=1000, **kwargs):
+        """
+        args and kwargs are forwarded to redis.asyncio.from_url
+
+        :param scan_count: Number of keys `clear` asks for in each `SCAN` batch
+        """
+        self.scan_count = scan_count
+        self.redis = Redis.from_url(*args, decode_responses=True, **kwargs)
+        self._lock_or_get = self.redis.register_script(LOCK_OR_GET_SCRIPT)
+        self._unlock = self.redis.register_script(UNLOCK_SCRIPT)
+        self._pop = self.redis.register_script(POP_SCRIPT)
+        self._lock_or_replace = self.redis.register_script(LOCK_OR_REPLACE_SCRIPT)
+        self._acquire_slot = self.redis.register_script(ACQUIRE_SLOT_SCRIPT)
+
+    def reset(self):
+        self.redis.connection_pool.reset()
+
+    async def lock(self, lock, task_id, expiry=None):
+        return not not await self.redis.set(lock, task_id, nx=True, ex=expiry)
+
+    async def lock_or_get(self, lock, task_id, expiry=None):
+        return await self._lock_or_get(
+            keys=[lock], args=[task_id, expiry if expiry is not None else ""]
+        )
+
+    async def unlock(self, lock, task_id=None):
+        if task_id is None:
+            return bool(await self.redis.delete(lock))
+        return bool(await self._unlock(keys=[lock], args=[task_id]))
+
+    async def set_pending(self, lock, payload, expiry=None):
+        await self.redis.set(lock + PENDING_SUFFIX, payload, ex=expiry)
+
+    async def pop_pending(self, lock):
+        return await self._pop(keys=[lock + PENDING_SUFFIX])
+
+    async def lock_or_replace(self, lock, task_id, expiry=None):
+        result = await self._lock_or_replace(
+            keys=[lock, lock + STARTED_SUFFIX],
+            args=[task_id, expiry if expiry is not None else ""],
+        )
+        if result is None:
+            return None, False
+        return result[0], bool(result[1])
+
+    async def acquire_slot(self, lock, task_id, limit, expiry=None):
+        return await self._acquire_slot(
+            keys=[lock],
+            args=[task_id, limit, int(expiry * 1000) if expiry is not None else ""],
+        )
+
+    async def release_slot(self, lock, task_id=None):
+        if task_id is None:
+            await self.redis.delete(lock)
+        else:
+            await self.redis.zrem(lock, task_id)
+
+    async def get(self, lock):
+        return await self.redis.get(lock)
+
+    async def clear(self, key_prefix):
+        match = key_prefix + "*"
+        removed = 0
+        cursor, keys = await self.redis.scan(
+            cursor=0, match=match, count=self.scan_count
+        )
+        while cursor != 0:
+            pipe = self.redis.pipeline(transaction=False)
+            if keys:
+                pipe.unlink(*keys)
+            pipe.scan(cursor=cursor, match=match, count=self.scan_count)
+            *unlinked, (cursor, keys) = await pipe.execute()
+            removed += sum(unlinked)
+        if keys:
+            removed += await self.redis.unlink(*keys)
+        return removed
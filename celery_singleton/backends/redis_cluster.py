@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from redis.cluster import RedisCluster
+
+from .base import STARTED_SUFFIX
+from .redis import (
+    ACQUIRE_SLOT_SCRIPT,
+    EXTEND_SCRIPT,
+    LOCK_OR_GET_SCRIPT,
+    LOCK_OR_REPLACE_SCRIPT,
+    MARK_STARTED_SCRIPT,
+    POP_SCRIPT,
+    UNLOCK_SCRIPT,
+    RedisBackend,
+    _decode,
+)
+
+
+class RedisClusterBackend(RedisBackend):
+    """
+    Backend storing locks in a Redis Cluster.
+
+    Locks are spread over the cluster's slots by key. With the `hash_tag`
+    key layout all locks of a task share a slot, so `lock_many` for one
+    task is served by a single node. `clear` scans every primary in parallel.
+    """
+
+    def __init__(self, *args, scan_count=1000, max_workers=None, **kwargs):
+        """
+        args and kwargs are forwarded to redis.cluster.RedisCluster.from_url
+
+        :param scan_count: Number of keys `clear` asks for in each `SCAN` batch
+        :param max_workers: Number of primaries `clear` scans at once,
+            defaults to all of them
+        """
+        self.scan_count = scan_count
+        self.max_workers = max_workers
+        self.redis = RedisCluster.from_url(*args, decode_responses=True, **kwargs)
+        self._lock_or_get = self.redis.register_script(LOCK_OR_GET_SCRIPT)
+        self._extend = self.redis.register_script(EXTEND_SCRIPT)
+        self._unlock = self.redis.register_script(UNLOCK_SCRIPT)
+        self._pop = self.redis.register_script(POP_SCRIPT)
+        self._lock_or_replace = self.redis.register_script(LOCK_OR_REPLACE_SCRIPT)
+        self._mark_started = self.redis.register_script(MARK_STARTED_SCRIPT)
+        self._acquire_slot = self.redis.register_script(ACQUIRE_SLOT_SCRIPT)
+
+    def reset(self):
+        for node in self.redis.get_nodes():
+            if node.redis_connection is not None:
+                node.redis_connection.connection_pool.reset()
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        # Cluster pipelines can't run scripts, so the locks are grouped by
+        # node and each group is pipelined on that node's client
+        pipes = {}
+        positions = []
+        for lock, task_id in zip(locks, task_ids):
+            node = self.redis.get_node_from_key(lock)
+            pipe = pipes.get(node.name)
+            if pipe is None:
+                client = self.redis.get_redis_connection(node)
+                pipe = pipes[node.name] = client.pipeline(transaction=False)
+            self._lock_or_get(
+                keys=[lock],
+                args=[task_id, expiry if expiry is not None else ""],
+                client=pipe,
+            )
+            positions.append((node.name, len(pipe) - 1))
+        results = {name: pipe.execute() for name, pipe in pipes.items()}
+        return [_decode(results[name][i]) for name, i in positions]
+
+    def extend(self, lock, task_id, expiry=None):
+        # The lock and its started mark can be in different slots
+        args = [task_id, int(expiry * 1000) if expiry is not None else ""]
+        extended = self._extend(keys=[lock], args=args)
+        self._extend(keys=[lock + STARTED_SUFFIX], args=args)
+        return bool(extended)
+
+    def get_many(self, locks):
+        if not locks:
+            return []
+        return self.redis.mget_nonatomic(locks)
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        for node in self._primaries(key_prefix):
+            client = self.redis.get_redis_connection(node)
+            cursor = None
+            while cursor != 0:
+                cursor, keys = client.scan(
+                    cursor=cursor or 0, match=key_prefix + "*", count=batch_size
+                )
+                if keys:
+                    # GET each key, the keys of a batch can be in different slots
+                    pipe = client.pipeline(transaction=False)
+                    for key in keys:
+                        pipe.get(key)
+                    yield [
+                        (key, task_id)
+                        for key, task_id in zip(keys, pipe.execute())
+                        if task_id is not None
+                    ]
+
+    def clear(self, key_prefix):
+        primaries = self._primaries(key_prefix)
+        if not primaries:
+            return 0
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers or len(primaries)
+        ) as executor:
+            return sum(
+                executor.map(
+                    lambda node: self._clear_node(node, key_prefix + "*"), primaries
+                )
+            )
+
+    def _primaries(self, key_prefix):
+        # Keys under a prefix with a complete hash tag are all in one slot
+        start = key_prefix.find("{")
+        end = key_prefix.find("}", start + 1)
+        if start != -1 and end > start + 1:
+            return [self.redis.get_node_from_key(key_prefix)]
+        return self.redis.get_primaries()
+
+    def _clear_node(self, node, match):
+        client = self.redis.get_redis_connection(node)
+        removed = 0
+        cursor = None
+        while cursor != 0:
+            cursor, keys = client.scan(
+                cursor=cursor or 0, match=match, count=self.scan_count
+            )
+            if keys:
+                # Keys of one node can be in different slots, so each key
+                # is unlinked on its own to avoid CROSSSLOT errors
+                pipe = client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.unlink(key)
+                removed += sum(pipe.execute())
+        return removed
@@ -0,0 +1,142 @@
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+from .base import BaseBackend
+from .redis import RedisBackend
+
+
+def _ring_hash(value):
+    return int.from_bytes(md5(value.encode()).digest()[:8], "big")
+
+
+class ShardedRedisBackend(BaseBackend):
+    """
+    Backend spreading locks over several independent redis servers.
+
+    Each lock is routed to one server with a consistent hash ring, so
+    adding a server only moves the locks that land on its share of the
+    ring. Batch operations are grouped per server and all servers are
+    queried in parallel.
+    """
+
+    def __init__(self, urls, replicas=160, max_workers=None, **kwargs):
+        """
+        kwargs are forwarded to the `RedisBackend` of each server
+
+        :param urls: Redis URLs as a list or a comma separated string
+        :param replicas: Number of points each server gets on the hash ring
+        :param max_workers: Number of servers queried at once,
+            defaults to all of them
+        """
+        if isinstance(urls, str):
+            urls = [url.strip() for url in urls.split(",") if url.strip()]
+        if not urls:
+            raise ValueError("ShardedRedisBackend requires at least one redis URL")
+        self.shards = [RedisBackend(url, **kwargs) for url in urls]
+        self.max_workers = max_workers or len(self.shards)
+        self._executor = None
+        # Points are derived from the URL, so the order of servers doesn't matter
+        ring = sorted(
+            (_ring_hash("{}-{}".format(url, i)), shard)
+            for url, shard in zip(urls, self.shards)
+            for i in range(replicas)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [shard for _, shard in ring]
+
+    def shard(self, lock):
+        """
+        Get the `RedisBackend` storing the given lock
+        """
+        index = bisect(self._points, _ring_hash(lock))
+        return self._owners[index % len(self._owners)]
+
+    def reset(self):
+        self._executor = None
+        for shard in self.shards:
+            shard.reset()
+
+    def lock(self, lock, task_id, expiry=None):
+        return self.shard(lock).lock(lock, task_id, expiry=expiry)
+
+    def lock_or_get(self, lock, task_id, expiry=None):
+        return self.shard(lock).lock_or_get(lock, task_id, expiry=expiry)
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        return self._map_grouped(
+            locks,
+            task_ids,
+            lambda shard, locks, task_ids: shard.lock_many(
+                locks, task_ids, expiry=expiry
+            ),
+        )
+
+    def unlock(self, lock, task_id=None):
+        return self.shard(lock).unlock(lock, task_id=task_id)
+
+    def extend(self, lock, task_id, expiry=None):
+        return self.shard(lock).extend(lock, task_id, expiry=expiry)
+
+    def set_pending(self, lock, payload, expiry=None):
+        self.shard(lock).set_pending(lock, payload, expiry=expiry)
+
+    def pop_pending(self, lock):
+        return self.shard(lock).pop_pending(lock)
+
+    def lock_or_replace(self, lock, task_id, expiry=None):
+        return self.shard(lock).lock_or_replace(lock, task_id, expiry=expiry)
+
+    def mark_started(self, lock, task_id):
+        return self.shard(lock).mark_started(lock, task_id)
+
+    def unmark_started(self, lock, task_id):
+        self.shard(lock).unmark_started(lock, task_id)
+
+    def acquire_slot(self, lock, task_id, limit, expiry=None):
+        return self.shard(lock).acquire_slot(lock, task_id, limit, expiry=expiry)
+
+    def release_slot(self, lock, task_id=None):
+        self.shard(lock).release_slot(lock, task_id=task_id)
+
+    def get(self, lock):
+        return self.shard(lock).get(lock)
+
+    def get_many(self, locks):
+        return self._map_grouped(
+            locks, locks, lambda shard, locks, _: shard.get_many(locks)
+        )
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        for shard in self.shards:
+            yield from shard.iter_locks(key_prefix, batch_size=batch_size)
+
+    def clear(self, key_prefix):
+        return sum(self._map(lambda shard: shard.clear(key_prefix), self.shards))
+
+    def _map(self, func, items):
+        items = list(items)
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return list(self._executor.map(func, items))
+
+    def _map_grouped(self, locks, values, func):
+        # Group the locks by shard, keeping their order within each shard
+        groups = {}
+        for index, (lock, value) in enumerate(zip(locks, values)):
+            group = groups.setdefault(self.shard(lock), ([], [], []))
+            group[0].append(index)
+            group[1].append(lock)
+            group[2].append(value)
+
+        results = [None] * len(locks)
+        grouped = self._map(
+            lambda item: (item[1][0], func(item[0], item[1][1], item[1][2])),
+            groups.items(),
+        )
+        for indexes, shard_results in grouped:
+            for index, result in zip(indexes, shard_results):
+                results[index] = result
+        return results
@@ -0,0 +1,316 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .base import PENDING_SUFFIX, STARTED_SUFFIX, BaseBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS singleton_locks (
+    lock TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS singleton_locks_expires_at
+    ON singleton_locks (expires_at);
+CREATE TABLE IF NOT EXISTS singleton_slots (
+    lock TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (lock, task_id)
+) WITHOUT ROWID;
+"""
+
+# SQLite versions before 3.32 allow at most 999 query parameters
+MAX_PARAMS = 900
+
+
+class SQLiteBackend(BaseBackend):
+    """
+    Backend storing locks in a SQLite database in WAL mode.
+
+    Locks are shared by all processes on the host that use the same
+    database file, which makes this suitable for running producers and
+    prefork workers on a single machine without redis.
+    Lock expiry uses the system clock and expired locks are purged
+    through an index on the expiry column.
+    """
+
+    def __init__(self, url, timeout=5.0, purge_interval=1000):
+        """
+        :param url: Database URL, e.g. `sqlite:////var/lib/singleton.db`
+            for an absolute path, or a plain file path
+        :param timeout: Seconds to wait for other processes to release
+            the database write lock
+        :param purge_interval: Remove all expired locks after this many
+            writes from a process
+        """
+        self.path = url[len("sqlite:///") :] if url.startswith("sqlite:///") else url
+        self.timeout = timeout
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._writes = 0
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        """
+        SQLite connection of the current thread, reopened after fork
+        """
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.connection
+
+    def reset(self):
+        self._local = threading.local()
+
+    @contextmanager
+    def _write(self):
+        db = self.connection
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        self._writes += 1
+        if self._writes % self.purge_interval == 0:
+            self.purge_expired()
+
+    def lock(self, lock, task_id, expiry=None):
+        with self._write() as db:
+            return self._lock_or_get(db, lock, task_id, expiry) is None
+
+    def lock_or_get(self, lock, task_id, expiry=None):
+        with self._write() as db:
+            return self._lock_or_get(db, lock, task_id, expiry)
+
+    def lock_many(self, locks, task_ids, expiry=None):
+        with self._write() as db:
+            return [
+                self._lock_or_get(db, lock, task_id, expiry)
+                for lock, task_id in zip(locks, task_ids)
+            ]
+
+    def unlock(self, lock, task_id=None):
+        if task_id is None:
+            cursor = self.connection.execute(
+                "DELETE FROM singleton_locks WHERE lock = ?", (lock,)
+            )
+        else:
+            cursor = self.connection.execute(
+                "DELETE FROM singleton_locks WHERE lock = ? AND task_id = ?",
+                (lock, task_id),
+            )
+        return cursor.rowcount == 1
+
+    def extend(self, lock, task_id, expiry=None):
+        now = time.time()
+        expires_at = now + expiry if expiry is not None else None
+        with self._write() as db:
+            cursor = db.execute(
+                "UPDATE singleton_locks SET expires_at = ? WHERE lock = ?"
+                " AND task_id = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (expires_at, lock, task_id, now),
+            )
+            if cursor.rowcount != 1:
+                return False
+            # The started mark of replace mode, if any, expires with the lock
+            db.execute(
+                "UPDATE singleton_locks SET expires_at = ? WHERE lock = ?"
+                " AND task_id = ?",
+                (expires_at, lock + STARTED_SUFFIX, task_id),
+            )
+            return True
+
+    def set_pending(self, lock, payload, expiry=None):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO singleton_locks VALUES (?, ?, ?)",
+            (
+                lock + PENDING_SUFFIX,
+                payload,
+                time.time() + expiry if expiry is not None else None,
+            ),
+        )
+
+    def pop_pending(self, lock):
+        with self._write() as db:
+            row = db.execute(
+                "SELECT task_id, expires_at FROM singleton_locks WHERE lock = ?",
+                (lock + PENDING_SUFFIX,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "DELETE FROM singleton_locks WHERE lock = ?", (lock + PENDING_SUFFIX,)
+            )
+        if row[1] is not None and row[1] <= time.time():
+            return None
+        return row[0]
+
+    def lock_or_replace(self, lock, task_id, expiry=None):
+        with self._write() as db:
+            existing_task_id = self._get(db, lock)
+            if existing_task_id is not None and existing_task_id == self._get(
+                db, lock + STARTED_SUFFIX
+            ):
+                return existing_task_id, False
+            db.execute(
+                "INSERT OR REPLACE INTO singleton_locks VALUES (?, ?, ?)",
+                (lock, task_id, time.time() + expiry if expiry is not None else None),
+            )
+            db.execute(
+                "DELETE FROM singleton_locks WHERE lock = ?", (lock + STARTED_SUFFIX,)
+            )
+            return existing_task_id, existing_task_id is not None
+
+    def mark_started(self, lock, task_id):
+        with self._write() as db:
+            existing_task_id = self._get(db, lock)
+            if existing_task_id is None:
+                return True
+            if existing_task_id != task_id:
+                return False
+            # The mark expires with the lock
+            db.execute(
+                "INSERT OR REPLACE INTO singleton_locks"
+                " SELECT ?, task_id, expires_at FROM singleton_locks WHERE lock = ?",
+                (lock + STARTED_SUFFIX, lock),
+            )
+            return True
+
+    def acquire_slot(self, lock, task_id, limit, expiry=None):
+        now = time.time()
+        with self._write() as db:
+            db.execute(
+                "DELETE FROM singleton_slots WHERE lock = ? AND expires_at <= ?",
+                (lock, now),
+            )
+            holders = db.execute(
+                "SELECT task_id FROM singleton_slots WHERE lock = ?"
+                " ORDER BY expires_at IS NULL, expires_at",
+                (lock,),
+            ).fetchall()
+            if (task_id,) not in holders and len(holders) >= limit:
+                return holders[0][0]
+            db.execute(
+                "INSERT OR REPLACE INTO singleton_slots VALUES (?, ?, ?)",
+                (lock, task_id, now + expiry if expiry is not None else None),
+            )
+            return None
+
+    def release_slot(self, lock, task_id=None):
+        if task_id is None:
+            self.connection.execute(
+                "DELETE FROM singleton_slots WHERE lock = ?", (lock,)
+            )
+        else:
+            self.connection.execute(
+                "DELETE FROM singleton_slots WHERE lock = ? AND task_id = ?",
+                (lock, task_id),
+            )
+
+    def get(self, lock):
+        row = self.connection.execute(
+            "SELECT task_id FROM singleton_locks WHERE lock = ?"
+            " AND (expires_at IS NULL OR expires_at > ?)",
+            (lock, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, locks):
+        task_ids = {}
+        now = time.time()
+        for i in range(0, len(locks), MAX_PARAMS):
+            batch = locks[i : i + MAX_PARAMS]
+            rows = self.connection.execute(
+                "SELECT lock, task_id FROM singleton_locks WHERE lock IN ({})"
+                " AND (expires_at IS NULL OR expires_at > ?)".format(
+                    ", ".join("?" * len(batch))
+                ),
+                (*batch, now),
+            )
+            task_ids.update(rows)
+        return [task_ids.get(lock) for lock in locks]
+
+    def iter_locks(self, key_prefix, batch_size=1000):
+        last = None
+        while True:
+            query = "SELECT lock, task_id FROM singleton_locks WHERE lock >= ?"
+            params = [key_prefix]
+            if last is not None:
+                query += " AND lock > ?"
+                params.append(last)
+            rows = self.connection.execute(
+                query + " AND (expires_at IS NULL OR expires_at > ?)"
+                " ORDER BY lock LIMIT ?",
+                (*params, time.time(), batch_size),
+            ).fetchall()
+            batch = [row for row in rows if row[0].startswith(key_prefix)]
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+            last = batch[-1][0]
+
+    def clear(self, key_prefix):
+        if not key_prefix:
+            where, params = "", ()
+        else:
+            # Keys starting with the prefix sort between the prefix and the
+            # prefix with its last character incremented, so the primary key
+            # index is used instead of a full scan
+            upper = key_prefix[:-1] + chr(ord(key_prefix[-1]) + 1)
+            where, params = " WHERE lock >= ? AND lock < ?", (key_prefix, upper)
+        with self._write() as db:
+            removed = db.execute(
+                "SELECT count(DISTINCT lock) FROM singleton_slots" + where, params
+            ).fetchone()[0]
+            db.execute("DELETE FROM singleton_slots" + where, params)
+            cursor = db.execute("DELETE FROM singleton_locks" + where, params)
+            return removed + cursor.rowcount
+
+    def purge_expired(self):
+        """
+        Remove all expired locks and semaphore slots
+
+        :return: Number of locks removed
+        :rtype: `int`
+        """
+        now = time.time()
+        self.connection.execute(
+            "DELETE FROM singleton_slots WHERE expires_at <= ?", (now,)
+        )
+        cursor = self.connection.execute(
+            "DELETE FROM singleton_locks WHERE expires_at <= ?", (now,)
+        )
+        return cursor.rowcount
+
+    def _get(self, db, lock):
+        row = db.execute(
+            "SELECT task_id FROM singleton_locks WHERE lock = ?"
+            " AND (expires_at IS NULL OR expires_at > ?)",
+            (lock, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _lock_or_get(self, db, lock, task_id, expiry):
+        now = time.time()
+        row = db.execute(
+            "SELECT task_id, expires_at FROM singleton_locks WHERE lock = ?", (lock,)
+        ).fetchone()
+        if row and (row[1] is None or row[1] > now):
+            return row[0]
+        db.execute(
+            "INSERT OR REPLACE INTO singleton_locks VALUES (?, ?, ?)",
+            (lock, task_id, now + expiry if expiry is not None else None),
+        )
+        return None
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class Coalescer:
+    """
+    Per-process cache of recently queued singleton locks.
+
+    Identical calls following the first one within its window are answered
+    from memory with the task ID holding the lock, without a backend call.
+    Least recently used locks are dropped beyond `max_size`.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (backend, lock) -> (task_id, expires_at)
+        self._mutex = threading.Lock()
+
+    def get(self, backend, lock):
+        """
+        Get the task ID holding a lock, `None` when unknown or expired
+        """
+        key = (backend, lock)
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def add(self, backend, lock, task_id, window):
+        """
+        Remember the task ID holding a lock for `window` seconds
+        """
+        key = (backend, lock)
+        with self._mutex:
+            self._entries[key] = (task_id, time.monotonic() + window)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, backend, lock):
+        with self._mutex:
+            self._entries.pop((backend, lock), None)
+
+    def clear(self):
+        with self._mutex:
+            self._entries.clear()
+
+    def _reset_after_fork(self):
+        # The mutex may have been held by another thread of the parent
+        self._mutex = threading.Lock()
+
+
+coalescer = Coalescer()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=coalescer._reset_after_fork)
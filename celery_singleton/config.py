@@ -1,54 +1,124 @@
 from importlib import import_module
+from types import MappingProxyType
+
+from . import util
+
+
+def import_class(path_or_class):
+    """
+    Import a class from its dotted path, classes are returned as is
+    """
+    if isinstance(path_or_class, str):
+        path = path_or_class.split(".")
+        mod_name, class_name = ".".join(path[:-1]), path[-1]
+        mod = import_module(mod_name)
+        return getattr(mod, class_name)
+    return path_or_class
 
 
 class Config:
+    """
+    Read-only snapshot of the celery-singleton settings of a celery app.
+
+    Settings are read from `app.conf` and resolved once, so reading them
+    costs a plain attribute lookup. Call `refresh` to re-read them after
+    changing the app config, e.g. in tests.
+    """
+
+    __slots__ = (
+        "app",
+        "key_prefix",
+        "backend_class",
+        "async_backend_class",
+        "json_encoder_class",
+        "key_digest",
+        "key_encoder",
+        "key_streaming",
+        "key_layout",
+        "backend_kwargs",
+        "backend_url",
+        "backend_use_broker_pool",
+        "raise_on_duplicate",
+        "lock_expiry",
+        "lease_timeout",
+        "queue_expiry",
+        "run_expiry",
+        "coalesce_window",
+        "mode",
+    )
+
     def __init__(self, app):
-        self.app = app
+        object.__setattr__(self, "app", app)
+        self.refresh()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "Config is read-only, change the app config and call refresh() instead"
+        )
+
+    def __delattr__(self, name):
+        raise AttributeError("Config is read-only")
+
+    def refresh(self):
+        """
+        Re-read all settings from the app config
+        """
+        conf = self.app.conf
+        settings = dict(
+            key_prefix=conf.get("singleton_key_prefix", "SINGLETONLOCK_"),
+            backend_class=import_class(
+                conf.get(
+                    "singleton_backend_class",
+                    "celery_singleton.backends.redis.RedisBackend",
+                )
+            ),
+            async_backend_class=import_class(
+                conf.get("singleton_async_backend_class", None)
+            ),
+            json_encoder_class=import_class(
+                conf.get("singleton_json_encoder_class", None)
+            ),
+            key_digest=util.get_digest(conf.get("singleton_key_digest", "md5")),
+            key_encoder=util.get_encoder(conf.get("singleton_key_encoder", "json")),
+            key_streaming=conf.get("singleton_key_streaming", False),
+            key_layout=util.get_key_layout(conf.get("singleton_key_layout", "flat")),
+            backend_kwargs=MappingProxyType(
+                dict(conf.get("singleton_backend_kwargs", {}))
+            ),
+            backend_url=self._get_backend_url(conf),
+            backend_use_broker_pool=conf.get(
+                "singleton_backend_use_broker_pool", False
+            ),
+            raise_on_duplicate=conf.get("singleton_raise_on_duplicate"),
+            lock_expiry=conf.get("singleton_lock_expiry"),
+            lease_timeout=conf.get("singleton_lease_timeout"),
+            queue_expiry=conf.get("singleton_queue_expiry"),
+            run_expiry=conf.get("singleton_run_expiry"),
+            coalesce_window=conf.get("singleton_coalesce_window"),
+            mode=conf.get("singleton_mode", "drop"),
+        )
+        for name, value in settings.items():
+            object.__setattr__(self, name, value)
 
-    @property
-    def key_prefix(self):
-        return self.app.conf.get("singleton_key_prefix", "SINGLETONLOCK_")
+    def lock_prefix(self, task=None):
+        """
+        Get the prefix of all lock keys, or of the lock keys of one task
 
-    @property
-    def backend_class(self):
-        path_or_class = self.app.conf.get(
-            "singleton_backend_class", "celery_singleton.backends.redis.RedisBackend"
+        :param task: Task or task name
+        :raises ValueError: When the key layout doesn't group keys by task
+        """
+        if task is None:
+            return self.key_prefix
+        return util.task_key_prefix(
+            self.key_layout, self.key_prefix, getattr(task, "name", task)
         )
-        if isinstance(path_or_class, str):
-            path = path_or_class.split(".")
-            mod_name, class_name = ".".join(path[:-1]), path[-1]
-            mod = import_module(mod_name)
-            return getattr(mod, class_name)
-        return path_or_class
-
-    @property
-    def json_encoder_class(self):
-        path_or_class = self.app.conf.get("singleton_json_encoder_class", None)
-        if isinstance(path_or_class, str):
-            path = path_or_class.split(".")
-            mod_name, class_name = ".".join(path[:-1]), path[-1]
-            mod = import_module(mod_name)
-            return getattr(mod, class_name)
-        return path_or_class
-
-    @property
-    def backend_kwargs(self):
-        return self.app.conf.get("singleton_backend_kwargs", {})
-
-    @property
-    def backend_url(self):
-        url = self.app.conf.get("singleton_backend_url")
+
+    @staticmethod
+    def _get_backend_url(conf):
+        url = conf.get("singleton_backend_url")
         if url is not None:
             return url
-        url = self.app.conf.get("result_backend")
+        url = conf.get("result_backend")
         if not url or not url.startswith("redis://"):
-            url = self.app.conf.get("broker_url")
+            url = conf.get("broker_url")
         return url
-
-    @property
-    def raise_on_duplicate(self):
-        return self.app.conf.get("singleton_raise_on_duplicate")
-
-    @property
-    def lock_expiry(self):
-        return self.app.conf.get("singleton_lock_expiry")
@@ -13,3 +13,10 @@ class DuplicateTaskError(CelerySingletonException):
         super().__init__(message)
 
     pass
+
+
+class InvalidUniqueOnError(CelerySingletonException):
+    """
+    Raised when a task's `unique_on` names arguments
+    that are not in the task's signature
+    """
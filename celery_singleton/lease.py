@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseKeeper:
+    """
+    Background thread renewing the locks of running tasks.
+
+    Each lease is extended to its full timeout every third of the timeout,
+    until it is stopped or the lock turns out to be held by another task.
+    The thread is started with the first lease and exits when none are left.
+    """
+
+    def __init__(self):
+        self._leases = {}  # (lock, task_id) -> (backend, timeout, renew_at)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, backend, lock, task_id, timeout):
+        """
+        Keep renewing a lock held by the given task
+
+        :param backend: Backend storing the lock, must implement `extend`
+        :param lock: Lock/mutex string
+        :param task_id: Task id holding the lock
+        :param timeout: Time to live in seconds set on every renewal
+        """
+        with self._condition:
+            self._leases[(lock, task_id)] = (
+                backend,
+                timeout,
+                time.monotonic() + timeout / 3,
+            )
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="celery-singleton-lease", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self, lock, task_id):
+        """
+        Stop renewing a lock, the lock itself is left as is
+        """
+        with self._condition:
+            self._leases.pop((lock, task_id), None)
+
+    def stop_all(self):
+        with self._condition:
+            self._leases.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._leases:
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                due = [
+                    (key, lease)
+                    for key, lease in self._leases.items()
+                    if lease[2] <= now
+                ]
+                if not due:
+                    next_renewal = min(lease[2] for lease in self._leases.values())
+                    self._condition.wait(next_renewal - now)
+                    continue
+                for key, (backend, timeout, _) in due:
+                    self._leases[key] = (backend, timeout, now + timeout / 3)
+            # Renew outside of the condition so starting and stopping
+            # leases doesn't wait on the backend
+            for (lock, task_id), (backend, timeout, _) in due:
+                self._renew(backend, lock, task_id, timeout)
+
+    def _renew(self, backend, lock, task_id, timeout):
+        try:
+            renewed = backend.extend(lock, task_id, timeout)
+        except Exception:
+            logger.exception("Failed to renew singleton lock %s", lock)
+            return
+        if not renewed:
+            logger.warning(
+                "Singleton lock %s is no longer held by task %s", lock, task_id
+            )
+            self.stop(lock, task_id)
+
+    def _reset_after_fork(self):
+        # Threads don't survive fork, leases of the parent are its own
+        self._leases = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+
+keeper = LeaseKeeper()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=keeper._reset_after_fork)
@@ -0,0 +1,103 @@
+import time
+
+from celery import states
+from celery.backends.base import DisabledBackend
+
+from .backends import get_backend
+from .backends.base import PENDING_SUFFIX, STARTED_SUFFIX
+from .config import Config
+
+
+def reap_locks(app, batch_size=1000, interval=0.0, inspect_timeout=1.0, task=None):
+    """
+    Remove singleton locks of the given app that no task will release
+
+    Locks are scanned in batches and the task holding each lock is looked
+    up in the result backend. A lock is orphaned when its task has finished,
+    or has started but is not known to any worker. Locks of pending tasks
+    are kept, as their messages may still be waiting in the broker.
+
+    :param app: celery instance
+    :type app: celery.Celery
+    :param batch_size: Number of locks checked at a time
+    :param interval: Seconds to sleep between batches, limiting the load
+        on the lock and result backends
+    :param inspect_timeout: Seconds to wait for workers to report their tasks
+    :param task: Only check the locks of this task, see `clear_locks`
+    :return: Number of orphaned locks removed
+    :rtype: `int`
+    :raises ValueError: If the app has no result backend
+    """
+    if isinstance(app.backend, DisabledBackend):
+        # Without task states a queued task can't be told from a lost one
+        raise ValueError("reap_locks requires the app to have a result backend")
+    config = Config(app)
+    backend = get_backend(config)
+    known_task_ids = _worker_task_ids(app, inspect_timeout)
+    removed = 0
+    batches = backend.iter_locks(config.lock_prefix(task), batch_size)
+    for n, batch in enumerate(batches):
+        if n and interval:
+            time.sleep(interval)
+        # Pending calls of debounce mode and started marks of replace mode
+        # are stored next to their locks
+        batch = [
+            entry
+            for entry in batch
+            if not entry[0].endswith((PENDING_SUFFIX, STARTED_SUFFIX))
+        ]
+        task_states = _task_states(app, [task_id for _, task_id in batch])
+        for (lock, task_id), state in zip(batch, task_states):
+            if _is_orphaned(task_id, state, known_task_ids):
+                # Owner checked, in case the lock was aquired again meanwhile
+                if backend.unlock(lock, task_id=task_id):
+                    removed += 1
+    return removed
+
+
+def _is_orphaned(task_id, state, known_task_ids):
+    if state in states.READY_STATES:
+        return True
+    # Without replies from workers a started task may still be running
+    return (
+        state == states.STARTED
+        and known_task_ids is not None
+        and task_id not in known_task_ids
+    )
+
+
+def _worker_task_ids(app, timeout):
+    """
+    IDs of tasks active, reserved or scheduled on any worker,
+    `None` when no worker replies
+    """
+    inspect = app.control.inspect(timeout=timeout)
+    task_ids = None
+    for method in (inspect.active, inspect.reserved, inspect.scheduled):
+        replies = method()
+        if replies is None:
+            continue
+        if task_ids is None:
+            task_ids = set()
+        for requests in replies.values():
+            for request in requests:
+                # Scheduled tasks are reported with their request nested
+                request = request.get("request", request)
+                task_ids.add(request.get("id"))
+    return task_ids
+
+
+def _task_states(app, task_ids):
+    result_backend = app.backend
+    if not task_ids:
+        return []
+    if hasattr(result_backend, "mget") and hasattr(result_backend, "get_key_for_task"):
+        # Key-value result backends fetch the whole batch in one call
+        values = result_backend.mget(
+            [result_backend.get_key_for_task(task_id) for task_id in task_ids]
+        )
+        return [
+            result_backend.decode_result(value)["status"] if value else states.PENDING
+            for value in values
+        ]
+    return [app.AsyncResult(task_id).state for task_id in task_ids]
@@ -0,0 +1,49 @@
+from billiard.einfo import ExceptionWithTraceback
+from celery.exceptions import TimeLimitExceeded, WorkerLostError
+from celery.worker.request import Request
+
+
+class SingletonRequest(Request):
+    """
+    Worker request of `Singleton` tasks.
+
+    Tasks killed by a hard time limit or lost with their worker process
+    never reach `Singleton.on_failure`, the worker handles them here.
+    Their lock is released unless the message is requeued to run again.
+    """
+
+    def on_timeout(self, soft, timeout):
+        super().on_timeout(soft, timeout)
+        if not soft and not self._requeued(TimeLimitExceeded(timeout)):
+            self.release_singleton_lock()
+
+    def on_failure(self, exc_info, send_failed_event=True, return_ok=False):
+        super().on_failure(
+            exc_info, send_failed_event=send_failed_event, return_ok=return_ok
+        )
+        exc = exc_info.exception
+        if isinstance(exc, ExceptionWithTraceback):
+            exc = exc.exc
+        if isinstance(exc, (WorkerLostError, TimeLimitExceeded)) and not self._requeued(
+            exc
+        ):
+            self.release_singleton_lock()
+
+    def release_singleton_lock(self):
+        self.task.release_message_lock(
+            self.id,
+            lock=self.request_dict.get("singleton_lock"),
+            task_args=self.args,
+            task_kwargs=self.kwargs,
+        )
+
+    def _requeued(self, exc):
+        # Same conditions as celery's Request.on_failure rejecting with requeue
+        task = self.task
+        return task.acks_late and (
+            (task.reject_on_worker_lost and isinstance(exc, WorkerLostError))
+            or (
+                isinstance(exc, TimeLimitExceeded)
+                and not task.acks_on_failure_or_timeout
+            )
+        )
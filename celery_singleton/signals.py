@@ -0,0 +1,84 @@
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    task_rejected,
+    task_revoked,
+    task_unknown,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from celery.worker import state as worker_state
+
+from .backends import get_backend
+from .config import Config
+from .lease import keeper
+from .singleton import Singleton
+
+
+@task_prerun.connect
+def start_run(task_id=None, task=None, args=None, kwargs=None, **_):
+    if isinstance(task, Singleton):
+        task.rearm_lock(task_id, args, kwargs)
+        task.start_lease(task_id, args, kwargs)
+
+
+@task_postrun.connect
+def end_run(task_id=None, task=None, args=None, kwargs=None, state=None, **_):
+    if isinstance(task, Singleton):
+        task.stop_lease(task_id, args, kwargs, state)
+
+
+@task_revoked.connect
+def release_revoked(sender=None, request=None, **_):
+    if isinstance(sender, Singleton) and request is not None:
+        sender.release_message_lock(
+            request.id,
+            lock=getattr(request, "singleton_lock", None),
+            task_args=request.args,
+            task_kwargs=request.kwargs,
+        )
+
+
+@task_rejected.connect
+def release_rejected(sender=None, message=None, **_):
+    _release_message(sender.app, message)
+
+
+@task_unknown.connect
+def release_unknown(sender=None, message=None, name=None, id=None, **_):
+    _release_message(sender.app, message, name=name, task_id=id)
+
+
+def _release_message(app, message, name=None, task_id=None):
+    headers = getattr(message, "headers", None) or {}
+    lock = headers.get("singleton_lock")
+    task_id = task_id or headers.get("id")
+    # Only messages sent by singleton tasks carry a lock
+    if lock is None or task_id is None:
+        return
+    task = app.tasks.get(name or headers.get("task"))
+    if isinstance(task, Singleton):
+        task.release_message_lock(task_id, lock=lock)
+    else:
+        get_backend(Config(app)).unlock(lock, task_id=task_id)
+
+
+@worker_shutdown.connect
+def release_active(**_):
+    # Messages of tasks without acks_late were acknowledged when they
+    # started, so tasks still active at shutdown will not run again
+    for request in list(worker_state.active_requests):
+        task = request.task
+        if isinstance(task, Singleton) and not task.acks_late:
+            task.release_message_lock(
+                request.id,
+                lock=request.request_dict.get("singleton_lock"),
+                task_args=request.args,
+                task_kwargs=request.kwargs,
+            )
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_all_leases(**_):
+    keeper.stop_all()
@@ -1,26 +1,74 @@
 from celery import Task as BaseTask
+from celery import states
+from celery.exceptions import Ignore
+from kombu import serialization
+from kombu.utils import json
 from kombu.utils.uuid import uuid
+import base64
 import inspect
 
-from .backends import get_backend
+from .backends import get_async_backend, get_backend
 from .config import Config
 from .exceptions import DuplicateTaskError
 from . import util
+from .lease import keeper
+from .coalesce import coalescer
 
+MODES = ("drop", "debounce", "replace")
 
-def clear_locks(app):
+
+def clear_locks(app, task=None):
+    """
+    Remove all singleton locks of the given app
+
+    :param app: celery instance
+    :type app: celery.Celery
+    :param task: Only remove the locks of this task, given as task or
+        task name. Requires a key layout grouping keys by task
+    :return: Number of locks removed
+    :rtype: `int`
+    """
     config = Config(app)
     backend = get_backend(config)
-    backend.clear(config.key_prefix)
+    return backend.clear(config.lock_prefix(task))
 
 
 class Singleton(BaseTask):
     abstract = True
+    Request = "celery_singleton.request:SingletonRequest"
     _singleton_backend = None
+    _singleton_async_backend = None
     _singleton_config = None
     unique_on = None
     raise_on_duplicate = None
     lock_expiry = None
+    key_streaming = None
+    lease_timeout = None
+    queue_expiry = None
+    run_expiry = None
+    coalesce_window = None
+    mode = None
+    max_concurrency = None
+
+    @classmethod
+    def on_bound(cls, app):
+        super().on_bound(app)
+        if cls.max_concurrency is not None and cls.max_concurrency < 1:
+            raise ValueError(
+                "max_concurrency of {} must be at least 1".format(cls.__name__)
+            )
+        # Resolve unique_on once per task class, failing early on bad names
+        cls._unique_on_extractor = cls._compile_unique_on()
+
+    @classmethod
+    def _compile_unique_on(cls):
+        if cls.unique_on is None:
+            return None
+        sig = inspect.signature(cls.run)
+        if not isinstance(inspect.getattr_static(cls, "run"), staticmethod):
+            # Drop `self` from the signature of methods and bound tasks
+            sig = sig.replace(parameters=list(sig.parameters.values())[1:])
+        return util.unique_on_extractor(sig, cls.unique_on)
 
     @property
     def _raise_on_duplicate(self):
@@ -28,6 +76,12 @@ class Singleton(BaseTask):
             return self.raise_on_duplicate
         return self.singleton_config.raise_on_duplicate or False
 
+    @property
+    def _key_streaming(self):
+        if self.key_streaming is not None:
+            return self.key_streaming
+        return self.singleton_config.key_streaming
+
     @property
     def singleton_config(self):
         if self._singleton_config:
@@ -42,31 +96,153 @@ class Singleton(BaseTask):
         self._singleton_backend = get_backend(self.singleton_config)
         return self._singleton_backend
 
+    @property
+    def singleton_async_backend(self):
+        if self._singleton_async_backend:
+            return self._singleton_async_backend
+        self._singleton_async_backend = get_async_backend(self.singleton_config)
+        return self._singleton_async_backend
+
+    @property
+    def _lock_expiry(self):
+        if self.lock_expiry is not None:
+            return self.lock_expiry
+        return self.singleton_config.lock_expiry
+
+    @property
+    def _queue_expiry(self):
+        if self.queue_expiry is not None:
+            return self.queue_expiry
+        if self.singleton_config.queue_expiry is not None:
+            return self.singleton_config.queue_expiry
+        return self._lock_expiry
+
+    @property
+    def _run_expiry(self):
+        if self.run_expiry is not None:
+            return self.run_expiry
+        if self.singleton_config.run_expiry is not None:
+            return self.singleton_config.run_expiry
+        time_limit = (self.request.timelimit or (None, None))[0]
+        time_limit = time_limit or self.time_limit or self.app.conf.task_time_limit
+        if time_limit is not None:
+            return time_limit
+        return self._lock_expiry
+
+    @property
+    def _two_phase_expiry(self):
+        return any(
+            expiry is not None
+            for expiry in (
+                self.queue_expiry,
+                self.run_expiry,
+                self.singleton_config.queue_expiry,
+                self.singleton_config.run_expiry,
+            )
+        )
+
+    @property
+    def _lease_timeout(self):
+        if self.lease_timeout is not None:
+            return self.lease_timeout
+        return self.singleton_config.lease_timeout
+
+    @property
+    def _coalesce_window(self):
+        # Newer calls must reach the backend to replace queued tasks
+        # or to take free semaphore slots
+        if self.max_concurrency is not None or self._mode == "replace":
+            return None
+        if self.coalesce_window is not None:
+            return self.coalesce_window
+        return self.singleton_config.coalesce_window
+
+    @property
+    def _mode(self):
+        mode = self.mode if self.mode is not None else self.singleton_config.mode
+        if mode not in MODES:
+            raise ValueError(
+                "Unknown singleton mode {!r}, expected one of {}".format(
+                    mode, ", ".join(MODES)
+                )
+            )
+        return mode
+
     def aquire_lock(self, lock, task_id):
-        expiry = (
-            self.lock_expiry
-            if self.lock_expiry is not None
-            else self.singleton_config.lock_expiry
+        if self.max_concurrency is not None:
+            return self.aquire_lock_or_get(lock, task_id) is None
+        return self.singleton_backend.lock(lock, task_id, expiry=self._queue_expiry)
+
+    def aquire_lock_or_get(self, lock, task_id):
+        if self.max_concurrency is not None:
+            return self.aquire_slot(lock, task_id)
+        return self.singleton_backend.lock_or_get(
+            lock, task_id, expiry=self._queue_expiry
+        )
+
+    def aquire_lock_or_replace(self, lock, task_id):
+        """
+        Aquire the lock, taking it over from a task that is queued but has
+        not started yet. The replaced task is left for the caller to revoke
+        once the new message is published.
+
+        :return: `(existing_task_id, replaced_task_id)`, both `None` if the
+            lock was free, otherwise one of them is set
+        """
+        if self.max_concurrency is not None:
+            return self.aquire_slot(lock, task_id), None
+        existing_task_id, replaced = self.singleton_backend.lock_or_replace(
+            lock, task_id, expiry=self._queue_expiry
+        )
+        if replaced:
+            return None, existing_task_id
+        return existing_task_id, None
+
+    def aquire_slot(self, lock, task_id):
+        """
+        Take one of the `max_concurrency` slots of the lock's semaphore
+
+        :return: `None` if a slot was taken, otherwise the task ID
+            of a task holding a slot
+        """
+        if self._mode == "replace":
+            raise ValueError("replace mode can't be combined with max_concurrency")
+        return self.singleton_backend.acquire_slot(
+            lock, task_id, self.max_concurrency, expiry=self._queue_expiry
         )
-        return self.singleton_backend.lock(lock, task_id, expiry=expiry)
 
     def get_existing_task_id(self, lock):
         return self.singleton_backend.get(lock)
 
+    def get_coalesced_task_id(self, lock):
+        """
+        Get the task ID holding a lock if this process queued the task,
+        or saw it queued, within the last `coalesce_window` seconds
+        """
+        if not self._coalesce_window:
+            return None
+        return coalescer.get(self.singleton_backend, lock)
+
+    def coalesce(self, lock, task_id):
+        """
+        Answer further attempts on a lock held by `task_id` from memory
+        for `coalesce_window` seconds, or until the lock expires if sooner
+        """
+        window = self._coalesce_window
+        if not window:
+            return
+        if self._queue_expiry is not None:
+            window = min(window, self._queue_expiry)
+        coalescer.add(self.singleton_backend, lock, task_id, window)
+
     def generate_lock(self, task_name, task_args=None, task_kwargs=None):
-        unique_on = self.unique_on
         task_args = task_args or []
         task_kwargs = task_kwargs or {}
-        if unique_on is not None:
-            if isinstance(unique_on, str):
-                unique_on = [unique_on]
-            if not any(unique_on):
-                unique_kwargs = {}
-            else:
-                sig = inspect.signature(self.run)
-                bound = sig.bind(*task_args, **task_kwargs)
-                bound.apply_defaults()
-                unique_kwargs = {key: bound.arguments[key] for key in unique_on}
+        if self.unique_on is not None:
+            extractor = type(self).__dict__.get("_unique_on_extractor")
+            if extractor is None:
+                extractor = type(self)._unique_on_extractor = self._compile_unique_on()
+            unique_kwargs = extractor(task_args, task_kwargs)
             unique_args = []
         else:
             unique_args = task_args
@@ -77,6 +253,10 @@ class Singleton(BaseTask):
             unique_kwargs,
             key_prefix=self.singleton_config.key_prefix,
             json_encoder_class=self.singleton_config.json_encoder_class,
+            digest=self.singleton_config.key_digest,
+            encoder=self.singleton_config.key_encoder,
+            streaming=self._key_streaming,
+            layout=self.singleton_config.key_layout,
         )
 
     def apply_async(
@@ -95,8 +275,28 @@ class Singleton(BaseTask):
         task_id = task_id or uuid()
         lock = self.generate_lock(self.name, args, kwargs)
 
-        run_args = dict(
-            lock=lock,
+        existing_task_id = self.get_coalesced_task_id(lock)
+        if existing_task_id not in (None, task_id):
+            self.defer(lock, args, kwargs)
+            return self.on_duplicate(existing_task_id)
+
+        replaced_task_id = None
+        if self._mode == "replace":
+            existing_task_id, replaced_task_id = self.aquire_lock_or_replace(
+                lock, task_id
+            )
+        else:
+            existing_task_id = self.aquire_lock_or_get(lock, task_id)
+        if existing_task_id == task_id:
+            # Already held by this task, which is queueing its retry
+            existing_task_id = None
+        self.coalesce(lock, existing_task_id or task_id)
+        if existing_task_id is not None:
+            self.defer(lock, args, kwargs)
+            return self.on_duplicate(existing_task_id)
+
+        result = self.run_locked(
+            lock,
             args=args,
             kwargs=kwargs,
             task_id=task_id,
@@ -106,37 +306,360 @@ class Singleton(BaseTask):
             shadow=shadow,
             **options
         )
+        if replaced_task_id is not None:
+            # Revoked only now, so the replaced call survives a failed publish
+            self.app.control.revoke(replaced_task_id)
+        return result
 
-        task = self.lock_and_run(**run_args)
-        if task:
-            return task
+    async def apply_async_singleton(
+        self, args=None, kwargs=None, task_id=None, **options
+    ):
+        """
+        Asyncio variant of `apply_async`.
 
-        existing_task_id = self.get_existing_task_id(lock)
-        while not existing_task_id:
-            task = self.lock_and_run(**run_args)
-            if task:
-                return task
-            existing_task_id = self.get_existing_task_id(lock)
-        return self.on_duplicate(existing_task_id)
+        The lock is aquired through the async backend, so checking for
+        duplicates does not block the event loop. The message itself is
+        published with celery's regular producer.
+        """
+        args = args or []
+        kwargs = kwargs or {}
+        task_id = task_id or uuid()
+        lock = self.generate_lock(self.name, args, kwargs)
+        existing_task_id = self.get_coalesced_task_id(lock)
+        if existing_task_id not in (None, task_id):
+            await self.defer_async(lock, args, kwargs)
+            return self.on_duplicate(existing_task_id)
 
-    def lock_and_run(self, lock, *args, task_id=None, **kwargs):
-        lock_aquired = self.aquire_lock(lock, task_id)
-        if lock_aquired:
+        replaced_task_id = None
+        if self._mode == "replace":
+            existing_task_id, replaced_task_id = (
+                await self.aquire_lock_or_replace_async(lock, task_id)
+            )
+        else:
+            existing_task_id = await self.aquire_lock_or_get_async(lock, task_id)
+        if existing_task_id == task_id:
+            # Already held by this task, which is queueing its retry
+            existing_task_id = None
+        self.coalesce(lock, existing_task_id or task_id)
+        if existing_task_id is not None:
+            await self.defer_async(lock, args, kwargs)
+            return self.on_duplicate(existing_task_id)
+
+        result = await self.run_locked_async(
+            lock, args=args, kwargs=kwargs, task_id=task_id, **options
+        )
+        if replaced_task_id is not None:
+            # Revoked only now, so the replaced call survives a failed publish
+            self.app.control.revoke(replaced_task_id)
+        return result
+
+    async def aquire_lock_or_get_async(self, lock, task_id):
+        """
+        Asyncio variant of `aquire_lock_or_get`
+        """
+        backend = self.singleton_async_backend
+        if self.max_concurrency is not None:
+            if self._mode == "replace":
+                raise ValueError("replace mode can't be combined with max_concurrency")
+            return await backend.acquire_slot(
+                lock, task_id, self.max_concurrency, expiry=self._queue_expiry
+            )
+        return await backend.lock_or_get(lock, task_id, expiry=self._queue_expiry)
+
+    async def aquire_lock_or_replace_async(self, lock, task_id):
+        """
+        Asyncio variant of `aquire_lock_or_replace`
+        """
+        if self.max_concurrency is not None:
+            return await self.aquire_lock_or_get_async(lock, task_id), None
+        existing_task_id, replaced = await self.singleton_async_backend.lock_or_replace(
+            lock, task_id, expiry=self._queue_expiry
+        )
+        if replaced:
+            return None, existing_task_id
+        return existing_task_id, None
+
+    async def run_locked_async(self, lock, *args, task_id=None, **kwargs):
+        """
+        Asyncio variant of `run_locked`
+        """
+        backend = self.singleton_async_backend
+        try:
+            return self._send_locked(lock, *args, task_id=task_id, **kwargs)
+        except Exception:
+            # Clear the lock if apply_async fails
+            if self._coalesce_window:
+                coalescer.discard(self.singleton_backend, lock)
+            if self.max_concurrency is not None:
+                await backend.release_slot(lock, task_id=task_id)
+            else:
+                await backend.unlock(lock, task_id=task_id)
+            raise
+
+    def apply_async_many(self, arguments, **options):
+        """
+        Queue many instances of the task, aquiring all their locks
+        in a single backend call.
+
+        :param arguments: `(args, kwargs)` pairs, one for each task
+        :param options: Options passed to `apply_async` of every task
+        :return: An `AsyncResult` for each task, in order. Duplicates are
+            handled by `on_duplicate` as with `apply_async`
+        :rtype: `list`
+        """
+        calls = [(args or [], kwargs or {}) for args, kwargs in arguments]
+        locks = [self.generate_lock(self.name, args, kwargs) for args, kwargs in calls]
+        task_ids = [uuid() for _ in calls]
+        if self.max_concurrency is not None:
+            existing_task_ids = [
+                self.aquire_slot(lock, task_id)
+                for lock, task_id in zip(locks, task_ids)
+            ]
+        else:
+            existing_task_ids = self.singleton_backend.lock_many(
+                locks, task_ids, expiry=self._queue_expiry
+            )
+
+        results = [None] * len(calls)
+        aquired = [
+            i for i, existing in enumerate(existing_task_ids) if existing is None
+        ]
+        for n, i in enumerate(aquired):
+            args, kwargs = calls[i]
             try:
-                return super(Singleton, self).apply_async(
-                    *args, task_id=task_id, **kwargs
+                results[i] = self.run_locked(
+                    locks[i], args=args, kwargs=kwargs, task_id=task_ids[i], **options
                 )
             except Exception:
-                # Clear the lock if apply_async fails
-                self.unlock(lock)
+                # Locks of tasks that will not be queued must not linger
+                for j in aquired[n + 1 :]:
+                    self.unlock(locks[j], task_ids[j])
                 raise
 
+        for i, existing_task_id in enumerate(existing_task_ids):
+            if existing_task_id is not None:
+                self.defer(locks[i], *calls[i])
+                results[i] = self.on_duplicate(existing_task_id)
+        return results
+
+    def lock_and_run(self, lock, *args, task_id=None, **kwargs):
+        lock_aquired = self.aquire_lock(lock, task_id)
+        if lock_aquired:
+            return self.run_locked(lock, *args, task_id=task_id, **kwargs)
+
+    def run_locked(self, lock, *args, task_id=None, **kwargs):
+        """
+        Queue the task for a lock that has already been aquired
+        """
+        try:
+            return self._send_locked(lock, *args, task_id=task_id, **kwargs)
+        except Exception:
+            # Clear the lock if apply_async fails
+            self.unlock(lock, task_id)
+            raise
+
+    def _send_locked(self, lock, *args, task_id=None, **kwargs):
+        # Send the lock along so the worker releases it without recomputing
+        kwargs["headers"] = dict(kwargs.get("headers") or {}, singleton_lock=lock)
+        return super(Singleton, self).apply_async(*args, task_id=task_id, **kwargs)
+
+    def get_request_lock(self, task_args=None, task_kwargs=None):
+        """
+        Get the lock of the currently executing task, as sent by the producer
+        in the message headers. Falls back on generating the lock from the
+        task arguments for messages sent without it.
+        """
+        lock = getattr(self.request, "singleton_lock", None)
+        if lock is None:
+            lock = (self.request.headers or {}).get("singleton_lock")
+        if lock is None:
+            lock = self.generate_lock(self.name, task_args, task_kwargs)
+        return lock
+
     def release_lock(self, task_args=None, task_kwargs=None):
         lock = self.generate_lock(self.name, task_args, task_kwargs)
-        self.unlock(lock)
+        self.unlock(lock, self.request.id)
+
+    def release_message_lock(
+        self, task_id, lock=None, task_args=None, task_kwargs=None
+    ):
+        """
+        Release the lock of a task that was revoked, rejected or lost
+        before it could finish. Uses the lock sent in the message headers
+        when given, otherwise generates it from the task arguments.
+        """
+        if lock is None:
+            lock = self.generate_lock(self.name, task_args, task_kwargs)
+        self.unlock(lock, task_id)
+        self.run_pending(lock)
+
+    def unlock(self, lock, task_id=None):
+        """
+        Remove a lock, only if it is held by `task_id` when one is given
+        """
+        if self._coalesce_window:
+            coalescer.discard(self.singleton_backend, lock)
+        if self.max_concurrency is not None:
+            self.singleton_backend.release_slot(lock, task_id=task_id)
+        elif task_id is None:
+            self.singleton_backend.unlock(lock)
+        else:
+            self.singleton_backend.unlock(lock, task_id=task_id)
+            if self._mode == "replace":
+                self.singleton_backend.unmark_started(lock, task_id)
+
+    def defer(self, lock, task_args=None, task_kwargs=None):
+        """
+        Store a duplicate call in `debounce` mode, to be queued once the
+        task holding the lock finishes. A later duplicate replaces it,
+        so at most one call is pending. Does nothing in other modes.
+        """
+        if self._mode != "debounce":
+            return
+        backend = self.singleton_backend
+        backend.set_pending(
+            lock, self._dump_call(task_args, task_kwargs), expiry=self._queue_expiry
+        )
+        # The lock may have been released before the call was stored
+        if self.max_concurrency is None:
+            if backend.get(lock) is None:
+                self.run_pending(lock)
+            return
+        task_id = uuid()
+        if self.aquire_slot(lock, task_id) is not None:
+            return
+        payload = backend.pop_pending(lock)
+        if payload is None:
+            # Already queued by the task that released its slot
+            backend.release_slot(lock, task_id=task_id)
+            return
+        call = self._load_call(payload)
+        self.run_locked(lock, args=call["args"], kwargs=call["kwargs"], task_id=task_id)
+
+    async def defer_async(self, lock, task_args=None, task_kwargs=None):
+        """
+        Asyncio variant of `defer`
+        """
+        if self._mode != "debounce":
+            return
+        backend = self.singleton_async_backend
+        await backend.set_pending(
+            lock, self._dump_call(task_args, task_kwargs), expiry=self._queue_expiry
+        )
+        # The lock may have been released before the call was stored
+        task_id = uuid()
+        if await self.aquire_lock_or_get_async(lock, task_id) is not None:
+            return
+        payload = await backend.pop_pending(lock)
+        if payload is None:
+            # Already queued by the task that released the lock
+            if self.max_concurrency is not None:
+                await backend.release_slot(lock, task_id=task_id)
+            else:
+                await backend.unlock(lock, task_id=task_id)
+            return
+        call = self._load_call(payload)
+        await self.run_locked_async(
+            lock, args=call["args"], kwargs=call["kwargs"], task_id=task_id
+        )
+
+    def run_pending(self, lock):
+        """
+        Queue the call stored by `defer` for a released lock, if any
+
+        :return: `AsyncResult` of the queued call or `None`
+        """
+        if self._mode != "debounce":
+            return None
+        payload = self.singleton_backend.pop_pending(lock)
+        if payload is None:
+            return None
+        call = self._load_call(payload)
+        return self.apply_async(args=call["args"], kwargs=call["kwargs"])
+
+    def _dump_call(self, task_args=None, task_kwargs=None):
+        # Encoded like the task message itself, args need not be JSON
+        content_type, content_encoding, body = serialization.dumps(
+            {"args": list(task_args or []), "kwargs": dict(task_kwargs or {})},
+            serializer=self.serializer,
+        )
+        if isinstance(body, str):
+            body = body.encode(content_encoding)
+        return json.dumps(
+            {
+                "content_type": content_type,
+                "content_encoding": content_encoding,
+                "body": base64.b64encode(body).decode("ascii"),
+            }
+        )
+
+    def _load_call(self, payload):
+        payload = json.loads(payload)
+        return serialization.loads(
+            base64.b64decode(payload["body"]),
+            payload["content_type"],
+            payload["content_encoding"],
+            accept=serialization.prepare_accept_content(self.app.conf.accept_content),
+        )
+
+    def rearm_lock(self, task_id, task_args=None, task_kwargs=None):
+        """
+        Switch the lock of a starting task from its `queue_expiry` to its
+        `run_expiry`. Does nothing unless either is set, or when the lock
+        is held as a lease, see `start_lease`.
+        """
+        if not self._two_phase_expiry or self._lease_timeout is not None:
+            return
+        if self.max_concurrency is not None:
+            # Semaphore slots keep the expiry they were taken with
+            return
+        lock = self.get_request_lock(task_args, task_kwargs)
+        self.singleton_backend.extend(lock, task_id, self._run_expiry)
+
+    def start_lease(self, task_id, task_args=None, task_kwargs=None):
+        """
+        Hold the lock of a starting task with a `lease_timeout` time to live,
+        renewed in the background while the task runs.
+        Does nothing unless `lease_timeout` is set.
+        """
+        timeout = self._lease_timeout
+        if timeout is None or self.max_concurrency is not None:
+            return
+        lock = self.get_request_lock(task_args, task_kwargs)
+        if self.singleton_backend.extend(lock, task_id, timeout):
+            keeper.start(self.singleton_backend, lock, task_id, timeout)
+
+    def stop_lease(self, task_id, task_args=None, task_kwargs=None, state=None):
+        """
+        Stop renewing the lock of a finished task, see `start_lease`
+        """
+        if self._lease_timeout is None and not self._two_phase_expiry:
+            return
+        if self.max_concurrency is not None:
+            return
+        lock = self.get_request_lock(task_args, task_kwargs)
+        keeper.stop(lock, task_id)
+        if state == states.RETRY:
+            # The lock stays with the task while its retry is queued
+            self.singleton_backend.extend(lock, task_id, self._queue_expiry)
+
+    def mark_started(self, task_id, task_args=None, task_kwargs=None):
+        """
+        Mark the lock of a starting task in `replace` mode as started, so
+        later calls no longer replace it. Does nothing in other modes.
+
+        :return: `False` if the task was replaced by a newer one
+        """
+        if self._mode != "replace":
+            return True
+        lock = self.get_request_lock(task_args, task_kwargs)
+        return self.singleton_backend.mark_started(lock, task_id)
 
-    def unlock(self, lock):
-        self.singleton_backend.unlock(lock)
+    def before_start(self, task_id, args, kwargs):
+        # Replaced tasks are revoked, but workers that haven't seen
+        # the revoke still receive them
+        if not self.mark_started(task_id, args, kwargs):
+            raise Ignore()
 
     def on_duplicate(self, existing_task_id):
         if self._raise_on_duplicate:
@@ -147,7 +670,11 @@ class Singleton(BaseTask):
         return self.AsyncResult(existing_task_id)
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
-        self.release_lock(task_args=args, task_kwargs=kwargs)
+        lock = self.get_request_lock(task_args=args, task_kwargs=kwargs)
+        self.unlock(lock, task_id)
+        self.run_pending(lock)
 
     def on_success(self, retval, task_id, args, kwargs):
-        self.release_lock(task_args=args, task_kwargs=kwargs)
+        lock = self.get_request_lock(task_args=args, task_kwargs=kwargs)
+        self.unlock(lock, task_id)
+        self.run_pending(lock)
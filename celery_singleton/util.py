@@ -1,5 +1,139 @@
 import json
-from hashlib import md5
+from functools import partial
+from hashlib import blake2b, md5, sha1, sha256
+from inspect import Parameter
+
+from .exceptions import InvalidUniqueOnError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+
+def encode_json(obj, json_encoder_class=None):
+    return json.dumps(obj, sort_keys=True, cls=json_encoder_class).encode()
+
+
+def iterencode_json(obj, json_encoder_class=None):
+    encoder = (json_encoder_class or json.JSONEncoder)(sort_keys=True)
+    return encoder.iterencode(obj)
+
+
+def encode_orjson(obj, json_encoder_class=None):
+    default = json_encoder_class().default if json_encoder_class else None
+    return orjson.dumps(
+        obj,
+        default=default,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+def layout_flat(key_prefix, task_name, hexdigest):
+    return key_prefix + hexdigest
+
+
+def layout_task(key_prefix, task_name, hexdigest):
+    return "{}{}:{}".format(key_prefix, task_name, hexdigest)
+
+
+def layout_hash_tag(key_prefix, task_name, hexdigest):
+    # Redis Cluster only hashes the part in braces, keeping a task's locks
+    # in one slot
+    return "{}{{{}}}:{}".format(key_prefix, task_name, hexdigest)
+
+
+DIGESTS = {
+    "md5": md5,
+    "sha1": sha1,
+    "sha256": sha256,
+    "blake2b": partial(blake2b, digest_size=16),
+}
+if xxhash is not None:
+    DIGESTS["xxhash"] = xxhash.xxh3_128
+
+ENCODERS = {"json": encode_json}
+if orjson is not None:
+    ENCODERS["orjson"] = encode_orjson
+
+KEY_LAYOUTS = {"flat": layout_flat, "task": layout_task, "hash_tag": layout_hash_tag}
+
+# Encoders able to produce their output in chunks, used when streaming
+STREAMING_ENCODERS = {encode_json: iterencode_json}
+
+# Chunks are buffered up to this many characters before hashing
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# Optional dependencies providing digests and encoders
+_EXTRAS = {"xxhash": "xxhash", "orjson": "orjson"}
+
+
+def get_digest(name_or_digest):
+    """
+    Get a hash constructor by name, callables are returned as is
+
+    :param name_or_digest: One of `DIGESTS` or a `hashlib` style constructor
+    """
+    return _lookup(DIGESTS, "digest", name_or_digest)
+
+
+def get_encoder(name_or_encoder):
+    """
+    Get a canonical encoder by name, callables are returned as is
+
+    :param name_or_encoder: One of `ENCODERS` or a function of
+        `(obj, json_encoder_class)` returning `bytes`
+    """
+    return _lookup(ENCODERS, "encoder", name_or_encoder)
+
+
+def get_key_layout(name_or_layout):
+    """
+    Get a lock key layout by name, callables are returned as is
+
+    :param name_or_layout: One of `KEY_LAYOUTS` or a function of
+        `(key_prefix, task_name, hexdigest)` returning the lock key
+    """
+    return _lookup(KEY_LAYOUTS, "key layout", name_or_layout)
+
+
+def task_key_prefix(layout, key_prefix, task_name):
+    """
+    Get the prefix shared by all lock keys of a task
+
+    :param layout: A key layout grouping keys by task, see `get_key_layout`.
+        Custom layouts must end keys with the hash.
+    :raises ValueError: For the `flat` layout, which doesn't group keys by task
+    """
+    layout = get_key_layout(layout)
+    if layout is layout_flat:
+        raise ValueError(
+            "Lock keys of the flat key layout are not grouped by task,"
+            " use the task or hash_tag layout"
+        )
+    return layout(key_prefix, task_name, "")
+
+
+def _lookup(registry, kind, name):
+    if callable(name):
+        return name
+    try:
+        return registry[name]
+    except KeyError:
+        if name in _EXTRAS:
+            raise ImportError(
+                "The {} {!r} requires the {!r} package".format(
+                    kind, name, _EXTRAS[name]
+                )
+            ) from None
+        raise ValueError(
+            "Unknown {} {!r}, expected one of {}".format(kind, name, sorted(registry))
+        ) from None
 
 
 def generate_lock(
@@ -8,9 +142,117 @@ def generate_lock(
     task_kwargs=None,
     key_prefix="SINGLETONLOCK_",
     json_encoder_class=None,
+    digest="md5",
+    encoder="json",
+    streaming=False,
+    layout="flat",
 ):
-    str_args = json.dumps(task_args or [], sort_keys=True, cls=json_encoder_class)
-    str_kwargs = json.dumps(task_kwargs or {}, sort_keys=True, cls=json_encoder_class)
-    task_hash = md5((task_name + str_args + str_kwargs).encode()).hexdigest()
-    key_prefix = key_prefix
-    return key_prefix + task_hash
+    """
+    Generate a lock key from a hash of the task name and arguments.
+
+    The name, args and kwargs are fed to the hash one after another.
+    With the default md5 digest and json encoder the key is the same as
+    `md5(task_name + json(args) + json(kwargs))`, as in previous versions.
+
+    When `streaming` is enabled and the encoder supports it, arguments
+    are encoded and hashed in chunks so the full JSON document is never
+    held in memory. The key is the same either way.
+
+    `layout` arranges the prefix, task name and hash into the key,
+    see `KEY_LAYOUTS`.
+    """
+    encoder = get_encoder(encoder)
+    task_hash = get_digest(digest)()
+    task_hash.update(task_name.encode())
+    iterencode = STREAMING_ENCODERS.get(encoder) if streaming else None
+    for obj in (task_args or [], task_kwargs or {}):
+        if iterencode is not None:
+            _hash_chunks(task_hash, iterencode(obj, json_encoder_class))
+        else:
+            task_hash.update(encoder(obj, json_encoder_class))
+    return get_key_layout(layout)(key_prefix, task_name, task_hash.hexdigest())
+
+
+def _hash_chunks(task_hash, chunks):
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_BUFFER_SIZE:
+            task_hash.update("".join(buffer).encode())
+            buffer, size = [], 0
+    if buffer:
+        task_hash.update("".join(buffer).encode())
+
+
+def unique_on_extractor(signature, unique_on):
+    """
+    Build a function mapping task args and kwargs to the values of the
+    arguments named in `unique_on`, as `inspect.Signature.bind` would
+    with defaults applied.
+
+    :param signature: Signature of the task's `run` method
+    :type signature: `inspect.Signature`
+    :param unique_on: Argument name or list of argument names
+    :type unique_on: `str` or `list`
+    :return: A function of `(args, kwargs)` returning a dict of
+        argument names to values
+    :raises InvalidUniqueOnError: When `unique_on` names an argument
+        that is not in the signature
+    """
+    if isinstance(unique_on, str):
+        unique_on = [unique_on]
+    if not any(unique_on):
+        return lambda args, kwargs: {}
+
+    missing = [name for name in unique_on if name not in signature.parameters]
+    if missing:
+        raise InvalidUniqueOnError(
+            "unique_on arguments {} are not in the task signature {}".format(
+                missing, signature
+            )
+        )
+
+    params = signature.parameters.values()
+    positional = [
+        p.name
+        for p in params
+        if p.kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD)
+    ]
+    named = {
+        p.name
+        for p in params
+        if p.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+    }
+    getters = [
+        (name, _argument_getter(signature.parameters[name], positional, named))
+        for name in unique_on
+    ]
+
+    def extract(args, kwargs):
+        return {name: getter(args, kwargs) for name, getter in getters}
+
+    return extract
+
+
+def _argument_getter(param, positional, named):
+    if param.kind is Parameter.VAR_POSITIONAL:
+        start = len(positional)
+        return lambda args, kwargs: tuple(args[start:])
+    if param.kind is Parameter.VAR_KEYWORD:
+        return lambda args, kwargs: {k: v for k, v in kwargs.items() if k not in named}
+
+    name, default = param.name, param.default
+    index = positional.index(name) if name in positional else None
+    by_keyword = param.kind is not Parameter.POSITIONAL_ONLY
+
+    def get(args, kwargs):
+        if index is not None and index < len(args):
+            return args[index]
+        if by_keyword and name in kwargs:
+            return kwargs[name]
+        if default is Parameter.empty:
+            raise TypeError("missing a required argument: {!r}".format(name))
+        return default
+
+    return get
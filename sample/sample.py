@@ -3,7 +3,7 @@ import time
 from celery import Celery
 from celery.signals import celeryd_init
 from celery_singleton import Singleton
-from celery_singleton.singleton import clear_locks
+from celery_singleton import reap_locks
 
 
 celery_app = Celery(
@@ -13,8 +13,8 @@ celery_app = Celery(
 )
 
 @celeryd_init.connect()
-def clear_all_locks(**kwargs):
-    clear_locks(celery_app)
+def reap_orphaned_locks(**kwargs):
+    reap_locks(celery_app)
 
 
 @celery_app.task(bind=True, name='lazy_return', base=Singleton)
@@ -1,11 +1,32 @@
+import asyncio
+import multiprocessing
 import pytest
+import time
 from contextlib import contextmanager
+from unittest import mock
 
 from uuid import uuid4
 from hashlib import md5
+from urllib.parse import urlparse
 from celery_singleton.backends.redis import RedisBackend
+from celery_singleton.backends.redis_async import AsyncRedisBackend
+from celery_singleton.backends.redis_cluster import RedisClusterBackend
+from celery_singleton.backends.sharded import ShardedRedisBackend
+from celery_singleton.backends.memory import InMemoryBackend
+from celery_singleton.backends import memory
+from celery_singleton.backends.sqlite import SQLiteBackend
+from celery_singleton.backends.near_cache import NearCacheBackend
 from celery_singleton.backends import get_backend
 from celery_singleton import backends
+from celery_singleton.config import Config
+from celery import Celery
+from redis import Redis
+from redis.cluster import (
+    PRIMARY,
+    REDIS_CLUSTER_HASH_SLOTS,
+    ClusterNode,
+    NodesManager,
+)
 
 
 def random_hash():
@@ -28,7 +49,7 @@ def backend(redis_url):
         yield backend
     finally:
         backend.redis.flushall()
-        backends._backend = None
+        backends.clear_backend_cache()
 
 
 class TestLock:
@@ -71,6 +92,83 @@ class TestLock:
             assert b.lock(lock, task_id2) is False
 
 
+class TestLockOrGet:
+    def test__new_lock__returns_none(self, backend):
+        with backend as b:
+            lock = random_hash()
+            task_id = random_task_id()
+
+            assert b.lock_or_get(lock, task_id) is None
+            assert b.redis.get(lock) == task_id
+
+    def test__lock_exists__returns_existing_task_id(self, backend):
+        with backend as b:
+            lock = random_hash()
+            task_id = random_task_id()
+
+            b.lock(lock, task_id)
+
+            assert b.lock_or_get(lock, random_task_id()) == task_id
+            assert b.redis.get(lock) == task_id
+
+    def test__expiry__is_set(self, backend):
+        with backend as b:
+            lock = random_hash()
+
+            b.lock_or_get(lock, random_task_id(), expiry=60)
+
+            assert 0 < b.redis.ttl(lock) <= 60
+
+    def test__no_expiry__never_expires(self, backend):
+        with backend as b:
+            lock = random_hash()
+
+            b.lock_or_get(lock, random_task_id())
+
+            assert b.redis.ttl(lock) == -1
+
+
+class TestLockMany:
+    def test__new_locks__all_aquired(self, backend):
+        with backend as b:
+            locks = [random_hash() for i in range(5)]
+            task_ids = [random_task_id() for i in range(5)]
+
+            assert b.lock_many(locks, task_ids) == [None] * 5
+            assert b.get_many(locks) == task_ids
+
+    def test__existing_locks__return_holders_in_order(self, backend):
+        with backend as b:
+            locks = [random_hash() for i in range(3)]
+            existing = random_task_id()
+            b.lock(locks[1], existing)
+
+            result = b.lock_many(locks, [random_task_id() for i in range(3)])
+
+            assert result == [None, existing, None]
+
+    def test__repeated_lock__later_entries_get_first_task_id(self, backend):
+        with backend as b:
+            lock = random_hash()
+            task_ids = [random_task_id(), random_task_id()]
+
+            assert b.lock_many([lock, lock], task_ids) == [None, task_ids[0]]
+
+
+class TestGetMany:
+    def test__missing_locks__none(self, backend):
+        with backend as b:
+            lock = random_hash()
+            task_id = random_task_id()
+            b.lock(lock, task_id)
+
+            assert b.get_many([random_hash(), lock]) == [None, task_id]
+
+    def test__no_locks__empty_list(self, backend):
+        with backend as b:
+            assert b.get_many([]) == []
+
+
 class TestUnlock:
     def test__unlock__deletes_key(self, backend):
         with backend as b:
@@ -82,6 +180,183 @@ class TestUnlock:
 
             assert b.redis.get(lock) is None
 
+    def test__unlock__owner_only(self, backend):
+        with backend as b:
+            lock = random_hash()
+            task_id = random_task_id()
+            b.lock(lock, task_id)
+
+            assert b.unlock(lock, task_id=random_task_id()) is False
+            assert b.get(lock) == task_id
+
+            assert b.unlock(lock, task_id=task_id) is True
+            assert b.get(lock) is None
+            assert b.unlock(lock) is False
+
+
+class TestExtend:
+    def test__owner__ttl_set(self, backend):
+        with backend as b:
+            lock, task_id = random_hash(), random_task_id()
+            b.lock(lock, task_id)
+
+            assert b.extend(lock, task_id, 30) is True
+            assert 0 < b.redis.pttl(lock) <= 30000
+
+    def test__no_expiry__persisted(self, backend):
+        with backend as b:
+            lock, task_id = random_hash(), random_task_id()
+            b.lock(lock, task_id, expiry=60)
+
+            assert b.extend(lock, task_id) is True
+            assert b.redis.ttl(lock) == -1
+
+    def test__other_owner__not_extended(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.lock(lock, "other", expiry=60)
+
+            assert b.extend(lock, random_task_id(), 600) is False
+            assert b.extend(random_hash(), random_task_id(), 600) is False
+            assert b.redis.ttl(lock) <= 60
+
+
+class TestPending:
+    def test__set_and_pop(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.set_pending(lock, "first")
+            b.set_pending(lock, "second", expiry=60)
+
+            assert 0 < b.redis.ttl(lock + ":pending") <= 60
+            assert b.pop_pending(lock) == "second"
+            assert b.pop_pending(lock) is None
+
+    def test__lock_untouched(self, backend):
+        with backend as b:
+            lock, task_id = random_hash(), random_task_id()
+            b.lock(lock, task_id)
+            b.set_pending(lock, "call")
+
+            assert b.get(lock) == task_id
+            b.unlock(lock, task_id)
+            assert b.pop_pending(lock) == "call"
+
+
+class TestReplace:
+    def test__free_lock__aquired(self, backend):
+        with backend as b:
+            lock, task_id = random_hash(), random_task_id()
+
+            assert b.lock_or_replace(lock, task_id, expiry=60) == (None, False)
+            assert b.get(lock) == task_id
+            assert 0 < b.redis.ttl(lock) <= 60
+
+    def test__queued_holder__replaced(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.lock(lock, "old")
+
+            assert b.lock_or_replace(lock, "new") == ("old", True)
+            assert b.get(lock) == "new"
+
+    def test__started_holder__kept(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.lock(lock, "old")
+
+            assert b.mark_started(lock, "old") is True
+            assert b.lock_or_replace(lock, "new") == ("old", False)
+            assert b.get(lock) == "old"
+
+    def test__mark_started__other_holder(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.lock(lock, "new")
+
+            assert b.mark_started(lock, "old") is False
+            assert b.mark_started(random_hash(), "old") is True
+            assert b.lock_or_replace(lock, "newer") == ("new", True)
+
+    def test__unmark_started(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.lock(lock, "old")
+            b.mark_started(lock, "old")
+            b.unmark_started(lock, "other")
+            assert b.lock_or_replace(lock, "new") == ("old", False)
+
+            b.unmark_started(lock, "old")
+            assert b.lock_or_replace(lock, "new") == ("old", True)
+
+    def test__started_mark__expires_with_lock(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.lock(lock, "old", expiry=60)
+            b.mark_started(lock, "old")
+            assert 0 < b.redis.pttl(lock + ":started") <= 60000
+
+            assert b.extend(lock, "old", 600) is True
+            assert 60000 < b.redis.pttl(lock + ":started") <= 600000
+            assert b.extend(lock, "old") is True
+            assert b.redis.ttl(lock + ":started") == -1
+
+
+class TestSemaphore:
+    def test__slots_up_to_limit(self, backend):
+        with backend as b:
+            lock = random_hash()
+
+            assert b.acquire_slot(lock, "a", 2, expiry=60) is None
+            assert b.acquire_slot(lock, "b", 2, expiry=30) is None
+            assert b.acquire_slot(lock, "c", 2) == "b"
+            assert b.acquire_slot(lock, "a", 2) is None
+            assert b.redis.zcard(lock) == 2
+
+    def test__release(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.acquire_slot(lock, "a", 1)
+            b.release_slot(lock, "other")
+            assert b.acquire_slot(lock, "b", 1) == "a"
+
+            b.release_slot(lock, "a")
+            assert b.acquire_slot(lock, "b", 1) is None
+            b.release_slot(lock)
+            assert not b.redis.exists(lock)
+
+    def test__expired_slots_freed(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.acquire_slot(lock, "a", 1, expiry=0.05)
+            time.sleep(0.1)
+
+            assert b.acquire_slot(lock, "b", 1) is None
+
+    def test__key_expires_with_last_slot(self, backend):
+        with backend as b:
+            lock = random_hash()
+            b.acquire_slot(lock, "a", 2, expiry=10)
+            b.acquire_slot(lock, "b", 2, expiry=60)
+            assert 10 < b.redis.ttl(lock) <= 60
+
+            b.acquire_slot(lock, "b", 2)
+            assert b.redis.ttl(lock) == -1
+
+
+class TestIterLocks:
+    def test__batches_of_prefix(self, backend):
+        with backend as b:
+            locks = {random_hash(): random_task_id() for i in range(10)}
+            for lock, task_id in locks.items():
+                b.lock(lock, task_id)
+            b.lock("OTHER_KEY", random_task_id())
+
+            batches = list(b.iter_locks("SINGLETON_TEST_KEY_PREFIX_", batch_size=3))
+
+            assert len(batches) > 1
+            assert dict(pair for batch in batches for pair in batch) == locks
+
 
 class TestClear:
     def test__clear_locks__all_gone(self, backend):
@@ -97,6 +372,846 @@ class TestClear:
             for lock in locks:
                 assert b.get(lock) is None
 
+    def test__clear_locks__returns_removed_count(self, backend):
+        with backend as b:
+            for i in range(25):
+                b.lock(random_hash(), random_task_id())
+
+            assert b.clear("SINGLETON_TEST_KEY_PREFIX_") == 25
+            assert b.clear("SINGLETON_TEST_KEY_PREFIX_") == 0
+
+    def test__clear_locks__small_scan_count__all_gone(self, redis_url):
+        b = RedisBackend(redis_url, scan_count=3)
+        try:
+            locks = [random_hash() for i in range(20)]
+            for lock in locks:
+                b.lock(lock, random_task_id())
+            b.lock("OTHER_PREFIX_" + random_hash(), random_task_id())
+
+            assert b.clear("SINGLETON_TEST_KEY_PREFIX_") == 20
+            assert b.get_many(locks) == [None] * 20
+            assert len(b.redis.keys("OTHER_PREFIX_*")) == 1
+        finally:
+            b.redis.flushall()
+
+
+@pytest.fixture
+def async_backend(redis_url):
+    async def run(coro_fn):
+        backend = AsyncRedisBackend(redis_url)
+        try:
+            return await coro_fn(backend)
+        finally:
+            await backend.redis.flushall()
+            await backend.redis.aclose()
+
+    return lambda coro_fn: asyncio.run(run(coro_fn))
+
+
+class TestAsyncRedisBackend:
+    def test__lock_or_get__new_lock(self, async_backend):
+        lock, task_id = random_hash(), random_task_id()
+
+        async def test(b):
+            assert await b.lock_or_get(lock, task_id) is None
+            assert await b.get(lock) == task_id
+
+        async_backend(test)
+
+    def test__lock_or_get__existing_lock(self, async_backend):
+        lock, task_id = random_hash(), random_task_id()
+
+        async def test(b):
+            assert await b.lock(lock, task_id, expiry=60) is True
+            assert await b.lock(lock, random_task_id()) is False
+            assert await b.lock_or_get(lock, random_task_id()) == task_id
+            assert 0 < await b.redis.ttl(lock) <= 60
+
+        async_backend(test)
+
+    def test__unlock(self, async_backend):
+        lock, task_id = random_hash(), random_task_id()
+
+        async def test(b):
+            await b.lock(lock, task_id)
+            assert await b.unlock(lock, task_id=random_task_id()) is False
+            assert await b.get(lock) == task_id
+            assert await b.unlock(lock, task_id=task_id) is True
+            assert await b.get(lock) is None
+
+        async_backend(test)
+
+    def test__set_and_pop_pending(self, async_backend):
+        lock = random_hash()
+
+        async def test(b):
+            await b.set_pending(lock, "first")
+            await b.set_pending(lock, "second", expiry=60)
+            assert 0 < await b.redis.ttl(lock + ":pending") <= 60
+            assert await b.pop_pending(lock) == "second"
+            assert await b.pop_pending(lock) is None
+
+        async_backend(test)
+
+    def test__lock_or_replace(self, async_backend):
+        lock = random_hash()
+
+        async def test(b):
+            assert await b.lock_or_replace(lock, "old") == (None, False)
+            assert await b.lock_or_replace(lock, "new") == ("old", True)
+            await b.redis.set(lock + ":started", "new")
+            assert await b.lock_or_replace(lock, "newer") == ("new", False)
+
+        async_backend(test)
+
+    def test__acquire_and_release_slot(self, async_backend):
+        lock = random_hash()
+
+        async def test(b):
+            assert await b.acquire_slot(lock, "a", 2, expiry=60) is None
+            assert await b.acquire_slot(lock, "b", 2) is None
+            assert await b.acquire_slot(lock, "c", 2) == "a"
+            await b.release_slot(lock, task_id="a")
+            assert await b.acquire_slot(lock, "c", 2) is None
+            await b.release_slot(lock)
+            assert await b.redis.exists(lock) == 0
+
+        async_backend(test)
+
+    def test__clear(self, async_backend):
+        locks = [random_hash() for i in range(10)]
+
+        async def test(b):
+            b.scan_count = 3
+            for lock in locks:
+                await b.lock(lock, random_task_id())
+            assert await b.clear("SINGLETON_TEST_KEY_PREFIX_") == 10
+            for lock in locks:
+                assert await b.get(lock) is None
+
+        async_backend(test)
+
+
+@pytest.fixture
+def cluster_backend(redis_url):
+    # Two databases of the test server stand in for the cluster's primaries
+    nodes = [Redis.from_url(redis_url, db=db, decode_responses=True) for db in (1, 2)]
+    backend = RedisClusterBackend.__new__(RedisClusterBackend)
+    backend.scan_count = 3
+    backend.max_workers = None
+    backend.redis = mock.Mock()
+    backend.redis.get_primaries.return_value = nodes
+    backend.redis.get_redis_connection.side_effect = lambda node: node
+    try:
+        yield backend
+    finally:
+        for node in nodes:
+            node.flushdb()
+
+
+@pytest.fixture
+def one_node_cluster_backend(redis_url):
+    # A real cluster client, its slots all served by the test server
+    url = urlparse(redis_url)
+
+    def initialize(self, *args, **kwargs):
+        node = ClusterNode(url.hostname, url.port or 6379, PRIMARY)
+        self.create_redis_connections([node])
+        self.nodes_cache = {node.name: node}
+        self.slots_cache = {slot: [node] for slot in range(REDIS_CLUSTER_HASH_SLOTS)}
+        self.default_node = node
+
+    with mock.patch.object(NodesManager, "initialize", initialize):
+        backend = RedisClusterBackend(redis_url)
+        try:
+            yield backend
+        finally:
+            backend.redis.flushall()
+
+
+class TestRedisClusterBackend:
+    def test__clear__all_primaries(self, cluster_backend):
+        nodes = cluster_backend.redis.get_primaries()
+        for i in range(5):
+            nodes[0].set("SINGLETON_TEST_KEY_PREFIX_{a}:%d" % i, "x")
+            nodes[1].set("SINGLETON_TEST_KEY_PREFIX_{b}:%d" % i, "x")
+        nodes[1].set("OTHER_KEY", "x")
+
+        assert cluster_backend.clear("SINGLETON_TEST_KEY_PREFIX_") == 10
+
+        assert nodes[0].dbsize() == 0
+        assert nodes[1].keys() == ["OTHER_KEY"]
+
+    def test__iter_locks__all_primaries(self, cluster_backend):
+        nodes = cluster_backend.redis.get_primaries()
+        nodes[0].set("SINGLETON_TEST_KEY_PREFIX_{a}:1", "x")
+        nodes[1].set("SINGLETON_TEST_KEY_PREFIX_{b}:1", "y")
+
+        batches = cluster_backend.iter_locks("SINGLETON_TEST_KEY_PREFIX_")
+
+        assert sorted(pair for batch in batches for pair in batch) == [
+            ("SINGLETON_TEST_KEY_PREFIX_{a}:1", "x"),
+            ("SINGLETON_TEST_KEY_PREFIX_{b}:1", "y"),
+        ]
+
+    def test__clear__hash_tagged_prefix__one_node(self, cluster_backend):
+        nodes = cluster_backend.redis.get_primaries()
+        cluster_backend.redis.get_node_from_key.return_value = nodes[1]
+        nodes[0].set("SINGLETON_TEST_KEY_PREFIX_{a}:1", "x")
+        nodes[1].set("SINGLETON_TEST_KEY_PREFIX_{a}:2", "x")
+
+        assert cluster_backend.clear("SINGLETON_TEST_KEY_PREFIX_{a}:") == 1
+
+        cluster_backend.redis.get_node_from_key.assert_called_once_with(
+            "SINGLETON_TEST_KEY_PREFIX_{a}:"
+        )
+
+    def test__clear__no_keys(self, cluster_backend):
+        assert cluster_backend.clear("SINGLETON_TEST_KEY_PREFIX_") == 0
+
+    def test__lock_many(self, one_node_cluster_backend):
+        b = one_node_cluster_backend
+        locks = [random_hash(), random_hash()]
+        b.lock_many(locks[:1], ["a"])
+
+        assert b.lock_many(locks, ["b", "c"], expiry=60) == ["a", None]
+        assert b.lock_many([locks[1], locks[1]], ["d", "e"]) == ["c", "c"]
+        assert b.get(locks[1]) == "c"
+        assert 0 < b.redis.ttl(locks[1]) <= 60
+
+    def test__extend__lock_and_started_mark(self, one_node_cluster_backend):
+        b = one_node_cluster_backend
+        lock = "SINGLETON_TEST_KEY_PREFIX_{a}:1"
+        b.lock(lock, "a", expiry=60)
+        b.mark_started(lock, "a")
+
+        assert b.extend(lock, "a", 600) is True
+        assert 60 < b.redis.ttl(lock) <= 600
+        assert 60 < b.redis.ttl(lock + ":started") <= 600
+        assert b.extend(lock, "other", 600) is False
+
+
+@pytest.fixture
+def shard_urls(redis_url):
+    return ["{}/{}".format(redis_url.rstrip("/"), db) for db in (1, 2, 3)]
+
+
+@pytest.fixture
+def sharded_backend(shard_urls):
+    backend = ShardedRedisBackend(",".join(shard_urls))
+    try:
+        yield backend
+    finally:
+        for shard in backend.shards:
+            shard.redis.flushdb()
+
+
+class TestShardedRedisBackend:
+    def test__replace__on_lock_shard(self, sharded_backend):
+        lock = random_hash()
+        sharded_backend.lock(lock, "old")
+        sharded_backend.mark_started(lock, "old")
+
+        assert sharded_backend.shard(lock).redis.get(lock + ":started") == "old"
+        sharded_backend.unmark_started(lock, "old")
+        assert sharded_backend.lock_or_replace(lock, "new") == ("old", True)
+
+    def test__semaphore__on_lock_shard(self, sharded_backend):
+        lock = random_hash()
+        sharded_backend.acquire_slot(lock, "a", 1)
+
+        assert sharded_backend.shard(lock).redis.zrange(lock, 0, -1) == ["a"]
+        assert sharded_backend.acquire_slot(lock, "b", 1) == "a"
+        sharded_backend.release_slot(lock, "a")
+        assert sharded_backend.acquire_slot(lock, "b", 1) is None
+
+    def test__pending__stored_on_lock_shard(self, sharded_backend):
+        lock = random_hash()
+        sharded_backend.set_pending(lock, "call")
+
+        assert sharded_backend.shard(lock).redis.get(lock + ":pending") == "call"
+        assert sharded_backend.pop_pending(lock) == "call"
+
+    def test__lock_stored_on_its_shard_only(self, sharded_backend):
+        lock = random_hash()
+        assert sharded_backend.lock_or_get(lock, "a") is None
+
+        owner = sharded_backend.shard(lock)
+        assert owner.get(lock) == "a"
+        assert [s.get(lock) for s in sharded_backend.shards].count("a") == 1
+        assert sharded_backend.get(lock) == "a"
+        assert sharded_backend.lock_or_get(lock, "b") == "a"
+        sharded_backend.unlock(lock)
+        assert sharded_backend.get(lock) is None
+
+    def test__spreads_locks_over_shards(self, sharded_backend):
+        owners = {sharded_backend.shard(random_hash()) for _ in range(200)}
+        assert len(owners) == 3
+
+    def test__lock_many__keeps_order(self, sharded_backend):
+        locks = [random_hash() for _ in range(20)]
+        sharded_backend.lock_many(locks[::2], ["held"] * 10)
+
+        task_ids = [str(i) for i in range(21)]
+        result = sharded_backend.lock_many(locks + locks[1:2], task_ids)
+
+        assert result[:20:2] == ["held"] * 10
+        assert result[1:20:2] == [None] * 10
+        assert result[20] == "1"
+        assert sharded_backend.get_many(locks) == [
+            "held" if i % 2 == 0 else str(i) for i in range(20)
+        ]
+
+    def test__clear__all_shards(self, sharded_backend):
+        for _ in range(30):
+            sharded_backend.lock(random_hash(), "a")
+        assert sharded_backend.clear("SINGLETON_TEST_KEY_PREFIX_") == 30
+        assert all(s.redis.dbsize() == 0 for s in sharded_backend.shards)
+
+    def test__adding_shard__only_moves_keys_to_new_shard(self, shard_urls):
+        backend = ShardedRedisBackend(shard_urls[:2])
+        grown = ShardedRedisBackend(shard_urls)
+        locks = [random_hash() for _ in range(2000)]
+
+        moved = 0
+        for lock in locks:
+            before = backend.shard(lock).redis.connection_pool.connection_kwargs
+            after = grown.shard(lock).redis.connection_pool.connection_kwargs
+            if before["db"] != after["db"]:
+                assert after["db"] == 3
+                moved += 1
+        assert 0.2 < moved / len(locks) < 0.45
+
+    def test__iter_locks__all_shards(self, sharded_backend):
+        locks = {random_hash(): random_task_id() for i in range(20)}
+        for lock, task_id in locks.items():
+            sharded_backend.lock(lock, task_id)
+
+        batches = sharded_backend.iter_locks("SINGLETON_TEST_KEY_PREFIX_")
+
+        assert dict(pair for batch in batches for pair in batch) == locks
+
+    def test__requires_urls(self):
+        with pytest.raises(ValueError):
+            ShardedRedisBackend("")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(memory.time, "monotonic", clock)
+    return clock
+
+
+class TestInMemoryBackend:
+    def test__lock__new_and_existing(self):
+        b = InMemoryBackend("ignored url")
+        lock, task_id = random_hash(), random_task_id()
+
+        assert b.lock(lock, task_id) is True
+        assert b.lock(lock, random_task_id()) is False
+        assert b.get(lock) == task_id
+
+    def test__pending(self, clock):
+        b = InMemoryBackend()
+        lock = random_hash()
+        b.set_pending(lock, "first")
+        b.set_pending(lock, "second", expiry=10)
+
+        assert b.pop_pending(lock) == "second"
+        assert b.pop_pending(lock) is None
+        b.set_pending(lock, "expired", expiry=10)
+        clock.now += 10
+        assert b.pop_pending(lock) is None
+
+    def test__lock_or_replace(self):
+        b = InMemoryBackend()
+        lock = random_hash()
+
+        assert b.lock_or_replace(lock, "old") == (None, False)
+        assert b.lock_or_replace(lock, "new") == ("old", True)
+        assert b.mark_started(lock, "old") is False
+        assert b.mark_started(lock, "new") is True
+        assert b.lock_or_replace(lock, "newer") == ("new", False)
+        b.unlock(lock, "new")
+        b.unmark_started(lock, "new")
+        assert b.lock_or_replace(lock, "newer") == (None, False)
+
+    def test__semaphore(self, clock):
+        b = InMemoryBackend()
+        lock = random_hash()
+
+        assert b.acquire_slot(lock, "a", 2) is None
+        assert b.acquire_slot(lock, "b", 2, expiry=10) is None
+        assert b.acquire_slot(lock, "c", 2) == "b"
+        clock.now += 10
+        assert b.acquire_slot(lock, "c", 2) is None
+        b.release_slot(lock, "a")
+        b.release_slot(lock, "c")
+        assert lock not in b._slots
+        b.acquire_slot(lock, "d", 1)
+        assert b.clear("SINGLETON_TEST_KEY_PREFIX") == 1
+
+    def test__lock_or_get(self):
+        b = InMemoryBackend()
+        lock, task_id = random_hash(), random_task_id()
+
+        assert b.lock_or_get(lock, task_id) is None
+        assert b.lock_or_get(lock, random_task_id()) == task_id
+
+    def test__lock_many__in_order(self):
+        b = InMemoryBackend()
+        locks = [random_hash(), random_hash()]
+        task_ids = [random_task_id() for i in range(3)]
+        b.lock(locks[1], "existing")
+
+        result = b.lock_many([locks[0], locks[1], locks[0]], task_ids)
+
+        assert result == [None, "existing", task_ids[0]]
+        assert b.get_many(locks + [random_hash()]) == [task_ids[0], "existing", None]
+
+    def test__unlock(self):
+        b = InMemoryBackend()
+        lock = random_hash()
+        b.lock(lock, random_task_id())
+
+        b.unlock(lock)
+        b.unlock(lock)
+
+        assert b.get(lock) is None
+
+    def test__unlock__owner_only(self):
+        b = InMemoryBackend()
+        lock, task_id = random_hash(), random_task_id()
+        b.lock(lock, task_id)
+
+        assert b.unlock(lock, task_id="other") is False
+        assert b.get(lock) == task_id
+        assert b.unlock(lock, task_id=task_id) is True
+        assert b.get(lock) is None
+        assert b.lock(lock, random_task_id()) is True
+
+    def test__expiry__lock_removed(self, clock):
+        b = InMemoryBackend()
+        lock = random_hash()
+        b.lock(lock, random_task_id(), expiry=10)
+
+        clock.now += 9
+        assert b.get(lock) is not None
+        clock.now += 1
+        assert b.get(lock) is None
+        assert b._keys == []
+
+    def test__expiry__relocked_lock_keeps_new_expiry(self, clock):
+        b = InMemoryBackend()
+        lock = random_hash()
+        b.lock(lock, random_task_id(), expiry=10)
+        b.unlock(lock)
+        task_id = random_task_id()
+        b.lock(lock, task_id, expiry=20)
+
+        clock.now += 15
+
+        assert b.get(lock) == task_id
+
+    def test__extend__owner_only(self, clock):
+        b = InMemoryBackend()
+        lock, task_id = random_hash(), random_task_id()
+        b.lock(lock, task_id, expiry=10)
+
+        assert b.extend(lock, "other", 100) is False
+        assert b.extend(lock, task_id, 100) is True
+        clock.now += 50
+        assert b.get(lock) == task_id
+        clock.now += 50
+        assert b.get(lock) is None
+        assert b.extend(lock, task_id, 100) is False
+
+    def test__started_mark__expires_with_lock(self, clock):
+        b = InMemoryBackend()
+        lock = random_hash()
+        b.lock(lock, "old", expiry=10)
+        b.mark_started(lock, "old")
+        clock.now += 10
+
+        assert b.get(lock + ":started") is None
+
+        b.lock(lock, "old", expiry=10)
+        b.mark_started(lock, "old")
+        b.extend(lock, "old", 100)
+        clock.now += 50
+        assert b.get(lock + ":started") == "old"
+        clock.now += 50
+        assert b.get(lock + ":started") is None
+
+    def test__iter_locks__prefix_in_batches(self, clock):
+        b = InMemoryBackend()
+        locks = sorted(random_hash() for i in range(5))
+        for lock in locks:
+            b.lock(lock, "a")
+        b.lock(random_hash(), "expired", expiry=1)
+        b.lock("OTHER_KEY", "b")
+        clock.now += 1
+
+        batches = list(b.iter_locks("SINGLETON_TEST_KEY_PREFIX_", batch_size=2))
+
+        assert batches == [
+            [(locks[0], "a"), (locks[1], "a")],
+            [(locks[2], "a"), (locks[3], "a")],
+            [(locks[4], "a")],
+        ]
+
+    def test__expiry__stale_heap_entries_compacted(self, clock):
+        b = InMemoryBackend()
+        for i in range(200):
+            lock = random_hash()
+            b.lock(lock, random_task_id(), expiry=10)
+            b.unlock(lock)
+
+        b.get(random_hash())
+
+        assert len(b._expiries) <= 64
+
+    def test__clear__only_prefix(self):
+        b = InMemoryBackend()
+        locks = [random_hash() for i in range(10)]
+        for lock in locks:
+            b.lock(lock, random_task_id())
+        b.lock("OTHER_PREFIX_1", random_task_id())
+        b.lock("A_BEFORE", random_task_id())
+
+        assert b.clear("SINGLETON_TEST_KEY_PREFIX_") == 10
+        assert b.get_many(locks) == [None] * 10
+        assert b.get("OTHER_PREFIX_1") is not None
+        assert b.get("A_BEFORE") is not None
+        assert b._keys == ["A_BEFORE", "OTHER_PREFIX_1"]
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return "sqlite:///" + str(tmp_path / "singleton.db")
+
+
+def _contend(url, lock, results):
+    results.put(SQLiteBackend(url).lock_or_get(lock, random_task_id()))
+
+
+class TestSQLiteBackend:
+    def test__lock__new_and_existing(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock, task_id = random_hash(), random_task_id()
+
+        assert b.lock(lock, task_id) is True
+        assert b.lock(lock, random_task_id()) is False
+        assert b.get(lock) == task_id
+
+    def test__extend__owner_only(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock, task_id = random_hash(), random_task_id()
+        b.lock(lock, task_id, expiry=10)
+
+        assert b.extend(lock, "other", 100) is False
+        assert b.extend(lock, task_id) is True
+        assert b.connection.execute(
+            "SELECT expires_at FROM singleton_locks WHERE lock = ?", (lock,)
+        ).fetchone() == (None,)
+
+    def test__started_mark__expires_with_lock(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+        b.lock(lock, "old", expiry=10)
+        b.mark_started(lock, "old")
+        b.extend(lock, "old", 100)
+
+        expiries = b.connection.execute(
+            "SELECT expires_at FROM singleton_locks WHERE lock IN (?, ?)",
+            (lock, lock + ":started"),
+        ).fetchall()
+        assert len(expiries) == 2
+        assert expiries[0] == expiries[1]
+        assert expiries[0][0] > time.time() + 10
+
+    def test__pending(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+        b.set_pending(lock, "first")
+        b.set_pending(lock, "second")
+
+        assert b.pop_pending(lock) == "second"
+        assert b.pop_pending(lock) is None
+        b.set_pending(lock, "expired", expiry=-1)
+        assert b.pop_pending(lock) is None
+
+    def test__lock_or_replace(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+
+        assert b.lock_or_replace(lock, "old") == (None, False)
+        assert b.lock_or_replace(lock, "new") == ("old", True)
+        assert b.mark_started(lock, "old") is False
+        assert b.mark_started(lock, "new") is True
+        assert b.lock_or_replace(lock, "newer") == ("new", False)
+        b.unlock(lock, "new")
+        b.unmark_started(lock, "new")
+        assert b.lock_or_replace(lock, "newer") == (None, False)
+
+    def test__semaphore(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+
+        assert b.acquire_slot(lock, "a", 2) is None
+        assert b.acquire_slot(lock, "b", 2, expiry=30) is None
+        assert b.acquire_slot(lock, "c", 2) == "b"
+        b.release_slot(lock, "a")
+        assert b.acquire_slot(lock, "c", 2) is None
+        assert b.clear("SINGLETON_TEST_KEY_PREFIX") == 1
+        assert b.acquire_slot(lock, "d", 1) is None
+
+    def test__semaphore__expired_slots_freed(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+        b.acquire_slot(lock, "a", 1, expiry=-1)
+
+        assert b.acquire_slot(lock, "b", 1) is None
+
+    def test__iter_locks__prefix_in_batches(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        locks = sorted(random_hash() for i in range(5))
+        for lock in locks:
+            b.lock(lock, "a")
+        b.lock("SINGLETON_TEST_KEY_PREFIX`", "b")
+        b.lock("OTHER_KEY", "b")
+
+        batches = list(b.iter_locks("SINGLETON_TEST_KEY_PREFIX_", batch_size=2))
+
+        assert batches == [
+            [(locks[0], "a"), (locks[1], "a")],
+            [(locks[2], "a"), (locks[3], "a")],
+            [(locks[4], "a")],
+        ]
+
+    def test__lock_or_get__shared_between_instances(self, sqlite_url):
+        b1, b2 = SQLiteBackend(sqlite_url), SQLiteBackend(sqlite_url)
+        lock, task_id = random_hash(), random_task_id()
+
+        assert b1.lock_or_get(lock, task_id) is None
+        assert b2.lock_or_get(lock, random_task_id()) == task_id
+
+    def test__lock_or_get__one_winner_across_processes(self, sqlite_url):
+        SQLiteBackend(sqlite_url)
+        lock = random_hash()
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(target=_contend, args=(sqlite_url, lock, results))
+            for i in range(4)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        outcomes = [results.get() for p in procs]
+        assert outcomes.count(None) == 1
+        assert len(set(outcomes) - {None}) == 1
+
+    def test__lock_many__in_order(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        locks = [random_hash(), random_hash()]
+        task_ids = [random_task_id() for i in range(3)]
+        b.lock(locks[1], "existing")
+
+        result = b.lock_many([locks[0], locks[1], locks[0]], task_ids)
+
+        assert result == [None, "existing", task_ids[0]]
+        assert b.get_many(locks + [random_hash()]) == [task_ids[0], "existing", None]
+
+    def test__get_many__more_than_max_params(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        locks = [random_hash() for i in range(2000)]
+        task_ids = [random_task_id() for i in range(2000)]
+        b.lock_many(locks, task_ids)
+
+        assert b.get_many(locks) == task_ids
+
+    def test__unlock(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+        b.lock(lock, random_task_id())
+
+        b.unlock(lock)
+
+        assert b.get(lock) is None
+        assert b.lock(lock, random_task_id()) is True
+
+    def test__unlock__owner_only(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        lock, task_id = random_hash(), random_task_id()
+        b.lock(lock, task_id)
+
+        assert b.unlock(lock, task_id="other") is False
+        assert b.get(lock) == task_id
+        assert b.unlock(lock, task_id=task_id) is True
+        assert b.get(lock) is None
+
+    def test__expiry(self, sqlite_url, monkeypatch):
+        b = SQLiteBackend(sqlite_url)
+        lock = random_hash()
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        b.lock(lock, random_task_id(), expiry=10)
+
+        now += 10
+        assert b.get(lock) is None
+        task_id = random_task_id()
+        assert b.lock_or_get(lock, task_id) is None
+        assert b.get(lock) == task_id
+
+    def test__purge_expired(self, sqlite_url, monkeypatch):
+        b = SQLiteBackend(sqlite_url, purge_interval=3)
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        b.lock(random_hash(), random_task_id(), expiry=10)
+        b.lock(random_hash(), random_task_id())
+
+        now += 10
+        b.lock(random_hash(), random_task_id())  # Third write purges
+
+        count = b.connection.execute("SELECT count(*) FROM singleton_locks")
+        assert count.fetchone()[0] == 2
+
+    def test__clear__only_prefix(self, sqlite_url):
+        b = SQLiteBackend(sqlite_url)
+        locks = [random_hash() for i in range(10)]
+        for lock in locks:
+            b.lock(lock, random_task_id())
+        b.lock("SINGLETON_TEST_KEY_PREFIX", random_task_id())
+        b.lock("SINGLETON_TEST_KEY_PREFIX`", random_task_id())
+
+        assert b.clear("SINGLETON_TEST_KEY_PREFIX_") == 10
+        assert b.get_many(locks) == [None] * 10
+        assert b.get("SINGLETON_TEST_KEY_PREFIX") is not None
+        assert b.get("SINGLETON_TEST_KEY_PREFIX`") is not None
+        assert b.clear("") == 2
+
+
+@pytest.fixture
+def near_cache():
+    b = NearCacheBackend(backend_class=InMemoryBackend, ttl=5, max_size=3)
+    b.backend = mock.Mock(wraps=b.backend)
+    return b
+
+
+class TestNearCacheBackend:
+    def test__duplicate_answered_from_cache(self, near_cache):
+        lock = random_hash()
+        assert near_cache.lock_or_get(lock, "a") is None
+        assert near_cache.lock_or_get(lock, "b") == "a"
+        assert near_cache.lock(lock, "c") is False
+        assert near_cache.get(lock) == "a"
+        near_cache.backend.lock_or_get.assert_called_once_with(lock, "a", expiry=None)
+        near_cache.backend.lock.assert_not_called()
+        near_cache.backend.get.assert_not_called()
+
+    def test__entry_expires_after_ttl(self, near_cache, clock):
+        lock = random_hash()
+        near_cache.lock_or_get(lock, "a")
+        clock.now += 5
+
+        assert near_cache.lock_or_get(lock, "b") == "a"
+        assert near_cache.backend.lock_or_get.call_count == 2
+
+    def test__entry_expires_with_lock(self, near_cache, clock):
+        lock = random_hash()
+        near_cache.lock_or_get(lock, "a", expiry=2)
+        clock.now += 2
+
+        assert near_cache.lock_or_get(lock, "b") is None
+        assert near_cache.backend.lock_or_get.call_count == 2
+
+    def test__least_recently_used_dropped(self, near_cache):
+        locks = [random_hash() for i in range(4)]
+        for lock in locks[:3]:
+            near_cache.lock(lock, "a")
+        near_cache.get(locks[0])
+        near_cache.lock(locks[3], "a")
+
+        assert list(near_cache._cache) == [locks[2], locks[0], locks[3]]
+
+    def test__unlock_forgets_lock(self, near_cache):
+        lock = random_hash()
+        near_cache.lock(lock, "a")
+        near_cache.unlock(lock, task_id="a")
+
+        assert near_cache.lock_or_get(lock, "b") is None
+        near_cache.backend.unlock.assert_called_once_with(lock, task_id="a")
+
+    def test__set_pending__lock_read_through(self, near_cache):
+        lock = random_hash()
+        near_cache.lock(lock, "a")
+        near_cache.backend.unlock(lock)
+        near_cache.set_pending(lock, "call")
+
+        assert near_cache.get(lock) is None
+        near_cache.backend.get.assert_called_once_with(lock)
+
+    def test__lock_many_and_get_many(self, near_cache):
+        locks = [random_hash() for i in range(3)]
+        near_cache.lock(locks[0], "a")
+
+        assert near_cache.lock_many(locks[:2], ["b", "c"]) == ["a", None]
+        near_cache.backend.lock_many.assert_called_once_with([locks[1]], ["c"], None)
+        assert near_cache.get_many(locks) == ["a", "c", None]
+        near_cache.backend.get_many.assert_called_once_with([locks[2]])
+
+    def test__invalidate(self, near_cache):
+        locks = [random_hash() for i in range(3)]
+        for lock in locks:
+            near_cache.lock(lock, "a")
+
+        near_cache._on_invalidate([locks[0].encode()])
+        assert list(near_cache._cache) == locks[1:]
+        near_cache._on_invalidate(None)
+        assert not near_cache._cache
+
+    def test__listen_invalidates_all_when_connection_lost(self, near_cache):
+        locks = [random_hash() for i in range(2)]
+        for lock in locks:
+            near_cache.lock(lock, "a")
+        listener = mock.Mock()
+        listener.read_response.side_effect = [
+            [b"message", b"__redis__:invalidate", [locks[0].encode()]],
+            ConnectionError(),
+        ]
+        near_cache._tracker_pid = 1
+
+        near_cache._listen(listener)
+        assert not near_cache._cache
+        assert near_cache._tracker_pid is None
+
+    def test__tracking_failure_falls_back_to_ttl(self, redis_url):
+        # fakeredis doesn't support CLIENT TRACKING
+        b = NearCacheBackend(redis_url, tracking=True)
+        lock = random_hash()
+        try:
+            assert b.lock_or_get(lock, "a") is None
+            assert b.lock_or_get(lock, "b") == "a"
+        finally:
+            b.unlock(lock)
+
+    def test__reset(self, near_cache):
+        near_cache.lock(random_hash(), "a")
+        near_cache.reset()
+        assert not near_cache._cache
+
 
 class FakeBackend:
     def __init__(self, *args, **kwargs):
@@ -106,15 +1221,20 @@ class FakeBackend:
 
 @pytest.fixture(scope="function")
 def fake_config():
+    class FakeApp:
+        pass
+
     class FakeConfig:
+        app = FakeApp()
         backend_url = "redis://localhost"
         backend_kwargs = {}
         backend_class = FakeBackend
+        backend_use_broker_pool = False
 
     try:
         yield FakeConfig()
     finally:
-        backends._backend = None
+        backends.clear_backend_cache()
 
 
 class TestGetBackend:
@@ -144,3 +1264,44 @@ class TestGetBackend:
         backend2 = get_backend(fake_config)
 
         assert backend is backend2
+
+    def test__separate_instance_per_app(self, fake_config):
+        other_config = type(fake_config)()
+        other_config.app = type(fake_config.app)()
+
+        assert get_backend(fake_config) is not get_backend(other_config)
+
+    def test__separate_instance_per_url(self, fake_config):
+        backend = get_backend(fake_config)
+        fake_config.backend_url = "other backend url"
+
+        assert get_backend(fake_config) is not backend
+
+    def test__reset_after_fork(self, fake_config):
+        fake_config.backend_class = InMemoryBackend
+        backend = get_backend(fake_config)
+        with mock.patch.object(InMemoryBackend, "reset") as reset:
+            backends._reset_after_fork()
+        reset.assert_called_once_with()
+        assert get_backend(fake_config) is backend
+
+    def test__broker_pool(self, redis_url):
+        app = Celery(broker=redis_url)
+        app.conf.singleton_backend_use_broker_pool = True
+        backend = get_backend(Config(app))
+        try:
+            with app.producer_or_acquire() as producer:
+                assert backend.redis.connection_pool is producer.channel.pool
+            lock = random_hash()
+            assert backend.lock_or_get(lock, "a") is None
+            assert backend.lock_or_get(lock, "b") == "a"
+            assert backend.get_many([lock]) == ["a"]
+            backend.unlock(lock)
+        finally:
+            backends.clear_backend_cache()
+
+    def test__broker_pool_requires_redis(self):
+        app = Celery(broker="memory://")
+        app.conf.singleton_backend_use_broker_pool = True
+        with pytest.raises(ValueError):
+            get_backend(Config(app))
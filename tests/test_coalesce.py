@@ -0,0 +1,39 @@
+import time
+
+from celery_singleton.coalesce import Coalescer
+
+
+class TestCoalescer:
+    def test__get__within_window(self):
+        coalescer = Coalescer()
+        coalescer.add("backend", "lock", "task", 10)
+
+        assert coalescer.get("backend", "lock") == "task"
+        assert coalescer.get("other backend", "lock") is None
+
+    def test__get__expired(self):
+        coalescer = Coalescer()
+        coalescer.add("backend", "lock", "task", 0.05)
+        time.sleep(0.1)
+
+        assert coalescer.get("backend", "lock") is None
+        assert not coalescer._entries
+
+    def test__least_recently_used_dropped(self):
+        coalescer = Coalescer(max_size=2)
+        coalescer.add("backend", "a", "task", 10)
+        coalescer.add("backend", "b", "task", 10)
+        coalescer.get("backend", "a")
+        coalescer.add("backend", "c", "task", 10)
+
+        assert coalescer.get("backend", "b") is None
+        assert coalescer.get("backend", "a") == "task"
+        assert coalescer.get("backend", "c") == "task"
+
+    def test__discard(self):
+        coalescer = Coalescer()
+        coalescer.add("backend", "lock", "task", 10)
+        coalescer.discard("backend", "lock")
+        coalescer.discard("backend", "other lock")
+
+        assert coalescer.get("backend", "lock") is None
@@ -3,6 +3,7 @@ import sys
 
 from celery_singleton.config import Config
 from celery_singleton.backends.redis import RedisBackend
+from celery_singleton import util
 
 
 class TestBackendUrl:
@@ -81,3 +82,58 @@ class TestTaskExpiry:
     def test__default_is_none(self, celery_app):
         config = Config(celery_app)
         assert config.lock_expiry is None
+
+
+class TestSnapshot:
+    def test__is_read_only(self, celery_app):
+        config = Config(celery_app)
+        with pytest.raises(AttributeError):
+            config.key_prefix = "OTHER_PREFIX"
+
+    def test__no_instance_dict(self, celery_app):
+        config = Config(celery_app)
+        assert not hasattr(config, "__dict__")
+
+    def test__app_config_changes__ignored_until_refresh(self, celery_app):
+        config = Config(celery_app)
+        celery_app.conf["singleton_key_prefix"] = "CHANGED_PREFIX"
+
+        assert config.key_prefix == "SINGLETONLOCK_"
+        config.refresh()
+        assert config.key_prefix == "CHANGED_PREFIX"
+
+    @pytest.mark.celery(singleton_backend_class="singleton_backends.fake.FakeBackend")
+    def test__backend_class__imported_once(self, celery_app, monkeypatch):
+        with monkeypatch.context() as monkey:
+            monkey.setitem(sys.modules, "singleton_backends.fake", FakeBackendModule)
+            config = Config(celery_app)
+            monkey.delitem(sys.modules, "singleton_backends.fake")
+
+            assert config.backend_class == FakeBackendModule.FakeBackend
+
+    @pytest.mark.celery(singleton_backend_kwargs={"a": 1})
+    def test__backend_kwargs__read_only(self, celery_app):
+        config = Config(celery_app)
+        with pytest.raises(TypeError):
+            config.backend_kwargs["a"] = 2
+        assert dict(config.backend_kwargs) == {"a": 1}
+
+
+class TestKeyHashing:
+    def test__defaults__md5_and_json(self, celery_app):
+        config = Config(celery_app)
+        assert config.key_digest is util.DIGESTS["md5"]
+        assert config.key_encoder is util.ENCODERS["json"]
+
+    @pytest.mark.celery(singleton_key_digest="blake2b", singleton_key_encoder="json")
+    def test__configured_by_name(self, celery_app):
+        config = Config(celery_app)
+        assert config.key_digest is util.DIGESTS["blake2b"]
+        assert config.key_encoder is util.encode_json
+
+    def test__key_layout__default_flat(self, celery_app):
+        assert Config(celery_app).key_layout is util.layout_flat
+
+    @pytest.mark.celery(singleton_key_layout="hash_tag")
+    def test__key_layout__configured_by_name(self, celery_app):
+        assert Config(celery_app).key_layout is util.layout_hash_tag
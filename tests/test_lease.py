@@ -0,0 +1,61 @@
+import time
+from unittest import mock
+
+from celery_singleton.backends.memory import InMemoryBackend
+from celery_singleton.lease import LeaseKeeper
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class TestLeaseKeeper:
+    def test__renews_lock_while_started(self):
+        backend = InMemoryBackend()
+        backend.lock("lock", "task", expiry=0.3)
+        keeper = LeaseKeeper()
+
+        keeper.start(backend, "lock", "task", 0.3)
+        time.sleep(0.8)
+
+        assert backend.get("lock") == "task"
+        keeper.stop("lock", "task")
+        time.sleep(0.4)
+        assert backend.get("lock") is None
+
+    def test__lost_lock__lease_dropped(self):
+        backend = InMemoryBackend()
+        backend.lock("lock", "other")
+        keeper = LeaseKeeper()
+
+        keeper.start(backend, "lock", "task", 0.15)
+
+        wait_for(lambda: not keeper._leases)
+        assert backend.get("lock") == "other"
+
+    def test__backend_error__keeps_renewing(self):
+        backend = mock.Mock()
+        backend.extend.side_effect = [ConnectionError(), True, True, True, True]
+        keeper = LeaseKeeper()
+
+        keeper.start(backend, "lock", "task", 0.15)
+
+        wait_for(lambda: backend.extend.call_count >= 3)
+        keeper.stop_all()
+        backend.extend.assert_called_with("lock", "task", 0.15)
+
+    def test__thread_exits_without_leases(self):
+        backend = InMemoryBackend()
+        backend.lock("lock", "task")
+        keeper = LeaseKeeper()
+
+        keeper.start(backend, "lock", "task", 10)
+        thread = keeper._thread
+        keeper.stop_all()
+
+        thread.join(1)
+        assert not thread.is_alive()
+        assert keeper._thread is None
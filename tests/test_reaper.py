@@ -0,0 +1,130 @@
+import pytest
+from unittest import mock
+
+from celery import Celery, states
+from celery_singleton import reaper
+from celery_singleton import reap_locks
+from celery_singleton.backends import get_backend
+from celery_singleton.config import Config
+
+
+@pytest.fixture(scope="session")
+def celery_config(redis_url):
+    return {
+        "broker_url": redis_url,
+        "result_backend": redis_url,
+        "singleton_key_prefix": "reaper_prefix:",
+    }
+
+
+@pytest.fixture
+def backend(celery_app):
+    backend = get_backend(Config(celery_app))
+    try:
+        yield backend
+    finally:
+        backend.redis.flushall()
+
+
+class TestReapLocks:
+    @pytest.fixture
+    def locks(self, celery_app, backend):
+        task_states = {
+            "finished": states.SUCCESS,
+            "failed": states.FAILURE,
+            "running": states.STARTED,
+            "lost": states.STARTED,
+            "reserved": states.STARTED,
+            "scheduled": states.RETRY,
+        }
+        for task_id, state in task_states.items():
+            celery_app.backend.store_result(task_id, None, state)
+            backend.lock("reaper_prefix:" + task_id, task_id)
+        backend.lock("reaper_prefix:pending-task", "pending")
+        backend.set_pending("reaper_prefix:finished", "call")
+        return backend
+
+    def reap(self, app, replies, **kwargs):
+        inspect = mock.Mock()
+        for method in ("active", "reserved", "scheduled"):
+            getattr(inspect, method).return_value = replies and replies.get(method)
+        with mock.patch.object(app.control, "inspect", return_value=inspect):
+            return reap_locks(app, **kwargs)
+
+    def remaining(self, backend):
+        return sorted(
+            task_id
+            for batch in backend.iter_locks("reaper_prefix:")
+            for lock, task_id in batch
+            if not lock.endswith(":pending")
+        )
+
+    def test__orphaned_locks_removed(self, celery_app, locks):
+        replies = {
+            "active": {"worker1": [{"id": "running"}]},
+            "reserved": {"worker2": [{"id": "reserved"}]},
+            "scheduled": {"worker1": [{"request": {"id": "scheduled"}}]},
+        }
+
+        assert self.reap(celery_app, replies) == 3
+
+        assert self.remaining(locks) == ["pending", "reserved", "running", "scheduled"]
+        assert locks.pop_pending("reaper_prefix:finished") == "call"
+
+    def test__started_marks_skipped(self, celery_app, locks):
+        for task_id in ("finished", "running"):
+            locks.mark_started("reaper_prefix:" + task_id, task_id)
+        replies = {
+            "active": {"worker1": [{"id": "running"}]},
+            "reserved": {"worker2": [{"id": "reserved"}]},
+            "scheduled": {"worker1": [{"request": {"id": "scheduled"}}]},
+        }
+
+        assert self.reap(celery_app, replies) == 3
+
+        assert self.remaining(locks) == [
+            "finished",
+            "pending",
+            "reserved",
+            "running",
+            "running",
+            "scheduled",
+        ]
+
+    def test__no_worker_replies__started_tasks_kept(self, celery_app, locks):
+        assert self.reap(celery_app, None) == 2
+
+        assert self.remaining(locks) == [
+            "lost",
+            "pending",
+            "reserved",
+            "running",
+            "scheduled",
+        ]
+
+    def test__lock_aquired_meanwhile__kept_and_not_counted(self, celery_app, locks):
+        task_states = reaper._task_states
+
+        def relock(app, task_ids):
+            # Another task takes the finished task's lock after the lookup
+            locks.unlock("reaper_prefix:finished")
+            locks.lock("reaper_prefix:finished", "newer")
+            return task_states(app, task_ids)
+
+        with mock.patch.object(reaper, "_task_states", side_effect=relock):
+            assert self.reap(celery_app, None) == 1
+
+        assert "newer" in self.remaining(locks)
+
+    def test__no_result_backend__raises(self):
+        app = Celery("no_results", broker="memory://")
+
+        with pytest.raises(ValueError):
+            reap_locks(app)
+
+    def test__batches__rate_limited(self, celery_app, locks):
+        with mock.patch("celery_singleton.reaper.time.sleep") as sleep:
+            self.reap(celery_app, None, batch_size=1, interval=0.5)
+
+        assert sleep.call_count >= 1
+        sleep.assert_called_with(0.5)
@@ -1,8 +1,10 @@
+import asyncio
 import pytest
 from unittest import mock
 import time
 from contextlib import contextmanager
 
+import inspect
 import json
 import random
 import uuid
@@ -10,9 +12,20 @@ from celery import Celery
 from celery import Task as BaseTask
 from celery_singleton.singleton import Singleton, clear_locks
 from celery_singleton import util, DuplicateTaskError
+from celery_singleton.exceptions import InvalidUniqueOnError
 from celery_singleton.backends.redis import RedisBackend
+from celery_singleton.backends.memory import InMemoryBackend
+from celery_singleton import backends
 from celery_singleton.backends import get_backend
 from celery_singleton.config import Config
+from celery_singleton.request import SingletonRequest
+from celery_singleton.coalesce import coalescer
+from billiard.einfo import ExceptionInfo
+from celery import signals
+from celery.app.task import Context
+from celery.contrib.testing.mocks import TaskMessage
+from celery.exceptions import Ignore, TimeLimitExceeded, WorkerLostError
+from celery.worker import state as worker_state
 
 
 @pytest.fixture(scope="session")
@@ -43,6 +56,18 @@ class ExpectedTaskFail(Exception):
     pass
 
 
+def lock_kwargs(task):
+    config = task.singleton_config
+    return {
+        "key_prefix": config.key_prefix,
+        "json_encoder_class": config.json_encoder_class,
+        "digest": config.key_digest,
+        "encoder": config.key_encoder,
+        "streaming": task._key_streaming,
+        "layout": config.key_layout,
+    }
+
+
 class TestSimpleTask:
     def test__queue_duplicates__same_id(self, scoped_app):
         with scoped_app as app:
@@ -118,6 +143,20 @@ class TestSimpleTask:
 
             assert task_id == "test_task_id"
 
+    @mock.patch.object(RedisBackend, "get", autospec=True)
+    def test__queue_duplicate__single_backend_call(self, mock_get, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            task1 = simple_task.apply_async(args=[1, 2, 3])
+            task2 = simple_task.apply_async(args=[1, 2, 3])
+
+            assert task1 == task2
+            mock_get.assert_not_called()
+
     @mock.patch.object(
         BaseTask, "apply_async", side_effect=Exception("Apply async error")
     )
@@ -162,6 +201,241 @@ class TestSimpleTask:
             assert exinfo.value.task_id == t1.task_id
 
 
+class TestApplyAsyncMany:
+    def test__uniques__all_queued(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            tasks = simple_task.apply_async_many(([i], {}) for i in range(5))
+
+            assert len(set(tasks)) == 5
+            for i, task in enumerate(tasks):
+                lock = simple_task.generate_lock(simple_task.name, task_args=[i])
+                assert simple_task.get_existing_task_id(lock) == task.task_id
+
+    def test__duplicates__same_id_in_order(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            existing = simple_task.apply_async(args=[2])
+            tasks = simple_task.apply_async_many([([1], {}), ([2], {}), ([1], None)])
+
+            assert tasks[0] == tasks[2]
+            assert tasks[1] == existing
+            assert tasks[0] != existing
+
+    @mock.patch.object(RedisBackend, "lock_or_get", autospec=True)
+    def test__single_backend_call(self, mock_lock_or_get, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(
+                RedisBackend,
+                "lock_many",
+                autospec=True,
+                side_effect=RedisBackend.lock_many,
+            ) as mock_lock_many:
+                simple_task.apply_async_many(([i], {}) for i in range(5))
+
+            assert mock_lock_many.call_count == 1
+            mock_lock_or_get.assert_not_called()
+
+    @mock.patch.object(
+        BaseTask, "apply_async", side_effect=ExpectedTaskFail("Apply async error")
+    )
+    def test__apply_async_fails__locks_cleared(self, mock_base, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with pytest.raises(ExpectedTaskFail):
+                simple_task.apply_async_many(([i], {}) for i in range(3))
+
+            for i in range(3):
+                lock = simple_task.generate_lock(simple_task.name, task_args=[i])
+                assert simple_task.get_existing_task_id(lock) is None
+
+
+class TestApplyAsyncSingleton:
+    @pytest.fixture(autouse=True)
+    def reset_async_backend(self):
+        try:
+            yield
+        finally:
+            backends.clear_backend_cache()
+
+    def run(self, task, *calls):
+        async def run_all():
+            try:
+                return [await task.apply_async_singleton(**call) for call in calls]
+            finally:
+                await task.singleton_async_backend.redis.aclose()
+
+        return asyncio.run(run_all())
+
+    def test__queue_duplicates__same_id(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            tasks = self.run(simple_task, *[dict(args=[1, 2, 3])] * 5)
+            sync_task = simple_task.apply_async(args=[1, 2, 3])
+
+            assert set(tasks) == set([sync_task])
+
+    def test__queue_uniques__different_ids(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            tasks = self.run(simple_task, *[dict(args=[i]) for i in range(5)])
+
+            assert len(set(tasks)) == 5
+
+    def test__raise_on_duplicate(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, raise_on_duplicate=True)
+            def simple_task(*args):
+                return args
+
+            t1 = simple_task.delay(1, 2, 3)
+            with pytest.raises(DuplicateTaskError) as exinfo:
+                self.run(simple_task, dict(args=[1, 2, 3]))
+            assert exinfo.value.task_id == t1.task_id
+
+    def test__max_concurrency(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=2)
+            def limited_task(*args):
+                return args
+
+            tasks = self.run(limited_task, *[dict(args=[1])] * 3)
+
+            assert tasks[0] != tasks[1]
+            assert tasks[2] in tasks[:2]
+            lock = limited_task.generate_lock(limited_task.name, [1])
+            holders = limited_task.singleton_backend.redis.zrange(lock, 0, -1)
+            assert sorted(holders) == sorted([tasks[0].id, tasks[1].id])
+
+    def test__replace__queued_duplicate_replaced(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="replace", unique_on=["key"])
+            def replaced_task(key, value):
+                return value
+
+            task1 = replaced_task.delay("a", 1)
+            with mock.patch.object(app.control, "revoke") as revoke:
+                (task2,) = self.run(replaced_task, dict(args=["a", 2]))
+
+            assert task1 != task2
+            revoke.assert_called_once_with(task1.id)
+            lock = replaced_task.generate_lock(replaced_task.name, ["a", 2])
+            assert replaced_task.get_existing_task_id(lock) == task2.id
+
+    def test__debounce__latest_call_pending(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="debounce", unique_on=["key"])
+            def debounced_task(key, value):
+                return value
+
+            tasks = self.run(debounced_task, *[dict(args=["a", i]) for i in range(3)])
+            lock = debounced_task.generate_lock(debounced_task.name, ["a", 0])
+
+            assert set(tasks) == {tasks[0]}
+            with mock.patch.object(debounced_task, "apply_async") as apply_async:
+                debounced_task.run_pending(lock)
+            apply_async.assert_called_once_with(args=["a", 2], kwargs={})
+
+    def test__debounce__released_meanwhile__queued_right_away(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="debounce")
+            def debounced_task(*args):
+                return args
+
+            lock = debounced_task.generate_lock(debounced_task.name, [1])
+
+            async def defer():
+                try:
+                    await debounced_task.defer_async(lock, [1], {})
+                finally:
+                    await debounced_task.singleton_async_backend.redis.aclose()
+
+            asyncio.run(defer())
+
+            assert debounced_task.get_existing_task_id(lock) is not None
+            assert debounced_task.singleton_backend.pop_pending(lock) is None
+
+    @mock.patch.object(
+        BaseTask, "apply_async", side_effect=ExpectedTaskFail("Apply async error")
+    )
+    def test__apply_async_fails__lock_cleared(self, mock_base, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with pytest.raises(ExpectedTaskFail):
+                self.run(simple_task, dict(args=[1, 2, 3]))
+
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1, 2, 3])
+            assert simple_task.get_existing_task_id(lock) is None
+
+
+class TestInMemoryBackend:
+    @pytest.fixture
+    def memory_app(self, celery_config):
+        app = Celery()
+        app.config_from_object(
+            dict(
+                celery_config,
+                singleton_backend_class="celery_singleton.backends.InMemoryBackend",
+            )
+        )
+        backends.clear_backend_cache()
+        try:
+            yield app
+        finally:
+            backends.clear_backend_cache()
+
+    def test__queue_duplicates__same_id(self, memory_app):
+        @memory_app.task(base=Singleton)
+        def simple_task(*args):
+            return args
+
+        def apply_async(*args, task_id=None, **kwargs):
+            return simple_task.AsyncResult(task_id)
+
+        with mock.patch.object(BaseTask, "apply_async", side_effect=apply_async):
+            tasks = [simple_task.apply_async(args=[1, 2, 3]) for i in range(5)]
+            unique = simple_task.apply_async(args=[4])
+
+        assert isinstance(simple_task.singleton_backend, InMemoryBackend)
+        assert set(tasks) == set([tasks[0]])
+        assert unique != tasks[0]
+        assert clear_locks(memory_app) == 2
+
+
 class TestClearLocks:
     def test__clear_locks(self, scoped_app):
         with scoped_app as app:
@@ -171,13 +445,42 @@ class TestClearLocks:
                 return args
 
             [simple_task.apply_async(args=[i]) for i in range(5)]
-            clear_locks(app)
+            assert clear_locks(app) == 5
 
             backend = simple_task.singleton_backend
             config = simple_task.singleton_config
 
             assert not backend.redis.keys(config.key_prefix + "*")
 
+    @pytest.mark.parametrize("layout", ["task", "hash_tag"])
+    def test__clear_locks__of_one_task(self, scoped_app, layout):
+        with scoped_app as app:
+            app.conf.singleton_key_layout = layout
+
+            @app.task(base=Singleton, shared=False)
+            def task_one(*args):
+                return args
+
+            @app.task(base=Singleton, shared=False)
+            def task_two(*args):
+                return args
+
+            [task_one.apply_async(args=[i]) for i in range(3)]
+            [task_two.apply_async(args=[i]) for i in range(2)]
+
+            assert clear_locks(app, task=task_one) == 3
+            assert clear_locks(app, task=task_two.name) == 2
+
+    def test__clear_locks__of_one_task__flat_layout(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with pytest.raises(ValueError):
+                clear_locks(app, task=simple_task)
+
 
 class TestUniqueOn:
     @mock.patch.object(
@@ -201,11 +504,10 @@ class TestUniqueOn:
             expected_args = [
                 [
                     (unique_on_args_task.name, [], {"a": 2, "c": 4}),
-                    {"key_prefix": unique_on_args_task.singleton_config.key_prefix,
-                     "json_encoder_class": unique_on_args_task.singleton_config.json_encoder_class},
+                    lock_kwargs(unique_on_args_task),
                 ]
-            ] * 2
-            assert mock_gen.call_count == 2
+            ]
+            assert mock_gen.call_count == 1
             assert [list(a) for a in mock_gen.call_args_list] == expected_args
 
     @mock.patch.object(
@@ -230,11 +532,10 @@ class TestUniqueOn:
             expected_args = [
                 [
                     (unique_on_kwargs_task.name, [], {"b": 3, "d": 5}),
-                    {"key_prefix": unique_on_kwargs_task.singleton_config.key_prefix,
-                     "json_encoder_class": unique_on_kwargs_task.singleton_config.json_encoder_class},
+                    lock_kwargs(unique_on_kwargs_task),
                 ]
-            ] * 2
-            assert mock_gen.call_count == 2
+            ]
+            assert mock_gen.call_count == 1
             assert [list(a) for a in mock_gen.call_args_list] == expected_args
 
     @mock.patch.object(
@@ -259,11 +560,10 @@ class TestUniqueOn:
             expected_args = [
                 [
                     (unique_on_empty_task.name, [], {}),
-                    {"key_prefix": unique_on_empty_task.singleton_config.key_prefix,
-                     "json_encoder_class": unique_on_empty_task.singleton_config.json_encoder_class},
+                    lock_kwargs(unique_on_empty_task),
                 ]
-            ] * 2
-            assert mock_gen.call_count == 2
+            ]
+            assert mock_gen.call_count == 1
             assert [list(a) for a in mock_gen.call_args_list] == expected_args
 
     @mock.patch.object(
@@ -288,11 +588,10 @@ class TestUniqueOn:
             expected_args = [
                 [
                     (unique_on_string_task.name, [], {"c": 4}),
-                    {"key_prefix": unique_on_string_task.singleton_config.key_prefix,
-                     "json_encoder_class": unique_on_string_task.singleton_config.json_encoder_class},
+                    lock_kwargs(unique_on_string_task),
                 ]
-            ] * 2
-            assert mock_gen.call_count == 2
+            ]
+            assert mock_gen.call_count == 1
             assert [list(a) for a in mock_gen.call_args_list] == expected_args
 
     @mock.patch.object(
@@ -317,14 +616,169 @@ class TestUniqueOn:
             expected_args = [
                 [
                     (unique_on_default_task.name, [], {"d": 4}),
-                    {"key_prefix": unique_on_default_task.singleton_config.key_prefix,
-                     "json_encoder_class": unique_on_default_task.singleton_config.json_encoder_class},
+                    lock_kwargs(unique_on_default_task),
                 ]
-            ] * 2
-            assert mock_gen.call_count == 2
+            ]
+            assert mock_gen.call_count == 1
             assert [list(a) for a in mock_gen.call_args_list] == expected_args
 
 
+class TestUniqueOnExtractor:
+    def test__signature_not_inspected_per_call(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, unique_on=["a"])
+            def unique_on_task(a, b):
+                return a * b
+
+            unique_on_task.name  # Evaluate the lazy task
+            with mock.patch.object(inspect, "signature") as mock_signature:
+                lock1 = unique_on_task.generate_lock(unique_on_task.name, [1, 2])
+                lock2 = unique_on_task.generate_lock(
+                    unique_on_task.name, task_kwargs={"a": 1, "b": 3}
+                )
+
+            mock_signature.assert_not_called()
+            assert lock1 == lock2
+
+    def test__bound_task__self_not_in_signature(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(bind=True, base=Singleton, unique_on=["a"])
+            def bound_task(self, a, b):
+                return a * b
+
+            lock1 = bound_task.generate_lock(bound_task.name, [1, 2])
+            lock2 = bound_task.generate_lock(bound_task.name, [1, 3])
+            lock3 = bound_task.generate_lock(bound_task.name, [2, 2])
+
+            assert lock1 == lock2
+            assert lock1 != lock3
+
+    def test__var_args_and_keyword_only(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, unique_on=["args", "c", "kwargs"])
+            def var_task(a, *args, c=3, **kwargs):
+                return a
+
+            extract = type(var_task._get_current_object())._unique_on_extractor
+
+            assert extract([1, 2, 3], {"c": 4, "d": 5}) == {
+                "args": (2, 3),
+                "c": 4,
+                "kwargs": {"d": 5},
+            }
+            assert extract([1], {}) == {"args": (), "c": 3, "kwargs": {}}
+
+    def test__missing_required_argument__raises_type_error(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, unique_on=["a"])
+            def unique_on_task(a, b=2):
+                return a * b
+
+            with pytest.raises(TypeError):
+                unique_on_task.generate_lock(unique_on_task.name, task_kwargs={"b": 1})
+
+    def test__invalid_name__raises_on_registration(self, scoped_app):
+        with scoped_app as app:
+            with pytest.raises(InvalidUniqueOnError):
+
+                @app.task(
+                    base=Singleton, unique_on=["a", "nope"], shared=False, lazy=False
+                )
+                def invalid_unique_on_task(a, b):
+                    return a * b
+
+
+class TestKeyStreaming:
+    @mock.patch.object(
+        util, "generate_lock", autospec=True, side_effect=util.generate_lock
+    )
+    def test__task_cfg_overrides_app_cfg(self, mock_gen, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, key_streaming=True)
+            def large_args_task(*args):
+                return args
+
+            large_args_task.delay(list(range(1000)))
+
+            assert mock_gen.call_args[1]["streaming"] is True
+
+    @mock.patch.object(
+        util, "generate_lock", autospec=True, side_effect=util.generate_lock
+    )
+    def test__app_cfg_used_when_task_cfg_unset(self, mock_gen, scoped_app):
+        with scoped_app as app:
+            app.conf["singleton_key_streaming"] = True
+
+            @app.task(base=Singleton)
+            def large_args_task(*args):
+                return args
+
+            large_args_task.delay(list(range(1000)))
+
+            assert mock_gen.call_args[1]["streaming"] is True
+
+
+class TestRequestLock:
+    def test__lock_sent_in_headers(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(BaseTask, "apply_async") as mock_apply:
+                simple_task.apply_async(args=[1, 2, 3], headers={"other": "header"})
+
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1, 2, 3])
+            assert mock_apply.call_args[1]["headers"] == {
+                "other": "header",
+                "singleton_lock": lock,
+            }
+
+    def test__header__released_without_generating_lock(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            result = simple_task.apply_async(args=[1, 2, 3])
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1, 2, 3])
+
+            simple_task.push_request(id=result.task_id, singleton_lock=lock)
+            try:
+                with mock.patch.object(simple_task, "generate_lock") as mock_gen:
+                    simple_task.on_success(None, result.task_id, [1, 2, 3], {})
+            finally:
+                simple_task.pop_request()
+
+            mock_gen.assert_not_called()
+            assert simple_task.get_existing_task_id(lock) is None
+
+    def test__no_header__lock_generated_from_args(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            result = simple_task.apply_async(args=[1, 2, 3])
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1, 2, 3])
+
+            simple_task.push_request(id=result.task_id)
+            try:
+                simple_task.on_failure(None, result.task_id, [1, 2, 3], {}, None)
+            finally:
+                simple_task.pop_request()
+
+            assert simple_task.get_existing_task_id(lock) is None
+
+
 class TestRaiseOnDuplicateConfig:
     def test__default_false(self, scoped_app):
         with scoped_app as app:
@@ -362,7 +816,7 @@ class TestRaiseOnDuplicateConfig:
 
 
 class TestLockExpiry:
-    @mock.patch.object(RedisBackend, "lock", return_value=True, autospec=True)
+    @mock.patch.object(RedisBackend, "lock_or_get", return_value=None, autospec=True)
     def test__lock_expiry__sent_to_backend(self, mock_lock, scoped_app):
         with scoped_app as app:
 
@@ -379,37 +833,776 @@ class TestLockExpiry:
             )
 
 
-class MyJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, uuid.UUID):
-            return str(obj)
-        return obj
+class TestOwnerCheckedUnlock:
+    def test__expired_task__keeps_newer_lock(self, scoped_app):
+        with scoped_app as app:
 
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
 
-@pytest.mark.parametrize(
-    "singleton_json_encoder_class",
-    [(MyJSONEncoder), ("tests.test_singleton.MyJSONEncoder")],
-    ids=["class", "path"],
-)
-class TestCustomJSONEncoder:
-    @pytest.fixture(scope="function")
-    def celery_config(self, celery_config, singleton_json_encoder_class):
-        celery_config = dict(
-            celery_config, singleton_json_encoder_class=singleton_json_encoder_class
-        )
-        yield celery_config
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1])
+            simple_task.singleton_backend.lock(lock, "newer-task")
 
-    def test__queue_fails_with_non_string_value(self, scoped_app):
+            simple_task.on_success(None, "expired-task", [1], {})
+            assert simple_task.get_existing_task_id(lock) == "newer-task"
+
+            simple_task.on_failure(None, "newer-task", [1], {}, None)
+            assert simple_task.get_existing_task_id(lock) is None
+
+    def test__release_lock__checks_request_id(self, scoped_app):
         with scoped_app as app:
-            app.conf["singleton_json_encoder_class"] = None
 
             @app.task(base=Singleton)
             def simple_task(*args):
                 return args
 
-            args = [uuid.uuid4(), uuid.uuid4(), uuid.uuid4()]
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1])
+            simple_task.singleton_backend.lock(lock, "newer-task")
 
-            with pytest.raises(
+            simple_task.push_request(id="expired-task")
+            try:
+                simple_task.release_lock(task_args=[1])
+            finally:
+                simple_task.pop_request()
+            assert simple_task.get_existing_task_id(lock) == "newer-task"
+
+            simple_task.release_lock(task_args=[1])
+            assert simple_task.get_existing_task_id(lock) is None
+
+
+class TestPromptRelease:
+    @pytest.fixture
+    def locked_task(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, shared=False)
+            def simple_task(*args):
+                return args
+
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1])
+            simple_task.singleton_backend.lock(lock, "task-id")
+            yield simple_task, lock
+
+    def test__revoked__lock_released(self, locked_task):
+        task, lock = locked_task
+
+        signals.task_revoked.send(
+            sender=task, request=Context(id="task-id", args=[1], kwargs={})
+        )
+
+        assert task.get_existing_task_id(lock) is None
+
+    def test__revoked__lock_from_header(self, locked_task):
+        task, lock = locked_task
+
+        signals.task_revoked.send(
+            sender=task,
+            request=Context(id="task-id", singleton_lock=lock, args=None, kwargs=None),
+        )
+
+        assert task.get_existing_task_id(lock) is None
+
+    def test__rejected__lock_released(self, locked_task):
+        task, lock = locked_task
+        message = TaskMessage(task.name, "task-id", args=[1], singleton_lock=lock)
+
+        signals.task_rejected.send(
+            sender=mock.Mock(app=task.app), message=message, exc=None
+        )
+
+        assert task.get_existing_task_id(lock) is None
+
+    def test__unknown__released_through_app_backend(self, locked_task):
+        task, lock = locked_task
+        message = TaskMessage("unknown.task", "task-id", singleton_lock=lock)
+
+        signals.task_unknown.send(
+            sender=mock.Mock(app=task.app),
+            message=message,
+            exc=None,
+            name="unknown.task",
+            id="task-id",
+        )
+
+        assert task.get_existing_task_id(lock) is None
+
+    def test__message_of_other_task__lock_kept(self, locked_task):
+        task, lock = locked_task
+        message = TaskMessage(task.name, "other-id", singleton_lock=lock)
+
+        signals.task_rejected.send(
+            sender=mock.Mock(app=task.app), message=message, exc=None
+        )
+
+        assert task.get_existing_task_id(lock) == "task-id"
+
+    @pytest.mark.parametrize(
+        "exc,acks_late,reject_on_worker_lost,released",
+        [
+            (WorkerLostError(), False, False, True),
+            (WorkerLostError(), True, True, False),
+            (TimeLimitExceeded(10), False, False, True),
+            (TimeLimitExceeded(10), True, False, True),
+        ],
+    )
+    def test__request_failure__lock_released_unless_requeued(
+        self, locked_task, exc, acks_late, reject_on_worker_lost, released
+    ):
+        task, lock = locked_task
+        task.acks_late = acks_late
+        task.reject_on_worker_lost = reject_on_worker_lost
+        task.acks_on_failure_or_timeout = True
+        message = TaskMessage(task.name, "task-id", args=[1], singleton_lock=lock)
+        request = SingletonRequest(message, app=task.app, task=task)
+        try:
+            raise exc
+        except Exception:
+            exc_info = ExceptionInfo()
+
+        request.on_failure(exc_info)
+
+        assert (task.get_existing_task_id(lock) is None) is released
+
+    def test__hard_timeout__lock_released(self, locked_task):
+        task, lock = locked_task
+        message = TaskMessage(task.name, "task-id", args=[1], singleton_lock=lock)
+        request = SingletonRequest(message, app=task.app, task=task)
+
+        request.on_timeout(soft=True, timeout=5)
+        assert task.get_existing_task_id(lock) == "task-id"
+        request.on_timeout(soft=False, timeout=10)
+        assert task.get_existing_task_id(lock) is None
+
+    def test__worker_shutdown__active_requests_released(self, locked_task):
+        task, lock = locked_task
+        message = TaskMessage(task.name, "task-id", args=[1], singleton_lock=lock)
+        request = SingletonRequest(message, app=task.app, task=task)
+
+        with mock.patch.object(worker_state, "active_requests", {request}):
+            signals.worker_shutdown.send(sender=None)
+
+        assert task.get_existing_task_id(lock) is None
+
+
+class TestTwoPhaseExpiry:
+    @mock.patch.object(RedisBackend, "lock_or_get", return_value=None, autospec=True)
+    def test__queue_expiry__sent_to_backend(self, mock_lock, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, lock_expiry=60, queue_expiry=300)
+            def simple_task(*args):
+                return args
+
+            result = simple_task.delay(1)
+
+            lock = simple_task.generate_lock(simple_task.name, task_args=[1])
+            mock_lock.assert_called_once_with(
+                simple_task.singleton_backend, lock, result.task_id, expiry=300
+            )
+
+    def test__run_expiry__set_while_running(self, scoped_app, celery_worker):
+        with scoped_app:
+
+            @celery_worker.app.task(
+                base=Singleton, bind=True, queue_expiry=600, run_expiry=5
+            )
+            def two_phase_task(self, *args):
+                return self.singleton_backend.redis.pttl(self.get_request_lock(args))
+
+            celery_worker.reload()
+
+            assert 0 < two_phase_task.delay(1).get(timeout=5) <= 5000
+
+    @pytest.mark.parametrize(
+        "options,timelimit,expected",
+        [
+            ({"run_expiry": 10, "time_limit": 20}, None, 10),
+            ({"queue_expiry": 600, "time_limit": 20}, None, 20),
+            ({"queue_expiry": 600, "time_limit": 20}, (30, None), 30),
+            ({"queue_expiry": 600, "lock_expiry": 40}, None, 40),
+        ],
+    )
+    def test__run_expiry__defaults(self, scoped_app, options, timelimit, expected):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, shared=False, **options)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(RedisBackend, "extend", autospec=True) as extend:
+                simple_task.push_request(
+                    headers={"singleton_lock": "lock"}, timelimit=timelimit
+                )
+                try:
+                    simple_task.rearm_lock("task-id")
+                finally:
+                    simple_task.pop_request()
+
+            extend.assert_called_once_with(
+                simple_task.singleton_backend, "lock", "task-id", expected
+            )
+
+    def test__lock_expiry_only__not_rearmed(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, lock_expiry=60, time_limit=20)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(RedisBackend, "extend", autospec=True) as extend:
+                simple_task.rearm_lock("task-id", [1], {})
+
+            extend.assert_not_called()
+
+
+class TestLease:
+    def test__lock_renewed_while_running(self, scoped_app, celery_worker):
+        with scoped_app:
+
+            @celery_worker.app.task(base=Singleton, bind=True, lease_timeout=0.6)
+            def slow_task(self, *args):
+                lock = self.get_request_lock(args, {})
+                time.sleep(1)
+                return self.singleton_backend.redis.pttl(lock)
+
+            celery_worker.reload()
+
+            ttl = slow_task.delay(1).get(timeout=5)
+            time.sleep(0.05)  # small delay for on_success
+
+            assert 0 < ttl <= 600
+            lock = slow_task.generate_lock(slow_task.name, task_args=[1])
+            assert slow_task.get_existing_task_id(lock) is None
+
+    def test__retry__runs_and_releases_lock(self, scoped_app, celery_worker):
+        calls = []
+        with scoped_app:
+
+            @celery_worker.app.task(base=Singleton, bind=True, lease_timeout=30)
+            def flaky_task(self, *args):
+                calls.append(self.request.id)
+                if len(calls) == 1:
+                    raise self.retry(countdown=0)
+                return args
+
+            celery_worker.reload()
+
+            task = flaky_task.delay(1)
+            assert task.get(timeout=5) == [1]
+            time.sleep(0.05)  # small delay for on_success
+
+            assert calls == [task.id, task.id]
+            lock = flaky_task.generate_lock(flaky_task.name, task_args=[1])
+            assert flaky_task.get_existing_task_id(lock) is None
+
+    def test__retry__lock_expiry_restored(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, lease_timeout=30, lock_expiry=600)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(RedisBackend, "extend", autospec=True) as extend:
+                simple_task.push_request(headers={"singleton_lock": "lock"})
+                try:
+                    simple_task.start_lease("task-id")
+                    simple_task.stop_lease("task-id", state="RETRY")
+                finally:
+                    simple_task.pop_request()
+
+            assert extend.call_args_list == [
+                mock.call(simple_task.singleton_backend, "lock", "task-id", 30),
+                mock.call(simple_task.singleton_backend, "lock", "task-id", 600),
+            ]
+
+    def test__no_lease_timeout__nothing_extended(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(RedisBackend, "extend", autospec=True) as extend:
+                simple_task.start_lease("task-id", [1], {})
+                simple_task.stop_lease("task-id", [1], {}, state="SUCCESS")
+
+            extend.assert_not_called()
+
+
+class TestCoalesce:
+    @pytest.fixture(autouse=True)
+    def clear_coalescer(self):
+        try:
+            yield
+        finally:
+            coalescer.clear()
+
+    def test__burst__one_backend_call(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, coalesce_window=10)
+            def coalesced_task(*args):
+                return args
+
+            with mock.patch.object(
+                RedisBackend, "lock_or_get", autospec=True, return_value=None
+            ) as lock_or_get:
+                with mock.patch.object(coalesced_task, "run_locked") as run_locked:
+                    run_locked.side_effect = lambda lock, task_id=None, **kw: (
+                        coalesced_task.AsyncResult(task_id)
+                    )
+                    tasks = [coalesced_task.apply_async(args=[1]) for i in range(10)]
+
+            assert set(tasks) == {tasks[0]}
+            assert lock_or_get.call_count == 1
+            assert run_locked.call_count == 1
+
+    def test__duplicate_from_backend__coalesced(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, coalesce_window=10)
+            def coalesced_task(*args):
+                return args
+
+            lock = coalesced_task.generate_lock(coalesced_task.name, [1])
+            coalesced_task.aquire_lock(lock, "other-task")
+
+            with mock.patch.object(
+                RedisBackend, "lock_or_get", autospec=True, return_value="other-task"
+            ) as lock_or_get:
+                results = [coalesced_task.apply_async(args=[1]) for i in range(3)]
+
+            assert [r.id for r in results] == ["other-task"] * 3
+            assert lock_or_get.call_count == 1
+
+    def test__window_passed__backend_asked_again(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, coalesce_window=0.05)
+            def coalesced_task(*args):
+                return args
+
+            task1 = coalesced_task.apply_async(args=[1])
+            time.sleep(0.1)
+            with mock.patch.object(
+                RedisBackend, "lock_or_get", autospec=True, return_value=task1.id
+            ) as lock_or_get:
+                task2 = coalesced_task.apply_async(args=[1])
+
+            assert task1 == task2
+            assert lock_or_get.call_count == 1
+
+    def test__unlock__forgotten(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, coalesce_window=10)
+            def coalesced_task(*args):
+                return args
+
+            task1 = coalesced_task.apply_async(args=[1])
+            lock = coalesced_task.generate_lock(coalesced_task.name, [1])
+            coalesced_task.unlock(lock, task1.id)
+            task2 = coalesced_task.apply_async(args=[1])
+
+            assert task1 != task2
+
+    def test__raise_on_duplicate(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, coalesce_window=10, raise_on_duplicate=True)
+            def coalesced_task(*args):
+                return args
+
+            task1 = coalesced_task.apply_async(args=[1])
+            with mock.patch.object(RedisBackend, "lock_or_get") as lock_or_get:
+                with pytest.raises(DuplicateTaskError) as exinfo:
+                    coalesced_task.apply_async(args=[1])
+
+            assert exinfo.value.task_id == task1.id
+            lock_or_get.assert_not_called()
+
+    def test__window_from_config(self, scoped_app):
+        with scoped_app as app:
+            app.conf.singleton_coalesce_window = 10
+
+            @app.task(base=Singleton)
+            def coalesced_task(*args):
+                return args
+
+            try:
+                coalesced_task.singleton_config.refresh()
+                assert coalesced_task._coalesce_window == 10
+            finally:
+                app.conf.singleton_coalesce_window = None
+                coalesced_task.singleton_config.refresh()
+
+    def test__no_window__not_coalesced(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            simple_task.apply_async(args=[1])
+
+            assert not coalescer._entries
+
+
+class TestDebounce:
+    def test__duplicates__latest_call_pending(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="debounce", unique_on=["key"])
+            def debounced_task(key, value):
+                return value
+
+            task1 = debounced_task.delay("a", 1)
+            duplicates = [debounced_task.delay("a", value) for value in (2, 3, 4)]
+            lock = debounced_task.generate_lock(debounced_task.name, ["a", 1])
+
+            assert set(duplicates) == {task1}
+            with mock.patch.object(debounced_task, "apply_async") as apply_async:
+                debounced_task.run_pending(lock)
+            apply_async.assert_called_once_with(args=["a", 4], kwargs={})
+
+            debounced_task.defer(lock, ["a", 5])
+            debounced_task.on_success(None, task1.id, ["a", 1], {})
+
+            assert debounced_task.get_existing_task_id(lock) not in (None, task1.id)
+            assert debounced_task.singleton_backend.pop_pending(lock) is None
+
+    def test__burst__runs_twice(self, scoped_app, celery_worker):
+        calls = []
+        with scoped_app:
+
+            @celery_worker.app.task(base=Singleton, mode="debounce", unique_on=[])
+            def burst_task(value):
+                calls.append(value)
+                time.sleep(0.2)
+
+            celery_worker.reload()
+
+            for value in range(5):
+                burst_task.delay(value)
+            deadline = time.monotonic() + 5
+            while len(calls) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            time.sleep(0.5)
+
+            assert calls == [0, 4]
+
+    def test__no_pending_call__nothing_queued(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="debounce")
+            def debounced_task(*args):
+                return args
+
+            task = debounced_task.delay(1)
+            with mock.patch.object(debounced_task, "apply_async") as apply_async:
+                debounced_task.on_success(None, task.id, [1], {})
+
+            apply_async.assert_not_called()
+
+    def test__released_meanwhile__queued_right_away(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="debounce")
+            def debounced_task(*args):
+                return args
+
+            lock = debounced_task.generate_lock(debounced_task.name, [1])
+            debounced_task.defer(lock, [1], {})
+
+            assert debounced_task.get_existing_task_id(lock) is not None
+            assert debounced_task.singleton_backend.pop_pending(lock) is None
+
+    def test__drop_mode__nothing_stored(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(RedisBackend, "set_pending") as set_pending:
+                simple_task.delay(1)
+                simple_task.delay(1)
+
+            set_pending.assert_not_called()
+
+    def test__unknown_mode(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="bogus")
+            def simple_task(*args):
+                return args
+
+            with pytest.raises(ValueError):
+                simple_task._mode
+
+
+class TestReplaceMode:
+    def test__queued_duplicate__replaced(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="replace", unique_on=["key"])
+            def replaced_task(key, value):
+                return value
+
+            task1 = replaced_task.delay("a", 1)
+            with mock.patch.object(app.control, "revoke") as revoke:
+                task2 = replaced_task.delay("a", 2)
+
+            assert task1 != task2
+            revoke.assert_called_once_with(task1.id)
+            lock = replaced_task.generate_lock(replaced_task.name, ["a", 2])
+            assert replaced_task.get_existing_task_id(lock) == task2.id
+
+    def test__started_duplicate__not_replaced(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="replace", unique_on=["key"])
+            def replaced_task(key, value):
+                return value
+
+            task1 = replaced_task.delay("a", 1)
+            assert replaced_task.mark_started(task1.id, ["a", 1], {}) is True
+            with mock.patch.object(app.control, "revoke") as revoke:
+                task2 = replaced_task.delay("a", 2)
+
+            assert task1 == task2
+            revoke.assert_not_called()
+
+    def test__publish_fails__not_revoked(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="replace", unique_on=["key"])
+            def replaced_task(key, value):
+                return value
+
+            task1 = replaced_task.delay("a", 1)
+            with mock.patch.object(app.control, "revoke") as revoke:
+                with mock.patch.object(
+                    BaseTask, "apply_async", side_effect=ExpectedTaskFail()
+                ):
+                    with pytest.raises(ExpectedTaskFail):
+                        replaced_task.delay("a", 2)
+
+            revoke.assert_not_called()
+            assert replaced_task.mark_started(task1.id, ["a", 1], {}) is True
+
+    def test__replaced_task__ignored_on_start(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="replace")
+            def replaced_task(*args):
+                return args
+
+            replaced_task.delay(1)
+            with pytest.raises(Ignore):
+                replaced_task.before_start("replaced-task-id", [1], {})
+
+    def test__finished__started_mark_removed(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, mode="replace")
+            def replaced_task(*args):
+                return args
+
+            task = replaced_task.delay(1)
+            lock = replaced_task.generate_lock(replaced_task.name, [1])
+            replaced_task.mark_started(task.id, [1], {})
+            replaced_task.on_success(None, task.id, [1], {})
+
+            assert replaced_task.singleton_backend.redis.get(lock + ":started") is None
+
+    def test__worker__only_newest_runs(self, scoped_app, celery_worker):
+        calls = []
+        with scoped_app:
+
+            @celery_worker.app.task(base=Singleton)
+            def blocking_task():
+                time.sleep(0.5)
+
+            @celery_worker.app.task(base=Singleton, mode="replace", unique_on=[])
+            def newest_task(value):
+                calls.append(value)
+
+            celery_worker.reload()
+
+            blocking_task.delay()
+            time.sleep(0.1)
+            results = [newest_task.delay(value) for value in range(3)]
+            results[-1].get(timeout=5)
+            time.sleep(0.2)
+
+            assert calls == [2]
+
+    def test__drop_mode__not_replaced(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            with mock.patch.object(RedisBackend, "lock_or_replace") as lock_or_replace:
+                simple_task.delay(1)
+                simple_task.delay(1)
+                assert simple_task.before_start("task-id", [1], {}) is None
+
+            lock_or_replace.assert_not_called()
+
+
+class TestMaxConcurrency:
+    def test__duplicates_beyond_limit(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=2)
+            def limited_task(*args):
+                return args
+
+            tasks = [limited_task.delay(1) for i in range(4)]
+
+            assert tasks[0] != tasks[1]
+            assert tasks[2] in tasks[:2]
+            assert tasks[3] in tasks[:2]
+            assert limited_task.delay(2) not in tasks
+
+    def test__raise_on_duplicate(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=1, raise_on_duplicate=True)
+            def limited_task(*args):
+                return args
+
+            task = limited_task.delay(1)
+            with pytest.raises(DuplicateTaskError) as exinfo:
+                limited_task.delay(1)
+
+            assert exinfo.value.task_id == task.id
+
+    def test__finished__slot_released(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=2)
+            def limited_task(*args):
+                return args
+
+            task1, task2 = limited_task.delay(1), limited_task.delay(1)
+            limited_task.on_success(None, task1.id, [1], {})
+            task3 = limited_task.delay(1)
+
+            assert task3 not in (task1, task2)
+            lock = limited_task.generate_lock(limited_task.name, [1])
+            holders = limited_task.singleton_backend.redis.zrange(lock, 0, -1)
+            assert sorted(holders) == sorted([task2.id, task3.id])
+
+    def test__apply_async_many(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=2)
+            def limited_task(*args):
+                return args
+
+            results = limited_task.apply_async_many([([1], {})] * 3)
+
+            assert len({result.id for result in results}) == 2
+
+    def test__slot_expiry(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=2, lock_expiry=60)
+            def limited_task(*args):
+                return args
+
+            limited_task.delay(1)
+            lock = limited_task.generate_lock(limited_task.name, [1])
+
+            assert 0 < limited_task.singleton_backend.redis.ttl(lock) <= 60
+
+    def test__debounce__released_meanwhile__queued_in_slot(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=1, mode="debounce")
+            def limited_task(*args):
+                return args
+
+            task = limited_task.delay(1)
+            lock = limited_task.generate_lock(limited_task.name, [1])
+            limited_task.singleton_backend.release_slot(lock, task_id=task.id)
+            limited_task.defer(lock, [1], {})
+
+            holders = limited_task.singleton_backend.redis.zrange(lock, 0, -1)
+            assert len(holders) == 1 and holders[0] != task.id
+            assert limited_task.singleton_backend.pop_pending(lock) is None
+
+    def test__invalid_limit(self, scoped_app):
+        with scoped_app as app:
+            with pytest.raises(ValueError):
+
+                @app.task(base=Singleton, max_concurrency=0, shared=False)
+                def limited_task(*args):
+                    return args
+
+                limited_task.name
+
+    def test__replace_mode__not_supported(self, scoped_app):
+        with scoped_app as app:
+
+            @app.task(base=Singleton, max_concurrency=2, mode="replace")
+            def limited_task(*args):
+                return args
+
+            with pytest.raises(ValueError):
+                limited_task.delay(1)
+
+    def test__worker__runs_and_releases(self, scoped_app, celery_worker):
+        with scoped_app:
+
+            @celery_worker.app.task(base=Singleton, max_concurrency=2)
+            def limited_worker_task(*args):
+                return args
+
+            celery_worker.reload()
+
+            assert limited_worker_task.delay(1).get(timeout=5) == [1]
+            time.sleep(0.05)  # small delay for on_success
+            lock = limited_worker_task.generate_lock(limited_worker_task.name, [1])
+            assert not limited_worker_task.singleton_backend.redis.exists(lock)
+
+
+class MyJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        return obj
+
+
+@pytest.mark.parametrize(
+    "singleton_json_encoder_class",
+    [(MyJSONEncoder), ("tests.test_singleton.MyJSONEncoder")],
+    ids=["class", "path"],
+)
+class TestCustomJSONEncoder:
+    @pytest.fixture(scope="function")
+    def celery_config(self, celery_config, singleton_json_encoder_class):
+        celery_config = dict(
+            celery_config, singleton_json_encoder_class=singleton_json_encoder_class
+        )
+        yield celery_config
+
+    def test__queue_fails_with_non_string_value(self, scoped_app):
+        with scoped_app as app:
+            app.conf["singleton_json_encoder_class"] = None
+
+            @app.task(base=Singleton)
+            def simple_task(*args):
+                return args
+
+            args = [uuid.uuid4(), uuid.uuid4(), uuid.uuid4()]
+
+            with pytest.raises(
                 TypeError, match=r"Object of type '?UUID'? is not JSON serializable"
             ):
                 [simple_task.apply_async(args=args) for i in range(10)]
@@ -443,6 +1636,23 @@ class TestCustomJSONEncoder:
             ]
             assert set(tasks) == set([tasks[0]])
 
+    def test__debounce__pending_call_pickled(self, scoped_app):
+        with scoped_app as app:
+            app.conf.accept_content = ["json", "pickle"]
+
+            @app.task(base=Singleton, mode="debounce", serializer="pickle")
+            def debounced_task(*args):
+                return args
+
+            args = [uuid.uuid4()]
+            task1 = debounced_task.delay(*args)
+            assert debounced_task.delay(*args) == task1
+
+            with mock.patch.object(debounced_task, "apply_async") as apply_async:
+                debounced_task.on_success(None, task1.id, args, {})
+
+            apply_async.assert_called_once_with(args=args, kwargs={})
+
     def test__queue_multiple_uniques__different_ids(self, scoped_app):
         with scoped_app as app:
 
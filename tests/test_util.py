@@ -0,0 +1,174 @@
+import json
+import pytest
+import tracemalloc
+import uuid
+from hashlib import md5
+from unittest import mock
+
+from celery_singleton import util
+
+
+def legacy_lock(task_name, task_args, task_kwargs, key_prefix="SINGLETONLOCK_"):
+    str_args = json.dumps(task_args, sort_keys=True)
+    str_kwargs = json.dumps(task_kwargs, sort_keys=True)
+    return key_prefix + md5((task_name + str_args + str_kwargs).encode()).hexdigest()
+
+
+ARGUMENTS = [
+    ("simple_task", [1, 2, 3], {}),
+    ("simple_task", [], {"b": [1, {"z": 1, "a": 2}], "a": "x"}),
+    ("tâsk", ["ünïcode", 1.5, None, True], {"ключ": "значение"}),
+]
+
+
+class TestGenerateLock:
+    @pytest.mark.parametrize("task_name,task_args,task_kwargs", ARGUMENTS)
+    def test__defaults__same_as_legacy_md5_keys(
+        self, task_name, task_args, task_kwargs
+    ):
+        lock = util.generate_lock(task_name, task_args, task_kwargs)
+        assert lock == legacy_lock(task_name, task_args, task_kwargs)
+
+    @pytest.mark.parametrize("digest", sorted(util.DIGESTS))
+    @pytest.mark.parametrize("encoder", sorted(util.ENCODERS))
+    def test__digest_and_encoder__key_order_independent(self, digest, encoder):
+        lock1 = util.generate_lock(
+            "task", [1], {"a": 1, "b": {"c": 2, "d": 3}}, digest=digest, encoder=encoder
+        )
+        lock2 = util.generate_lock(
+            "task", [1], {"b": {"d": 3, "c": 2}, "a": 1}, digest=digest, encoder=encoder
+        )
+        lock3 = util.generate_lock(
+            "task", [2], {"a": 1, "b": {"c": 2, "d": 3}}, digest=digest, encoder=encoder
+        )
+
+        assert lock1 == lock2
+        assert lock1 != lock3
+        assert lock1.startswith("SINGLETONLOCK_")
+
+    def test__blake2b__differs_from_md5(self):
+        lock = util.generate_lock("task", [1], digest="blake2b")
+        assert lock != util.generate_lock("task", [1])
+        assert len(lock) == len(util.generate_lock("task", [1]))
+
+    def test__callable_digest_and_encoder(self):
+        encoder = mock.Mock(side_effect=util.encode_json)
+
+        lock = util.generate_lock("task", [1], digest=md5, encoder=encoder)
+
+        assert lock == util.generate_lock("task", [1])
+        assert encoder.call_count == 2
+
+    @pytest.mark.skipif("orjson" not in util.ENCODERS, reason="orjson not installed")
+    def test__orjson__json_encoder_class_used_as_default(self):
+        class UUIDEncoder(json.JSONEncoder):
+            def default(self, obj):
+                if isinstance(obj, uuid.UUID):
+                    return str(obj)
+                return super().default(obj)
+
+        value = uuid.uuid4()
+        lock1 = util.generate_lock(
+            "task", [value], encoder="orjson", json_encoder_class=UUIDEncoder
+        )
+        lock2 = util.generate_lock("task", [str(value)], encoder="orjson")
+
+        assert lock1 == lock2
+
+
+class TestKeyLayout:
+    def test__flat__prefix_and_hash(self):
+        lock = util.generate_lock("task", [1], layout="flat")
+        assert lock == util.generate_lock("task", [1])
+
+    def test__hash_tag__task_name_in_braces(self):
+        lock = util.generate_lock("my.task", [1], layout="hash_tag")
+        hexdigest = util.generate_lock("my.task", [1], key_prefix="")
+        assert lock == "SINGLETONLOCK_{my.task}:" + hexdigest
+
+    def test__task__task_name_prefix(self):
+        lock = util.generate_lock("my.task", [1], layout="task")
+        hexdigest = util.generate_lock("my.task", [1], key_prefix="")
+        assert lock == "SINGLETONLOCK_my.task:" + hexdigest
+        assert lock.startswith(
+            util.task_key_prefix("task", "SINGLETONLOCK_", "my.task")
+        )
+
+    def test__task_key_prefix__flat__value_error(self):
+        with pytest.raises(ValueError):
+            util.task_key_prefix("flat", "SINGLETONLOCK_", "my.task")
+
+    def test__callable_layout(self):
+        lock = util.generate_lock(
+            "task", [1], layout=lambda prefix, name, hexdigest: name + hexdigest
+        )
+        assert lock == "task" + util.generate_lock("task", [1], key_prefix="")
+
+    def test__unknown_layout__value_error(self):
+        with pytest.raises(ValueError):
+            util.get_key_layout("nope")
+
+
+class TestLookup:
+    def test__unknown_digest__value_error(self):
+        with pytest.raises(ValueError):
+            util.get_digest("nope")
+
+    def test__unknown_encoder__value_error(self):
+        with pytest.raises(ValueError):
+            util.get_encoder("nope")
+
+    def test__missing_optional_dependency__import_error(self, monkeypatch):
+        monkeypatch.delitem(util.DIGESTS, "xxhash", raising=False)
+        with pytest.raises(ImportError):
+            util.get_digest("xxhash")
+
+
+class TestStreaming:
+    @pytest.mark.parametrize("task_name,task_args,task_kwargs", ARGUMENTS)
+    def test__same_key_as_one_shot(self, task_name, task_args, task_kwargs):
+        lock = util.generate_lock(task_name, task_args, task_kwargs, streaming=True)
+        assert lock == legacy_lock(task_name, task_args, task_kwargs)
+
+    def test__large_arguments__same_key_as_one_shot(self):
+        task_args = [list(range(50000))]
+        task_kwargs = {"nested": {"key{}".format(i): [i, str(i)] for i in range(5000)}}
+
+        lock = util.generate_lock("task", task_args, task_kwargs, streaming=True)
+
+        assert lock == legacy_lock("task", task_args, task_kwargs)
+
+    def test__large_arguments__bounded_memory(self):
+        task_args = [list(range(500000))]
+
+        def peak(streaming):
+            tracemalloc.start()
+            try:
+                util.generate_lock("task", task_args, streaming=streaming)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        assert peak(streaming=True) * 4 < peak(streaming=False)
+
+    def test__custom_json_encoder_class(self):
+        class UUIDEncoder(json.JSONEncoder):
+            def default(self, obj):
+                if isinstance(obj, uuid.UUID):
+                    return str(obj)
+                return super().default(obj)
+
+        value = uuid.uuid4()
+        lock = util.generate_lock(
+            "task", [value], json_encoder_class=UUIDEncoder, streaming=True
+        )
+
+        assert lock == legacy_lock("task", [str(value)], {})
+
+    def test__encoder_without_streaming__falls_back_to_one_shot(self):
+        encoder = mock.Mock(side_effect=util.encode_json)
+
+        lock = util.generate_lock("task", [1], encoder=encoder, streaming=True)
+
+        assert lock == legacy_lock("task", [1], {})
+        assert encoder.call_count == 2